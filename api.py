@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""api.py
+
+Generator-based library API
+
+Parses a BMEcat file into the objects of classes.py without writing RDF:
+
+    import api
+    supplier = api.get_supplier("catalog.xml")
+    for group in api.iter_catalog_groups("catalog.xml"):
+        print group.id, group.parent_id
+    for offer in api.iter_offers("catalog.xml"):
+        print offer.id, offer.cataloggroup_ids
+
+The input may be anything Parser.parse() takes: a path, plain or compressed,
+"-" for stdin or a file-like object. The parser is fed block by block only
+while the caller asks for the next object, so the caller applies
+backpressure and memory stays constant besides the article to catalog group
+mappings. These are collected in a first pass over the input to resolve the
+catalog group ids of the offers, or, for stdin and file-like objects that
+can only be read once, offers are spilled to a temporary file until the
+mappings are known.
+
+Where the serializer writes documents, a Collector keeps the objects the
+parser stores until they are taken from the stream.
+"""
+import collections
+
+import parser
+import classes
+
+class Collector:
+    """Consumer of a parser in place of the serializer, keeps the stored objects until they are taken"""
+    def __init__(self, catalog, model_only=False):
+        """Initialization, catalog receives the settings of the catalog header"""
+        self.catalog = catalog
+        self.model_only = model_only # skip offering details
+        self.output_folder = "" # temporary files go to the default location
+        self.items = collections.deque() # (object type, object)
+
+    def store(self, object, object_type):
+        """Keep a parsed object"""
+        self.items.append((object_type, object))
+
+    def take(self, object_type):
+        """Remove all kept objects, yield those of object_type"""
+        while self.items:
+            stored_type, object = self.items.popleft()
+            if stored_type == object_type:
+                yield object
+
+def createParser(catalog=None, engine="expat", mapping="memory", model_only=False):
+    """Parser storing into a Collector"""
+    bmecat_parser = parser.Parser(Collector(catalog or classes.Catalog(), model_only), engine, mapping)
+    bmecat_parser.verbose = False
+    return bmecat_parser
+
+def iterate(bmecat_parser, xml_file, search, object_type):
+    """Objects of object_type the parser stores while parsing xml_file for search"""
+    for step in bmecat_parser.feed(xml_file, search):
+        for object in bmecat_parser.serializer.take(object_type):
+            yield object
+        del bmecat_parser.catalog_hierarchy[:] # groups are handed out one by one, not kept
+
+def rereadable(xml_file):
+    """True if xml_file can be parsed more than once"""
+    return xml_file != "-" and not hasattr(xml_file, "read")
+
+def iter_offers(xml_file, catalog=None, engine="expat", mapping="memory", model_only=False):
+    """Yield the Offer of every article with its catalog group ids resolved
+
+    catalog receives the settings of the catalog header, mapping is "memory" or "sqlite", see parser.Parser"""
+    bmecat_parser = createParser(catalog, engine, mapping, model_only)
+    try:
+        if rereadable(xml_file):
+            for group in iterate(bmecat_parser, xml_file, "cataloggroup", None): # mappings only
+                pass
+            search = "offer"
+        else:
+            search = "all"
+        for offer in iterate(bmecat_parser, xml_file, search, "offer"):
+            yield offer
+    finally:
+        bmecat_parser.close()
+
+def iter_catalog_groups(xml_file, catalog=None, engine="expat"):
+    """Yield the CatalogGroup of every catalog structure in document order"""
+    bmecat_parser = createParser(catalog, engine)
+    try:
+        for group in iterate(bmecat_parser, xml_file, "cataloggroup", "cataloggroup"):
+            yield group
+    finally:
+        bmecat_parser.close()
+
+def get_supplier(xml_file, catalog=None, engine="expat"):
+    """Return the BusinessEntity of the supplier, None if there is none, stops parsing once it is found"""
+    bmecat_parser = createParser(catalog, engine)
+    try:
+        for be in iterate(bmecat_parser, xml_file, "be", "be"):
+            return be
+        return None
+    finally:
+        bmecat_parser.close()
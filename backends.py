@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""backends.py
+
+XML parser backends
+
+Every backend reads a BMEcat file and reports it to an event handler with the
+interface of Parser.EventHandler, i.e. startElement(name, attrs),
+characters(text) and endElement(name), in document order. attrs is a mapping
+or, from the expat backend, a flat [name, value, ...] list.
+parse() reads a whole stream, feeder() returns the functions feed(data) and
+close() to parse the input block by block as the caller provides it.
+
+sax      xml.sax with a Python ContentHandler (original implementation)
+expat    pyexpat directly, with buffered character data and attribute lists
+lxml     lxml iterparse on record elements (articles, catalog groups, ...),
+         records are replayed and cleared as soon as they are complete
+"""
+import xml.sax
+import xml.parsers.expat
+
+engines = ["expat", "sax", "lxml"] # first one is the default
+
+class SAXBackend:
+    """xml.sax.make_parser() with the handler as ContentHandler"""
+    def create(self, handler):
+        """SAX parser reporting to handler"""
+        parser = xml.sax.make_parser()
+        parser.setFeature("http://xml.org/sax/features/external-general-entities", False)
+        parser.setContentHandler(handler)
+        return parser
+
+    def parse(self, stream, handler):
+        """Parse stream and report to handler"""
+        self.create(handler).parse(stream)
+
+    def feeder(self, handler):
+        """Return feed(data) and close() parsing the input block by block and reporting to handler"""
+        parser = self.create(handler)
+        return parser.feed, parser.close
+
+class ExpatBackend:
+    """pyexpat without the SAX layer"""
+    def __init__(self, buffer_size=1<<16):
+        """Initialization"""
+        self.buffer_size = buffer_size # max. size of buffered character data
+
+    def create(self, handler):
+        """pyexpat parser reporting to handler"""
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True # one characters() call per text node instead of per line
+        parser.buffer_size = self.buffer_size
+        parser.ordered_attributes = True
+        parser.SetParamEntityParsing(xml.parsers.expat.XML_PARAM_ENTITY_PARSING_NEVER)
+        parser.StartElementHandler = handler.startElement
+        parser.EndElementHandler = handler.endElement
+        parser.CharacterDataHandler = handler.characters
+        return parser
+
+    def parse(self, stream, handler):
+        """Parse stream and report to handler"""
+        self.create(handler).ParseFile(stream)
+
+    def feeder(self, handler):
+        """Return feed(data) and close() parsing the input block by block and reporting to handler"""
+        parser = self.create(handler)
+        return (lambda data: parser.Parse(data, False)), (lambda: parser.Parse("", True))
+
+class LXMLBackend:
+    """lxml iterparse, keeps only the current record in memory"""
+    # elements that are replayed to the handler and cleared as soon as they are complete
+    records = ["HEADER", "CATALOG_STRUCTURE", "ARTICLE", "PRODUCT", "ARTICLE_TO_CATALOGGROUP_MAP", "PRODUCT_TO_CATALOGGROUP_MAP"]
+
+    def __init__(self):
+        """Initialization"""
+        from lxml import etree
+        self.etree = etree
+        self.handler = None
+        self.open = [] # started but not yet ended elements above the current record
+        self.last = [] # per open element, its last replayed child
+
+    def parse(self, stream, handler):
+        """Parse stream and report to handler"""
+        self.handler = handler
+        self.open = []
+        self.last = []
+        context = self.etree.iterparse(stream, events=("end",), tag=["{*}"+name for name in self.records],
+                                       resolve_entities=False, huge_tree=True)
+        for event, element in context:
+            self.record(element)
+        self.finish(context.root)
+
+    def feeder(self, handler):
+        """Return feed(data) and close() parsing the input block by block and reporting to handler"""
+        self.handler = handler
+        self.open = []
+        self.last = []
+        parser = self.etree.XMLPullParser(events=("end",), tag=["{*}"+name for name in self.records],
+                                          resolve_entities=False, huge_tree=True)
+        def feed(data):
+            parser.feed(data)
+            for event, element in parser.read_events():
+                self.record(element)
+        def close():
+            root = parser.close()
+            for event, element in parser.read_events():
+                self.record(element)
+            self.finish(root)
+        return feed, close
+
+    def finish(self, root):
+        """End the elements that are still open after the last record"""
+        if not self.open: # no records at all
+            self.start(root)
+        while self.open:
+            self.end()
+        self.handler = None
+
+    def name(self, element):
+        """Element name without namespace"""
+        tag = element.tag
+        if tag[0] == "{":
+            return tag[tag.index("}")+1:]
+        return tag
+
+    def start(self, element):
+        """Report an element to be open"""
+        self.handler.startElement(self.name(element), element.attrib)
+        if element.text:
+            self.handler.characters(element.text)
+        self.open.append(element)
+        self.last.append(None)
+
+    def end(self):
+        """Replay the remaining children of the innermost open element and end it"""
+        element = self.open[-1]
+        self.advance(None)
+        self.handler.endElement(self.name(element))
+        self.open.pop()
+        self.last.pop()
+        if self.last:
+            self.last[-1] = element
+
+    def advance(self, stop):
+        """Replay the children of the innermost open element up to stop, None for all"""
+        last = self.last[-1]
+        if last is None:
+            child = None
+            if len(self.open[-1]):
+                child = self.open[-1][0]
+        else:
+            if last.tail:
+                self.handler.characters(last.tail)
+            child = last.getnext()
+        while child is not None and child is not stop:
+            self.replay(child)
+            if child.tail:
+                self.handler.characters(child.tail)
+            child = child.getnext()
+        self.last[-1] = None
+
+    def replay(self, element):
+        """Report a complete element and its descendants"""
+        if not isinstance(element.tag, basestring): # comment, processing instruction or entity
+            return
+        name = self.name(element)
+        self.handler.startElement(name, element.attrib)
+        if element.text:
+            self.handler.characters(element.text)
+        for child in element:
+            self.replay(child)
+            if child.tail:
+                self.handler.characters(child.tail)
+        self.handler.endElement(name)
+
+    def record(self, element):
+        """Replay a complete record element together with everything in front of it"""
+        ancestors = list(element.iterancestors())
+        ancestors.reverse()
+        common = 0
+        while common < len(self.open) and common < len(ancestors) and self.open[common] is ancestors[common]:
+            common += 1
+        while len(self.open) > common:
+            self.end()
+        for ancestor in ancestors[common:]:
+            if self.open:
+                self.advance(ancestor)
+            self.start(ancestor)
+        self.advance(element)
+        self.replay(element)
+        self.last[-1] = element
+        # free memory, the record is kept as an (empty) anchor for the following siblings, its tail is reported by advance()
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
+
+def create(engine="expat"):
+    """Return a backend instance by name"""
+    if engine == "sax":
+        return SAXBackend()
+    elif engine == "expat":
+        return ExpatBackend()
+    elif engine == "lxml":
+        return LXMLBackend()
+    raise ValueError("Unknown parser engine %s" % engine)
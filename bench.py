@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""bench.py
+
+Benchmarks of the conversion
+
+Generates synthetic BMEcat catalogs, converts them with main.py in a child
+process and reports articles/s, triples/s, peak RSS and the time of every
+parser pass. With --check, each scenario is also converted by a reference
+implementation and a second time with additional options (e.g. another
+engine), and both outputs are compared graph by graph, the dump as well as
+every RDF document. The reference is main.py of another directory or of a git
+revision exported with git archive, by default the first commit of the
+repository, so it shares no code with the tree under test.
+
+Usage: python bench.py [options] [scenario ...] [-- main.py options]
+"""
+import os
+import re
+import sys
+import time
+import gzip
+import runpy
+import random
+import shutil
+import tarfile
+import tempfile
+import subprocess
+from xml.sax.saxutils import escape
+
+try:
+    import resource # peak memory, not available on Windows
+except ImportError:
+    resource = None
+
+# BMEcat 2005 names of the BMEcat 1.2 elements used by the generator
+names2005 = {"ARTICLE":"PRODUCT", "SUPPLIER_AID":"SUPPLIER_PID", "ARTICLE_DETAILS":"PRODUCT_DETAILS",
+             "MANUFACTURER_AID":"MANUFACTURER_PID", "ARTICLE_STATUS":"PRODUCT_STATUS",
+             "ARTICLE_FEATURES":"PRODUCT_FEATURES", "ARTICLE_ORDER_DETAILS":"PRODUCT_ORDER_DETAILS",
+             "ARTICLE_PRICE_DETAILS":"PRODUCT_PRICE_DETAILS", "ARTICLE_PRICE":"PRODUCT_PRICE",
+             "ARTICLE_TO_CATALOGGROUP_MAP":"PRODUCT_TO_CATALOGGROUP_MAP", "ART_ID":"PROD_ID"}
+
+units = ["", "MMT", "CMT", "KGM", "", "C62", "WTT", ""] # "" -> qualitative feature
+words = ["robust", "steel", "handle", "compact", "tool", "precise", "light", "grip", "coated", "screw",
+         "durable", "industrial", "set", "quality", "standard", "Größe", "wooden", "head", "drive", "mm"]
+
+# scenario -> (generator settings, main.py options)
+scenarios = {
+    "cli": ({}, []),
+    "model": ({}, ["-t", "model"]),
+    "catalog": ({"articles":200, "depth":7, "fanout":4}, []),
+    "bmecat2005": ({"version":"2005"}, []),
+}
+
+def generate(path, articles=1000, features=5, depth=3, fanout=4, mime=1.0, version="1.2", description=200, seed=0):
+    """Write a synthetic BMEcat catalog to path
+
+    depth and fanout shape the catalog group tree, mime is the average number of
+    MIME elements per article, description the length of the long descriptions"""
+    rnd = random.Random(seed)
+    if version == "2005":
+        def n(name):
+            return names2005.get(name, name)
+    else:
+        def n(name):
+            return name
+    out = open(path, "wb")
+    out.write("""<?xml version="1.0" encoding="UTF-8"?>
+<BMECAT version="%s">
+<HEADER>
+  <CATALOG><LANGUAGE>deu</LANGUAGE><CATALOG_ID>bench</CATALOG_ID><CURRENCY>EUR</CURRENCY><TERRITORY>DE</TERRITORY><VALID_START_DATE>2011-01-01</VALID_START_DATE></CATALOG>
+  <SUPPLIER><SUPPLIER_ID type="duns">123-456</SUPPLIER_ID><SUPPLIER_NAME>Bench Supplier</SUPPLIER_NAME>
+    <ADDRESS type="supplier"><STREET>Hauptstraße 1</STREET><ZIP>12345</ZIP><CITY>München</CITY><EMAIL>info@example.com</EMAIL><URL>http://www.example.com/</URL></ADDRESS>
+  </SUPPLIER>
+</HEADER>
+<T_NEW_CATALOG>
+  <CATALOG_GROUP_SYSTEM>
+""" % version)
+    # catalog group tree, breadth first
+    leaves = []
+    level = [("1", "0")]
+    for d in range(depth):
+        below = []
+        for group_id, parent_id in level:
+            group_type = "node"
+            if d == 0:
+                group_type = "root"
+            elif d == depth-1:
+                group_type = "leaf"
+                leaves.append(group_id)
+            out.write("    <CATALOG_STRUCTURE type=\"%s\"><GROUP_ID>%s</GROUP_ID><GROUP_NAME>Group %s</GROUP_NAME><GROUP_DESCRIPTION>%s</GROUP_DESCRIPTION><PARENT_ID>%s</PARENT_ID></CATALOG_STRUCTURE>\n"
+                      % (group_type, group_id, group_id, text(rnd, 40), parent_id))
+            if d < depth-1:
+                below.extend([("%s-%d" % (group_id, i), group_id) for i in range(fanout)])
+        level = below
+    if not leaves:
+        leaves = [group_id for group_id, parent_id in level] or ["1"]
+    out.write("  </CATALOG_GROUP_SYSTEM>\n")
+    # articles
+    for a in range(articles):
+        out.write("  <%s mode=\"new\">\n    <%s>A-%d</%s>\n" % (n("ARTICLE"), n("SUPPLIER_AID"), a, n("SUPPLIER_AID")))
+        out.write("    <%s><DESCRIPTION_SHORT>Article %d</DESCRIPTION_SHORT><DESCRIPTION_LONG>%s</DESCRIPTION_LONG><EAN>%013d</EAN>"
+                  "<%s>M-%d</%s><MANUFACTURER_NAME>Manufacturer %d</MANUFACTURER_NAME><%s type=\"new\">new</%s></%s>\n"
+                  % (n("ARTICLE_DETAILS"), a, text(rnd, description), 4000000000000+a, n("MANUFACTURER_AID"), a, n("MANUFACTURER_AID"),
+                     a % 50, n("ARTICLE_STATUS"), n("ARTICLE_STATUS"), n("ARTICLE_DETAILS")))
+        if features > 0:
+            out.write("    <%s><REFERENCE_FEATURE_SYSTEM_NAME>ECLASS-5.1</REFERENCE_FEATURE_SYSTEM_NAME><REFERENCE_FEATURE_GROUP_ID type=\"flat\">%d</REFERENCE_FEATURE_GROUP_ID>"
+                      % (n("ARTICLE_FEATURES"), 21010101+a % 20))
+            for f in range(features):
+                unit = units[f % len(units)]
+                if unit:
+                    out.write("<FEATURE><FNAME>Feature %d</FNAME><FVALUE>%.2f</FVALUE><FUNIT>%s</FUNIT></FEATURE>" % (f, rnd.uniform(0, 100), unit))
+                else:
+                    out.write("<FEATURE><FNAME>Feature %d</FNAME><FVALUE>%s</FVALUE></FEATURE>" % (f, rnd.choice(words)))
+            out.write("</%s>\n" % n("ARTICLE_FEATURES"))
+        out.write("    <%s><ORDER_UNIT>C62</ORDER_UNIT><CONTENT_UNIT>C62</CONTENT_UNIT><NO_CU_PER_OU>1</NO_CU_PER_OU><QUANTITY_MIN>1</QUANTITY_MIN></%s>\n"
+                  % (n("ARTICLE_ORDER_DETAILS"), n("ARTICLE_ORDER_DETAILS")))
+        out.write("    <%s><%s price_type=\"net_list\"><PRICE_AMOUNT>%.2f</PRICE_AMOUNT><PRICE_CURRENCY>EUR</PRICE_CURRENCY><LOWER_BOUND>1</LOWER_BOUND></%s></%s>\n"
+                  % (n("ARTICLE_PRICE_DETAILS"), n("ARTICLE_PRICE"), rnd.uniform(1, 500), n("ARTICLE_PRICE"), n("ARTICLE_PRICE_DETAILS")))
+        count = int(mime)+(rnd.random() < mime-int(mime))
+        if count > 0:
+            out.write("    <MIME_INFO>")
+            for m in range(count):
+                out.write("<MIME><MIME_TYPE>image/jpeg</MIME_TYPE><MIME_SOURCE>a%d_%d.jpg</MIME_SOURCE><MIME_PURPOSE>normal</MIME_PURPOSE></MIME>" % (a, m))
+            out.write("</MIME_INFO>\n")
+        out.write("  </%s>\n" % n("ARTICLE"))
+    # article to catalog group mappings
+    for a in range(articles):
+        out.write("  <%s><%s>A-%d</%s><CATALOG_GROUP_ID>%s</CATALOG_GROUP_ID></%s>\n"
+                  % (n("ARTICLE_TO_CATALOGGROUP_MAP"), n("ART_ID"), a, n("ART_ID"), rnd.choice(leaves), n("ARTICLE_TO_CATALOGGROUP_MAP")))
+    out.write("</T_NEW_CATALOG>\n</BMECAT>\n")
+    out.close()
+
+def text(rnd, length):
+    """Random escaped text of about length characters"""
+    result = []
+    size = 0
+    while size < length:
+        word = rnd.choice(words)
+        result.append(word)
+        size += len(word)+1
+    return escape(" ".join(result))
+
+def peakRSS():
+    """Peak resident set size in KiB of this process and its finished children, None if unknown"""
+    peak = None
+    if os.path.exists("/proc/self/status"): # high-water mark of this process image only
+        for line in open("/proc/self/status"):
+            if line.startswith("VmHWM:"):
+                peak = int(line.split()[1])
+    elif resource != None: # includes the image before exec, i.e. the benchmark itself
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if peak != None and resource != None:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) # e.g. --split workers
+    return peak
+
+def measure(argv):
+    """Run the script argv[0] with arguments argv[1:] in this process, then print its peak RSS"""
+    sys.argv = argv
+    sys.path.insert(0, os.path.dirname(os.path.abspath(argv[0])))
+    runpy.run_path(argv[0], run_name="__main__")
+    sys.stdout.flush()
+    print "peak rss %s KiB" % peakRSS()
+
+def checkout(reference, folder):
+    """Return the directory of the reference implementation, reference is a directory or a git revision exported to folder"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if reference != None and os.path.isdir(reference):
+        if not os.path.exists(os.path.join(reference, "main.py")):
+            raise RuntimeError("no main.py in reference directory %s" % reference)
+        return os.path.abspath(reference)
+    try:
+        if reference == None: # first commit
+            reference = subprocess.check_output(["git", "rev-list", "--max-parents=0", "HEAD"], cwd=here).split()[-1]
+        archive = tempfile.TemporaryFile()
+        subprocess.check_call(["git", "archive", "--format=tar", reference], cwd=here, stdout=archive)
+    except (OSError, subprocess.CalledProcessError), e:
+        raise RuntimeError("could not export %s from git, use --reference <dir>: %s" % (reference and "revision "+reference or "the first commit", e))
+    shutil.rmtree(folder, True)
+    archive.seek(0)
+    tar = tarfile.open(fileobj=archive)
+    tar.extractall(folder)
+    tar.close()
+    archive.close()
+    return folder
+
+def convert(input_file, output_folder, options, program=None):
+    """Run main.py in a child process, return (seconds, peak RSS in KiB or None, {pass:seconds}, output)
+
+    program is main.py of another tree, run in its directory (older trees find their templates relative to it)"""
+    log = tempfile.TemporaryFile()
+    here = os.path.dirname(os.path.abspath(__file__))
+    cwd = None
+    if program != None:
+        cwd = os.path.dirname(program)
+        input_file = os.path.abspath(input_file)
+        output_folder = os.path.abspath(output_folder)
+    command = [sys.executable, os.path.join(here, "bench.py"), "--measure", program or os.path.join(here, "main.py"), input_file, "-o", output_folder]+options
+    now = time.time()
+    returncode = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT, cwd=cwd)
+    seconds = time.time()-now
+    log.seek(0)
+    output = log.read()
+    if returncode != 0:
+        raise RuntimeError("conversion failed:\n"+output)
+    rss = None
+    match = re.search(r"peak rss (\d+) KiB", output)
+    if match:
+        rss = int(match.group(1))
+    phases = {}
+    for search, duration in re.findall(r"finished with (\w+) after ([0-9.]+) seconds", output):
+        phases[search] = phases.get(search, 0)+float(duration)
+    return seconds, rss, phases, output
+
+def countTriples(output_folder):
+    """Number of lines of the dump"""
+    count = 0
+    for line in gzip.open(output_folder+"/dump/dump.nt.gz"):
+        count += 1
+    return count
+
+def documents(output_folder):
+    """document name -> RDF/XML of all documents in the rdf folder, packed or not"""
+    import packs # not before measure(), which may run main.py of another tree
+    folder = output_folder+"/rdf"
+    result = {}
+    for name in os.listdir(folder):
+        if name.endswith(".rdf"):
+            result[name] = open(os.path.join(folder, name), "rb").read()
+        elif name.endswith(".idx"):
+            reader = packs.PackReader(folder, name[:-4])
+            for document_name in reader.names():
+                result[document_name] = reader.get(document_name)
+            reader.close()
+    return result
+
+def isomorphic(reference, candidate):
+    """Compare two output folders graph by graph, return a list of differences"""
+    from rdflib import Graph
+    from rdflib.compare import isomorphic as equal
+    differences = []
+    graphs = []
+    for folder in [reference, candidate]:
+        g = Graph()
+        g.parse(data=gzip.open(folder+"/dump/dump.nt.gz").read(), format="nt")
+        graphs.append(g)
+    if not equal(*graphs):
+        differences.append("dump.nt.gz (%d vs. %d triples)" % (len(graphs[0]), len(graphs[1])))
+    a = documents(reference)
+    b = documents(candidate)
+    for name in sorted(set(a) ^ set(b)):
+        differences.append("%s only in %s" % (name, name in a and reference or candidate))
+    for name in sorted(set(a) & set(b)):
+        if a[name] == b[name]:
+            continue
+        g = Graph()
+        g.parse(data=a[name], format="xml")
+        h = Graph()
+        h.parse(data=b[name], format="xml")
+        if not equal(g, h):
+            differences.append(name)
+    return differences
+
+def report(name, articles, seconds, rss, phases, triples):
+    """Print the measurements of a run"""
+    line = "%-12s %8.2fs %10.0f articles/s %10.0f triples/s" % (name, seconds, articles/seconds, triples/seconds)
+    if rss != None:
+        line += " %8.1f MiB peak" % (rss/1024.0)
+    print line
+    if phases:
+        print "%-12s %s" % ("", "  ".join(["%s %.2fs" % (search, phases[search]) for search in sorted(phases)]))
+
+def main():
+    """Main function"""
+    if sys.argv[1:2] == ["--measure"]: # child process of convert()
+        measure(sys.argv[2:])
+        return
+    settings = {}
+    options = [] # main.py options of every run
+    check = None # main.py options of the candidate run, compared with the reference run
+    reference = None # directory or git revision of the reference implementation, None for the first commit
+    selected = []
+    work = None
+    previous = ""
+    args = sys.argv[1:]
+    if "--" in args:
+        options = args[args.index("--")+1:]
+        args = args[:args.index("--")]
+    for arg in args:
+        if previous in ["--articles", "--features", "--depth", "--fanout", "--description"]:
+            settings[previous[2:]] = int(arg)
+        elif previous == "--mime":
+            settings["mime"] = float(arg)
+        elif previous == "--version":
+            settings["version"] = arg
+        elif previous == "--check":
+            check = arg.split()
+        elif previous == "--work":
+            work = arg
+        elif previous == "--reference":
+            reference = arg
+        elif arg == "--help":
+            print "USAGE"
+            print "\tpython bench.py [options] [scenario ...] [-- main.py options]"
+            print
+            print "SCENARIOS"
+            print "\t%s (default = all)" % ", ".join(sorted(scenarios))
+            print
+            print "OPTIONS"
+            print "\t--articles <n>\t\tarticles per catalog (default = 1000, catalog scenario 200)"
+            print "\t--features <n>\t\tfeatures per article (default = 5)"
+            print "\t--depth <n>\t\tlevels of the catalog group tree (default = 3, catalog scenario 7)"
+            print "\t--fanout <n>\t\tsubgroups per catalog group (default = 4)"
+            print "\t--mime <x>\t\taverage number of MIME elements per article (default = 1.0)"
+            print "\t--description <n>\tcharacters of the long descriptions (default = 200)"
+            print "\t--version <v>\t\tBMEcat naming, 1.2 or 2005 (default = 1.2)"
+            print "\t--check <options>\talso convert with these main.py options and compare the graphs with those of"
+            print "\t\t\t\tthe reference implementation"
+            print "\t--reference <rev|dir>\tgit revision or directory of the reference implementation of --check"
+            print "\t\t\t\t(default = first commit of the repository)"
+            print "\t--work <dir>\t\tkeep catalogs and outputs in dir (default = temporary folder)"
+            return
+        elif arg in scenarios:
+            selected.append(arg)
+        elif arg.startswith("--"):
+            previous = arg
+            continue
+        else:
+            print "WARNING: Could not interpret command series -> %s %s" % (previous, arg)
+        previous = ""
+
+    folder = work or tempfile.mkdtemp()
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    failed = False
+    try:
+        if check != None:
+            program = os.path.join(os.path.abspath(checkout(reference, "%s/reference" % folder)), "main.py")
+        for name in selected or sorted(scenarios):
+            generator_settings, scenario_options = scenarios[name]
+            generator_settings = dict(generator_settings)
+            generator_settings.update(settings)
+            input_file = "%s/%s.xml" % (folder, name)
+            generate(input_file, **generator_settings)
+            articles = generator_settings.get("articles", 1000)
+            output_folder = "%s/%s.out" % (folder, name)
+            shutil.rmtree(output_folder, True)
+            seconds, rss, phases, output = convert(input_file, output_folder, scenario_options+options)
+            report(name, articles, seconds, rss, phases, countTriples(output_folder))
+            if check != None:
+                reference_folder = "%s/%s.reference" % (folder, name)
+                shutil.rmtree(reference_folder, True)
+                seconds, rss, phases, output = convert(input_file, reference_folder, scenario_options+options, program)
+                report("reference", articles, seconds, rss, phases, countTriples(reference_folder))
+                candidate = "%s/%s.check" % (folder, name)
+                shutil.rmtree(candidate, True)
+                seconds, rss, phases, output = convert(input_file, candidate, scenario_options+options+check)
+                report("+"+" ".join(check), articles, seconds, rss, phases, countTriples(candidate))
+                differences = isomorphic(reference_folder, candidate)
+                if differences:
+                    failed = True
+                    print "%-12s DIFFERENT: %s" % ("", ", ".join(differences[:10]))
+                else:
+                    print "%-12s same graphs" % ""
+    finally:
+        if work == None:
+            shutil.rmtree(folder, True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""checkpoint.py
+
+Checkpoints of the offer pass for resuming interrupted conversions
+
+Once the catalog group and supplier passes are done, the state they built
+(catalog settings and hierarchy, article to catalog group mappings) is pickled
+to <output>/.checkpoint/passes. In the offer pass, the serializer is
+checkpointed every interval articles: pending offers are finished and all
+output files are synced at a consistent point (the dumps end a gzip member).
+Their positions, the supplier URI, the feature registry and sitemap state,
+the number of finished articles and the byte offset of the next
+<ARTICLE>/<PRODUCT> are then pickled to <output>/.checkpoint/offers.
+
+A run with --resume truncates the output files to the recorded positions and
+parses the remaining articles as a document of their own (see
+splitter.Layout) instead of starting over. The input file must not change in
+between, which is checked by its size and modification time, and the options
+of both runs have to match.
+"""
+import os
+import time
+import shutil
+import cPickle
+
+import splitter
+import metrics
+
+def save(path, state):
+    """Pickle state to path atomically"""
+    file = open(path+".tmp", "wb")
+    cPickle.dump(state, file, cPickle.HIGHEST_PROTOCOL)
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    os.rename(path+".tmp", path)
+
+def identify(path):
+    """Identification of the input file"""
+    return (os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path))
+
+def load(output_folder, path, options):
+    """Return (passes, offers) state of the last checkpoint of a conversion of path with options, None if there is no usable one"""
+    folder = output_folder+"/.checkpoint"
+    if not os.path.exists(folder+"/passes") or not os.path.exists(folder+"/offers"):
+        return None
+    passes = cPickle.load(open(folder+"/passes", "rb"))
+    if passes["input"] != identify(path):
+        print "WARNING: the input file changed since the checkpoint was written"
+        return None
+    if passes["options"] != options:
+        print "WARNING: the checkpoint was written with other output options"
+        return None
+    return passes, cPickle.load(open(folder+"/offers", "rb"))
+
+def remove(output_folder):
+    """Remove the checkpoints of a finished conversion"""
+    shutil.rmtree(output_folder+"/.checkpoint", True)
+
+class Checkpointer:
+    """Writes checkpoints of the offer pass"""
+    def __init__(self, folder, serializer, layout, interval, articles, offset):
+        """Initialization, offset is the start of the next article after the first articles ones"""
+        self.folder = folder
+        self.serializer = serializer
+        self.layout = layout
+        self.interval = interval
+        self.articles = articles # finished articles
+        self.offset = offset
+        self.counted = articles # articles in front of offset
+
+    def articleDone(self):
+        """Count a finished article, write a checkpoint every interval articles"""
+        self.articles += 1
+        if self.articles % self.interval == 0:
+            self.save()
+
+    def save(self):
+        """Write a checkpoint after the finished articles"""
+        now = time.time()
+        self.offset = self.layout.skip(self.offset, self.articles-self.counted)
+        self.counted = self.articles
+        save(self.folder+"/offers", {"articles":self.articles, "offset":self.offset, "serializer":self.serializer.checkpoint()})
+        metrics.count("checkpoints")
+        metrics.record("checkpoint", time.time()-now)
+
+def convert(bmecat_parser, path, interval, options, state=None):
+    """Parse path in three passes with checkpoints every interval articles, continue after state as returned by load()
+
+    options are the output options of the run, a resumed run must use the same"""
+    output = bmecat_parser.serializer
+    folder = output.output_folder+"/.checkpoint"
+    layout = splitter.Layout(path)
+    if state == None:
+        bmecat_parser.parse(path, search="cataloggroup")
+        bmecat_parser.parse(path, search="be")
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        save(folder+"/passes", {"input":identify(path), "options":options, "interval":interval, "catalog":output.catalog,
+                                "hierarchy":bmecat_parser.catalog_hierarchy, "mapping":bmecat_parser.article2categorygroup})
+        articles, offset = 0, layout.first
+    else:
+        passes, offers = state
+        output.catalog.__dict__.update(passes["catalog"].__dict__) # shared with the parser
+        bmecat_parser.catalog_hierarchy = passes["hierarchy"]
+        bmecat_parser.article2categorygroup.close()
+        bmecat_parser.article2categorygroup = passes["mapping"]
+        articles, offset = offers["articles"], offers["offset"]
+        print "resuming after %d articles" % articles
+    if layout.first == None: # nothing to parse for offers
+        layout.close()
+        return
+    checkpointer = Checkpointer(folder, output, layout, interval, articles, offset)
+    if state == None:
+        checkpointer.save() # before the first article
+    bmecat_parser.checkpointer = checkpointer
+    stream = layout.document(offset, layout.last)
+    bmecat_parser.parse(stream, search="offer")
+    stream.close()
+    bmecat_parser.checkpointer = None
+    layout.close()
@@ -11,6 +11,12 @@ Copyright (c) 2011 Universitaet der Bundeswehr. All rights reserved.
 Author: Alex Stolz
 Organization: E-Business and Web Science Research Group
 """
+import os
+import copy
+import array
+import tempfile
+import sqlite3
+
 class Catalog():
     """Catalog settings"""
     def __init__(self):
@@ -21,9 +27,13 @@ class Catalog():
         self.eligibleRegions = []
         self.typeOfProducts = "placeholder" # default
         
-class CatalogGroup():
+class CatalogGroup(object):
     """Catalog group class"""
+    __slots__ = ("id", "parent_id", "name", "description", "media")
     def __init__(self):
+        self.reset()
+        
+    def reset(self):
         self.id = ""
         self.parent_id = ""
         self.name = ""
@@ -31,25 +41,134 @@ class CatalogGroup():
         self.media = []
         
 class Article2CatalogGroupMap():
-    """Mapping between articles and catalog groups"""
+    """Mapping between articles and catalog groups
+    
+    Catalog group ids are interned as integers. An article with a single group maps
+    to that integer, articles with more groups map to an array of integers."""
     def __init__(self):
-        self.mapping = dict()
+        self.mapping = dict() # article id -> group number or array of group numbers
+        self.group_numbers = dict() # catalog group id -> group number
+        self.group_ids = [] # group number -> catalog group id
         self.article_id = ""
         self.cataloggroup_id = ""
         
+    def intern(self, cataloggroup_id):
+        """Return the number of a catalog group id"""
+        number = self.group_numbers.get(cataloggroup_id)
+        if number == None:
+            number = len(self.group_ids)
+            self.group_numbers[cataloggroup_id] = number
+            self.group_ids.append(cataloggroup_id)
+        return number
+        
+    def save(self):
+        number = self.intern(self.cataloggroup_id)
+        groups = self.mapping.get(self.article_id)
+        if groups == None:
+            self.mapping[self.article_id] = number
+        elif type(groups) == int:
+            self.mapping[self.article_id] = array.array("i", [groups, number])
+        else:
+            groups.append(number)
+        
+    def get(self, article_id):
+        groups = self.mapping.get(article_id)
+        if groups == None:
+            return []
+        elif type(groups) == int:
+            return [self.group_ids[groups]]
+        return [self.group_ids[number] for number in groups]
+    
+    def finish(self):
+        """Called once all mappings are saved"""
+        pass
+    
+    def reader(self):
+        """Mapping to look up articles in another process"""
+        return self
+    
+    def close(self):
+        pass
+
+class SQLiteArticle2CatalogGroupMap(Article2CatalogGroupMap):
+    """Mapping between articles and catalog groups in a temporary SQLite database
+    
+    For catalogs whose mapping sections do not fit into memory, only the catalog
+    group ids are kept in memory."""
+    def __init__(self, folder=None, batch_size=10000):
+        Article2CatalogGroupMap.__init__(self)
+        self.batch_size = batch_size # rows per insert
+        self.pending = [] # rows not yet inserted
+        self.indexed = False
+        self.owner = True # remove the database on close
+        handle, self.path = tempfile.mkstemp(suffix=".sqlite", dir=folder or None)
+        os.close(handle)
+        self.db = sqlite3.connect(self.path)
+        self.db.text_factory = str
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("CREATE TABLE mapping (article TEXT, grp INTEGER)")
+    
+    def flush(self):
+        """Insert pending rows"""
+        self.db.executemany("INSERT INTO mapping VALUES (?, ?)", self.pending)
+        self.pending = []
+        
     def save(self):
-        if not self.article_id in self.mapping.keys():
-            self.mapping[self.article_id] = list()
-        self.mapping[self.article_id].append(self.cataloggroup_id)
+        self.pending.append((self.article_id, self.intern(self.cataloggroup_id)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        
+    def finish(self):
+        """Insert pending rows, index and commit them"""
+        if self.pending:
+            self.flush()
+        if not self.indexed: # index once all mappings are known, faster than updating it on every insert
+            self.db.execute("CREATE INDEX mapping_article ON mapping (article)")
+            self.indexed = True
+        self.db.commit()
+        
+    def reader(self):
+        """Mapping on a connection of its own to the same database, which it does not remove"""
+        self.finish()
+        reader = copy.copy(self)
+        reader.db = sqlite3.connect(self.path)
+        reader.db.text_factory = str
+        reader.owner = False
+        return reader
         
     def get(self, article_id):
-        if article_id in self.mapping.keys():
-            return self.mapping[article_id]
-        return []
+        if self.pending or not self.indexed:
+            self.finish()
+        return [self.group_ids[row[0]] for row in self.db.execute("SELECT grp FROM mapping WHERE article = ? ORDER BY rowid", (article_id,))]
+    
+    def __getstate__(self):
+        """Pickled state, refers to the committed database by its path"""
+        self.finish()
+        state = self.__dict__.copy()
+        del state["db"]
+        return state
+    
+    def __setstate__(self, state):
+        """Reconnect to the database"""
+        self.__dict__.update(state)
+        self.db = sqlite3.connect(self.path)
+        self.db.text_factory = str
+        
+    def close(self):
+        """Remove the database"""
+        self.db.close()
+        if self.owner:
+            os.remove(self.path)
 
-class BusinessEntity():
+class BusinessEntity(object):
     """BusinessEntity class"""
+    __slots__ = ("id", "type", "legalName", "street_address", "postal_code", "postal_box", "location", "region",
+                 "country_name", "tel", "fax", "email", "page", "duns", "gln", "media")
     def __init__(self):
+        self.reset()
+        
+    def reset(self):
         self.id = ""
         self.type = ""
         self.legalName = ""
@@ -68,9 +187,16 @@ class BusinessEntity():
         # media information
         self.media = []
 
-class Offer():
+class Offer(object):
     """Offering class"""
+    __slots__ = ("id", "description", "comment", "content_uom", "content_units", "order_uom", "order_units", "price_lower",
+                 "validFrom", "validThrough", "price", "price_factor", "currency", "product_quantity", "eligibleRegions",
+                 "ean", "gtin", "mpn", "condition", "manufacturer_id", "manufacturer_name", "taxes", "product_features",
+                 "cataloggroup_ids", "media")
     def __init__(self):
+        self.reset()
+        
+    def reset(self):
         self.id = ""
         self.description = ""
         self.comment = ""
@@ -98,9 +224,14 @@ class Offer():
         # media information
         self.media = []
         
-class ProductFeature():
+class ProductFeature(object):
     """Class for product feature systems including product features"""
+    __slots__ = ("reference_feature_system_id", "reference_feature_system_name", "reference_feature_group_name",
+                 "reference_feature_group_id", "reference_feature_group_id2", "features")
     def __init__(self):
+        self.reset()
+        
+    def reset(self):
         self.reference_feature_system_id = "" # sameas system_name!
         self.reference_feature_system_name = ""
         self.reference_feature_group_name = ""
@@ -108,24 +239,33 @@ class ProductFeature():
         self.reference_feature_group_id2 = {"type":None, "value":None} # alternative group id
         self.features = []
 
-class Feature():
+class Feature(object):
     """Class for product features"""
+    __slots__ = ("name", "value", "unit", "fref")
     def __init__(self):
+        self.reset()
+        
+    def reset(self):
         self.name = ""
         self.value = ""
         self.unit = "" # if no unit given, then a qualitativevalueproperty, else quantitativevalueproperty
         self.fref = ""
         
-class Mime():
+class Mime(object):
     """Class for all media files"""
+    __slots__ = ("name", "desc", "type", "source")
     def __init__(self):
+        self.reset()
+        
+    def reset(self):
         self.name = ""
         self.desc = ""
         self.type = ""
         self.source = ""
 
-class Tag(): 
+class Tag(object): 
     """Class carrying tag metadata"""
+    __slots__ = ("stack", "attrs", "content")
     def __init__(self, stack, attrs, content):
         self.stack = stack
         self.attrs = attrs
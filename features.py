@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""features.py
+
+Registry of custom feature properties
+
+Features without a property in a reference ontology get a property
+P_<system>_<feature> in features.rdf. The registry writes the definition of
+each such property once, at its first use, to features.rdf, the dump and the
+sinks of additional dump formats, instead of collecting all definitions in a
+graph until the end of the run.
+
+A definition is the tuple (property uri, feature identifier, system id,
+qualitative), which is all the serializer needs to hand over.
+"""
+import StringIO
+
+import ntriples
+import rdfxml
+from util import sync
+from ntriples import URI, Namespace
+
+owl = "http://www.w3.org/2002/07/owl#"
+gr = "http://purl.org/goodrelations/v1#"
+
+RDF = Namespace(rdfxml.rdf)
+RDFS = Namespace(rdfxml.rdfs)
+OWL = Namespace(owl)
+GR = Namespace(gr)
+
+def propertyTriples(prop_uri, fidentifier, system_id, qualitative, common=True):
+    """Triple tuples defining a feature property, common=False leaves out the ones independent of qualitative"""
+    prop_uri = URI(prop_uri)
+    triples = []
+    if common:
+        triples.append((prop_uri, RDF.type, OWL.ObjectProperty, None, None)) # prop_id for external access
+        triples.append((prop_uri, RDFS.label, "Property %s (%s)" % (fidentifier, system_id), None, "en"))
+        triples.append((prop_uri, RDFS.comment, "\"%s\" property according to \"%s\" classification." % (fidentifier, system_id), None, "en"))
+    if qualitative:
+        triples.append((prop_uri, RDFS.subPropertyOf, GR.qualitativeProductOrServiceProperty, None, None))
+        triples.append((prop_uri, RDFS.range, GR.QualitativeValue, None, None))
+    else:
+        triples.append((prop_uri, RDFS.subPropertyOf, GR.quantitativeProductOrServiceProperty, None, None))
+        triples.append((prop_uri, RDFS.range, GR.QuantitativeValueFloat, None, None))
+    if common:
+        triples.append((prop_uri, RDFS.domain, GR.ProductOrService, None, None))
+    return triples
+
+class FeatureRegistry:
+    """Writes every feature property definition exactly once"""
+    def __init__(self, rdf_file, dump, sinks=[], graph=None, state=None):
+        """Initialization, starts the features.rdf document in rdf_file, dump takes N-Triples
+        
+        sinks are additional dump formats, graph is the URI of features.rdf, state as returned
+        by checkpoint() continues a document that was reopened at its position"""
+        self.rdf_file = rdf_file
+        self.dump = dump
+        self.sinks = sinks
+        self.graph = graph
+        self.seen = set() # (property uri, qualitative) of written definitions
+        self.properties = set() # property uris of written definitions
+        if state == None:
+            self.writer = rdfxml.RDFXMLWriter(rdf_file, [("owl", owl), ("gr", gr)])
+        else: # the header was written before
+            self.writer = rdfxml.RDFXMLWriter(StringIO.StringIO(), [("owl", owl), ("gr", gr)])
+            self.writer.stream = rdf_file
+            self.writer.counter = state["counter"]
+            self.seen = state["seen"]
+            self.properties = state["properties"]
+
+    def define(self, prop_uri, fidentifier, system_id, qualitative):
+        """Write the definition of a feature property unless done before"""
+        key = (prop_uri, qualitative)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        # a property used both with and without unit only gets its second range and super property
+        triples = propertyTriples(prop_uri, fidentifier, system_id, qualitative, prop_uri not in self.properties)
+        self.properties.add(prop_uri)
+        self.writer.write(triples)
+        self.dump.write(ntriples.serialize(triples))
+        for sink in self.sinks:
+            sink.append(sink.render(triples, self.graph))
+
+    def checkpoint(self):
+        """Sync features.rdf, return the state to continue from"""
+        return {"position":sync(self.rdf_file), "counter":self.writer.counter, "seen":set(self.seen), "properties":set(self.properties)}
+
+    def close(self):
+        """Finish and close features.rdf"""
+        self.writer.close()
+        self.rdf_file.close()
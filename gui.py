@@ -83,10 +83,15 @@ def convert():
     # parse and serialize on-the-fly
     serializerobject = serializer.Serializer(output_folder, base_uri, catalog, lang, image_uri, model_only, pattern)
     parserobject = parser.Parser(serializerobject)
-    parserobject.parse(input_file, search="cataloggroup") # mappings between articles and catalog groups
-    parserobject.parse(input_file, search="be")
-    parserobject.parse(input_file, search="offer")
-    specgen.create_html(output_folder)
+    if single_pass.get():
+        parserobject.parse(input_file, search="all")
+    else:
+        parserobject.parse(input_file, search="cataloggroup") # mappings between articles and catalog groups
+        parserobject.parse(input_file, search="be")
+        parserobject.parse(input_file, search="offer")
+    parserobject.close()
+    serializerobject.close()
+    specgen.create_html(output_folder, parserobject.catalog_hierarchy, serializerobject)
 
     print "Conversion successfully finished"
 
@@ -119,6 +124,10 @@ for text in label_texts:
     
     i = i+1
 
+single_pass = IntVar(value=0) # as --single-pass of main.py, off by default
+c = Checkbutton(root, text="Parse input file only once", variable=single_pass)
+c.grid(row=i, column=1, sticky=W)
+
 b = Button(root)
 b.grid(row=(i+1), columnspan=3, sticky=S)
 b["text"] = "Start conversion"
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""incremental.py
+
+Fingerprints of offers for incremental reconversion
+
+The store keeps, for every offer document of the previous run, a fingerprint
+of the parsed offer (including product features, media and catalog group ids)
+and of the serializer configuration, together with the N-Triples of the
+offer, the feature properties it contributes to features.rdf and the time it
+last changed (sitemap lastmod). Offers with an unchanged fingerprint are
+neither rendered nor rewritten; their cached triples go into the rebuilt
+dump and features.rdf. Company, catalog and features documents only keep a
+fingerprint of their content and their lastmod.
+"""
+import shelve
+import hashlib
+
+def canonical(value):
+    """Canonical, hashable representation of parsed objects, lists and dicts"""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    elif isinstance(value, str):
+        return str(value) # plain string for URI objects
+    elif isinstance(value, (list, tuple)):
+        return tuple([canonical(v) for v in value])
+    elif isinstance(value, dict):
+        return tuple(sorted([(k, canonical(v)) for k, v in value.items()]))
+    elif hasattr(value, "__dict__") or hasattr(value, "__slots__"):
+        fields = []
+        for cls in type(value).__mro__:
+            fields.extend(getattr(cls, "__slots__", ()))
+        fields.extend(getattr(value, "__dict__", {}).keys())
+        return (value.__class__.__name__,)+tuple(sorted([(f, canonical(getattr(value, f))) for f in set(fields) if hasattr(value, f)]))
+    return value
+
+def fingerprint(*values):
+    """SHA-1 hex digest over the canonical representation of values"""
+    return hashlib.sha1(repr(canonical(values))).hexdigest()
+
+class FingerprintStore:
+    """Persistent document name -> fingerprint and N-Triples mapping"""
+    version = 4 # format of the entries, part of every fingerprint so that older stores are rebuilt
+    def __init__(self, path):
+        """Initialization"""
+        self.db = shelve.open(path, "c", protocol=2)
+        self.configuration = None # fingerprint of the serializer configuration
+        self.seen = set() # document names of this run
+        self.kept = {} # document name -> lastmod of unchanged offers, whose entries are kept as they are
+
+    def fingerprint(self, offer, configuration):
+        """Fingerprint of offer under the given serializer configuration"""
+        if self.configuration == None:
+            self.configuration = fingerprint(self.version, configuration)
+        return fingerprint(self.configuration, offer)
+
+    def unchanged(self, name, offer_fingerprint):
+        """Return cached (N-Triples, feature property definitions, chunks of additional dump formats) of document name if its fingerprint did not change, else None"""
+        self.seen.add(name)
+        entry = self.db.get(name)
+        if entry != None and entry.get("fingerprint") == offer_fingerprint:
+            self.kept[name] = entry["lastmod"]
+            return entry["nt"], entry["features"], entry["chunks"]
+        return None
+
+    def update(self, name, offer_fingerprint, nt, features, chunks, lastmod):
+        """Remember fingerprint, N-Triples, feature property definitions and chunks of additional dump formats of a document
+        
+        Return the lastmod of the document, that of the previous run if it is unchanged"""
+        if name in self.kept: # the stored entry is still current, not rewritten
+            return self.kept.pop(name)
+        self.db[name] = {"fingerprint":offer_fingerprint, "nt":nt, "features":features, "chunks":chunks, "lastmod":lastmod}
+        return lastmod
+
+    def modified(self, name, document_fingerprint, lastmod):
+        """Return the lastmod of a document that is always rewritten, that of the previous run if its fingerprint did not change"""
+        self.seen.add(name)
+        entry = self.db.get(name)
+        if entry != None and entry.get("fingerprint") == document_fingerprint:
+            return entry["lastmod"]
+        self.db[name] = {"fingerprint":document_fingerprint, "lastmod":lastmod}
+        return lastmod
+
+    def removed(self):
+        """Names of documents of the previous run that did not occur in this run"""
+        return [name for name in self.db.keys() if name not in self.seen]
+
+    def remove(self, name):
+        """Forget document name"""
+        del self.db[name]
+
+    def close(self):
+        """Write store to disk"""
+        self.db.close()
@@ -21,10 +21,20 @@ Organization: E-Business and Web Science Research Group
 # let user choose between ProductOrServicesSomeInstancesPlaceholder and ActualProductOrServiceInstance DONE
 # eligibleCustomerTypes, Payment Methods, Warranty Promises? - maybe best trade-off not to use them for sake of complexity avoidance
 import sys
+import os
+import time
 import parser
+import backends
 import serializer
 import classes
 import specgen
+import splitter
+import sinks
+import writebehind
+import metrics
+import checkpoint
+import prescan
+import sources
 
 def main():
     """Main function"""
@@ -36,6 +46,29 @@ def main():
     image_uri = "ignore" # uri path to images as specified in bmecat catalog - ignore ignores any images
     model_only = False # print model data only, i.e. hide/skip offering details
     pattern = "" # product uri pattern, any string containing %s is allowed, e.g. http://www.example.com/products/id_%s/
+    single_pass = False # collect catalog groups, business entity and offers within one traversal of the input file
+    jobs = 1 # number of worker processes serializing offers
+    nt_engine = "direct" # N-Triples emitter, direct or rdflib
+    xml_engine = "direct" # RDF/XML writer, direct or rdflib
+    pack = False # append offer documents to pack files instead of writing one file per offer
+    incremental = False # only render offers that changed since the previous run
+    engine = backends.engines[0] # XML parser backend
+    mapping = "memory" # storage of article to catalog group mappings, memory or sqlite
+    reuse = False # reset and reuse the parser's offer, feature and media objects
+    gzip_level = 9 # compression level of the dump
+    gzip_block = 1<<20 # uncompressed bytes per gzip member when compressing in parallel
+    gzip_threads = 1 # threads compressing the dump
+    split = 1 # processes parsing byte ranges of the articles
+    formats = [] # additional dump formats besides RDF/XML documents and the N-Triples dump
+    write_threads = 0 # threads writing offer documents behind a queue, 0 writes them directly
+    write_queue = 256 # max. number of offer documents waiting for the write threads
+    fsync = "none" # fsync policy of the written documents
+    checkpoints = 0 # articles between checkpoints of the offer pass, 0 writes none
+    resume = False # continue an interrupted conversion after its last checkpoint
+    index = False # cut the sections a pass does not need out of the input, by a byte-offset index of the file
+    catalog_pages = False # write catalog.html as an index of pages per top-level catalog group
+    metrics_file = None # JSON file receiving counters, timers and histograms of the run
+    profile_file = None # file receiving cProfile statistics of the run
     catalog = classes.Catalog() # global settings are stored in catalog object
     
     # parse command line arguments
@@ -61,7 +94,87 @@ def main():
             image_uri = arg
         elif previous == "-p":
             pattern = arg
-        elif previous == "" and len(arg)>0 and arg[0] != '-':
+        elif previous == "--jobs":
+            try:
+                jobs = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--nt-engine":
+            if arg in ["direct", "rdflib"]:
+                nt_engine = arg
+            else:
+                warn = True
+        elif previous == "--xml-engine":
+            if arg in ["direct", "rdflib"]:
+                xml_engine = arg
+            else:
+                warn = True
+        elif previous == "--parser":
+            if arg in backends.engines:
+                engine = arg
+            else:
+                warn = True
+        elif previous == "--mapping":
+            if arg in ["memory", "sqlite"]:
+                mapping = arg
+            else:
+                warn = True
+        elif previous == "--gzip-level":
+            try:
+                gzip_level = int(arg)
+                if gzip_level < 0 or gzip_level > 9:
+                    gzip_level = 9
+                    warn = True
+            except ValueError:
+                warn = True
+        elif previous == "--gzip-block":
+            try:
+                gzip_block = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--gzip-threads":
+            try:
+                gzip_threads = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--split":
+            try:
+                split = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--formats":
+            formats = []
+            for format in arg.split(","):
+                if format in sinks.formats:
+                    if format not in formats:
+                        formats.append(format)
+                elif format not in ["rdfxml", "nt"]: # always written
+                    warn = True
+        elif previous == "--write-threads":
+            try:
+                write_threads = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--write-queue":
+            try:
+                write_queue = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--fsync":
+            if arg in writebehind.policies:
+                fsync = arg
+            else:
+                warn = True
+        elif previous == "--checkpoint":
+            try:
+                checkpoints = int(arg)
+            except ValueError:
+                warn = True
+        elif previous == "--metrics":
+            metrics_file = arg
+        elif previous == "--profile":
+            profile_file = arg
+        elif previous == "" and (arg == "-" or len(arg)>0 and arg[0] != '-'):
             input_file = arg
         elif previous:
             warn = True
@@ -73,6 +186,7 @@ def main():
         if arg == "--help":
             print "USAGE"
             print "\tpython main.py [options] FILE"
+            print "\t\t\t\t(FILE may be compressed with gzip, bzip2 or zip, \"-\" reads it from stdin)"
             print
             print "OPTIONS"
             print "\t-o <dir>\t\tcustomize location of output folder"
@@ -92,6 +206,50 @@ def main():
             print "\t-p <uri_pattern>\turi pattern for product page urls"
             print "\t\t\t\t(default = \"\")"
             print "\t\t\t\tproduct uri pattern, any string containing %s is allowed, e.g. http://www.example.com/products/id_%s/"
+            print "\t--single-pass\t\tparse the input file only once instead of three times"
+            print "\t\t\t\t(offers are buffered in a temporary file until their catalog groups are known)"
+            print "\t--jobs <n>\t\tnumber of worker processes that serialize offers"
+            print "\t\t\t\t(default = 1)"
+            print "\t--nt-engine <engine>\tN-Triples emitter for the dump, \"direct\" or \"rdflib\""
+            print "\t\t\t\t(default = direct)"
+            print "\t--xml-engine <engine>\tRDF/XML writer for offer, company and catalog documents, \"direct\" or \"rdflib\""
+            print "\t\t\t\t(default = direct)"
+            print "\t--pack\t\t\tstore offer documents in pack files with an index instead of one file per offer"
+            print "\t\t\t\t(unpack with \"python packs.py <output>/rdf\")"
+            print "\t--incremental\t\tonly render offers that changed since the last run into the same output folder"
+            print "\t\t\t\t(fingerprints are kept in <output>/.fingerprints)"
+            print "\t--parser <engine>\tXML parser backend, \"expat\", \"sax\" or \"lxml\" (lxml needs the lxml package)"
+            print "\t\t\t\t(default = expat)"
+            print "\t--mapping <store>\tkeep article to catalog group mappings in \"memory\" or in a temporary \"sqlite\" database"
+            print "\t\t\t\t(default = memory)"
+            print "\t--reuse-objects\t\treuse the parser's offer, feature and media objects instead of allocating new ones"
+            print "\t--gzip-level <n>\tcompression level of dump.nt.gz, 0 to 9"
+            print "\t\t\t\t(default = 9)"
+            print "\t--gzip-threads <n>\tcompress dump.nt.gz on n threads as concatenated gzip members"
+            print "\t\t\t\t(default = 1)"
+            print "\t--gzip-block <bytes>\tuncompressed size of each gzip member when compressing on threads"
+            print "\t\t\t\t(default = 1048576)"
+            print "\t--split <n>\t\tparse the articles in byte ranges on n processes"
+            print "\t\t\t\t(default = 1, not combined with --incremental)"
+            print "\t--formats <list>\tcomma-separated additional dump formats \"turtle\", \"jsonld\" and \"nquads\""
+            print "\t\t\t\t(written to <output>/dump/dump.<ttl|jsonld|nq>.gz, RDF/XML documents and dump.nt.gz are always written)"
+            print "\t--write-threads <n>\twrite offer documents on n threads behind a queue while parsing continues"
+            print "\t\t\t\t(default = 0, i.e. write directly; not used by --jobs workers and --pack)"
+            print "\t--write-queue <n>\tmax. number of offer documents waiting for the write threads"
+            print "\t\t\t\t(default = 256)"
+            print "\t--fsync <policy>\tsync documents to disk, \"none\" or \"file\" (every file and finally the rdf folder)"
+            print "\t\t\t\t(default = none)"
+            print "\t--prescan\t\tindex the sections and articles of the input by byte offsets, every pass only reads what it needs"
+            print "\t\t\t\t(the index is kept in <FILE>.prescan and reused while the file is unchanged)"
+            print "\t--catalog-pages\t\tsplit catalog.html into a page per top-level catalog group"
+            print "\t\t\t\t(catalog.html then lists the pages)"
+            print "\t--checkpoint <n>\twrite a checkpoint every n articles of the offer pass to <output>/.checkpoint"
+            print "\t\t\t\t(default = 0, i.e. none; not combined with --split, --single-pass and --incremental)"
+            print "\t--resume\t\tcontinue an interrupted conversion into the same output folder after its last checkpoint"
+            print "\t\t\t\t(input file and options must not change)"
+            print "\t--metrics <file>\twrite counters, timers and latency histograms of the run as JSON to file"
+            print "\t--profile <file>\tprofile the run with cProfile, write the statistics to file"
+            print "\t\t\t\t(read with pstats, worker processes are not profiled)"
             print "\t--help\t\t\tprint usage summary"
             print
             print
@@ -103,7 +261,21 @@ def main():
             print "Developer: Alex Stolz <alex.stolz@ebusiness-unibw.org>"
             print "..."
             return
-        elif len(arg)>0 and arg[0] == "-":
+        elif arg == "--single-pass":
+            single_pass = True
+        elif arg == "--pack":
+            pack = True
+        elif arg == "--incremental":
+            incremental = True
+        elif arg == "--reuse-objects":
+            reuse = True
+        elif arg == "--resume":
+            resume = True
+        elif arg == "--prescan":
+            index = True
+        elif arg == "--catalog-pages":
+            catalog_pages = True
+        elif len(arg)>1 and arg[0] == "-":
             previous = arg
             
     if not input_file:
@@ -111,14 +283,77 @@ def main():
         print "Usage summary: \"python main.py --help\""
         return
     
+    if not sources.seekable(input_file): # compressed or stdin
+        if input_file == "-" and not single_pass:
+            print "NOTE: stdin can only be read once, parsing in a single pass"
+            single_pass = True
+        if split > 1 or index or checkpoints > 0 or resume:
+            print "NOTE: --split, --prescan, --checkpoint and --resume need an uncompressed input file, ignoring them"
+            split, index, checkpoints, resume = 1, False, 0, False
+    
+    if metrics_file:
+        metrics.enable()
+        metrics.info.update({"input":input_file, "arguments":sys.argv[1:]})
+        if input_file != "-":
+            metrics.info["input bytes"] = os.path.getsize(input_file)
+    profiler = None
+    if profile_file:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    state = None # of the checkpoint to resume from
+    if checkpoints > 0 or resume:
+        if split > 1 or single_pass or incremental:
+            print "NOTE: checkpoints are not written with --split, --single-pass or --incremental"
+            checkpoints = 0
+        else:
+            options = {"base_uri":base_uri, "lang":lang, "image_uri":image_uri, "model_only":model_only, "pattern":pattern,
+                       "pack":pack, "formats":formats, "nt_engine":nt_engine, "xml_engine":xml_engine}
+            if resume:
+                state = checkpoint.load(output_folder, input_file, options)
+                if state == None:
+                    print "NOTE: no checkpoint to resume from, starting over"
+                elif checkpoints <= 0:
+                    checkpoints = state[0]["interval"]
+    
     # parse and serialize on-the-fly
-    serializerobject = serializer.Serializer(output_folder, base_uri, catalog, lang, image_uri, model_only, pattern)
-    parserobject = parser.Parser(serializerobject)
-    parserobject.parse(input_file, search="cataloggroup") # mappings between articles and catalog groups
-    parserobject.parse(input_file, search="be")
-    parserobject.parse(input_file, search="offer")
-    specgen.create_html(output_folder)
+    serializerobject = serializer.Serializer(output_folder, base_uri, catalog, lang, image_uri, model_only, pattern, jobs, nt_engine=nt_engine, xml_engine=xml_engine, pack=pack, incremental=incremental,
+                                               dump_level=gzip_level, dump_block_size=gzip_block, dump_threads=gzip_threads, formats=formats,
+                                               write_threads=write_threads, write_queue=write_queue, fsync=fsync,
+                                               checkpoints=checkpoints>0, resume=state and state[1]["serializer"])
+    parserobject = parser.Parser(serializerobject, engine, mapping, reuse)
+    if index:
+        parserobject.index = prescan.load(input_file)
+    if split > 1 and splitter.convert(parserobject, input_file, split): # False if the file has to be parsed serially
+        print "Offers were parsed on %d processes" % split
+    elif single_pass:
+        parserobject.parse(input_file, search="all")
+    elif checkpoints > 0:
+        checkpoint.convert(parserobject, input_file, checkpoints, options, state)
+    else:
+        parserobject.parse(input_file, search="cataloggroup") # mappings between articles and catalog groups
+        parserobject.parse(input_file, search="be")
+        parserobject.parse(input_file, search="offer")
+    parserobject.close()
+    serializerobject.close()
+    if checkpoints > 0:
+        checkpoint.remove(output_folder)
+    now = time.time()
+    specgen.create_html(output_folder, parserobject.catalog_hierarchy, serializerobject, catalog_pages)
+    metrics.record("specgen", time.time()-now)
+    
+    if profiler != None:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(profile_file)
+        pstats.Stats(profile_file).sort_stats("cumulative").print_stats(20)
+    if metrics_file:
+        metrics.write(metrics_file)
 
+    if serializerobject.write_errors:
+        print "ERROR: %s" % writebehind.describe(serializerobject.write_errors)
+        sys.exit(1)
     print "Conversion successfully finished"
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""metrics.py
+
+Performance metrics of a conversion run
+
+Counters, timers and histograms are kept in module-level registries once
+enable() was called (main.py --metrics <file>) and written as JSON by
+write(). Worker processes hand their metrics to the parent with collect()
+and merge(). While disabled, the recording functions return immediately; call
+sites that need extra work to compute a value check metrics.enabled first.
+
+Histograms use buckets of powers of two (of microseconds for latencies), the
+reported percentiles are the upper bounds of the buckets they fall into.
+"""
+import os
+import time
+import json
+import math
+
+enabled = False
+started = None # time of enable()
+counters = {} # name -> number
+timers = {} # name -> [calls, total seconds, max. seconds]
+histograms = {} # name -> [count, sum, min., max., {bucket exponent -> count}]
+info = {} # name -> value, e.g. input file and options
+
+def enable():
+    """Start collecting metrics"""
+    global enabled, started
+    enabled = True
+    started = time.time()
+
+def count(name, n=1):
+    """Add n to a counter"""
+    if enabled:
+        counters[name] = counters.get(name, 0)+n
+
+def record(name, seconds):
+    """Add a duration to a timer"""
+    if enabled:
+        timer = timers.get(name)
+        if timer == None:
+            timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+def observe(name, value, scale=1e6):
+    """Add a value to a histogram, scale converts it to the bucket unit (seconds -> microseconds)"""
+    if not enabled:
+        return
+    histogram = histograms.get(name)
+    if histogram == None:
+        histogram = histograms[name] = [0, 0.0, value, value, {}]
+    histogram[0] += 1
+    histogram[1] += value
+    if value < histogram[2]:
+        histogram[2] = value
+    if value > histogram[3]:
+        histogram[3] = value
+    exponent = 0
+    if value*scale > 1:
+        exponent = int(math.ceil(math.log(value*scale, 2)))
+    histogram[4][exponent] = histogram[4].get(exponent, 0)+1
+
+class MeteredFile:
+    """File-like wrapper counting the bytes and time of writes"""
+    def __init__(self, file, name):
+        """Initialization"""
+        self.file = file
+        self.name = name
+
+    def write(self, data):
+        """Write data and record it"""
+        now = time.time()
+        self.file.write(data)
+        record("write."+self.name, time.time()-now)
+        count("bytes."+self.name, len(data))
+
+    def checkpoint(self):
+        """Checkpoint the wrapped file, see pgzip"""
+        return self.file.checkpoint()
+
+    def close(self):
+        """Close the wrapped file"""
+        self.file.close()
+
+def countFile(name, path):
+    """Count the size of a finished output file"""
+    if enabled and os.path.exists(path):
+        count("bytes."+name, os.path.getsize(path))
+
+def collect():
+    """Return and reset counters, timers and histograms, e.g. to hand them from a worker process to the parent"""
+    state = (counters.copy(), timers.copy(), histograms.copy())
+    counters.clear()
+    timers.clear()
+    histograms.clear()
+    return state
+
+def merge(state):
+    """Add metrics returned by collect() in another process"""
+    if not enabled or state == None:
+        return
+    other_counters, other_timers, other_histograms = state
+    for name, n in other_counters.items():
+        count(name, n)
+    for name, (calls, total, longest) in other_timers.items():
+        timer = timers.setdefault(name, [0, 0.0, longest])
+        timer[0] += calls
+        timer[1] += total
+        timer[2] = max(timer[2], longest)
+    for name, (number, total, smallest, largest, buckets) in other_histograms.items():
+        histogram = histograms.setdefault(name, [0, 0.0, smallest, largest, {}])
+        histogram[0] += number
+        histogram[1] += total
+        histogram[2] = min(histogram[2], smallest)
+        histogram[3] = max(histogram[3], largest)
+        for exponent, n in buckets.items():
+            histogram[4][exponent] = histogram[4].get(exponent, 0)+n
+
+def percentile(buckets, total, fraction, scale):
+    """Upper bound of the bucket containing the given fraction of values"""
+    seen = 0
+    for exponent in sorted(buckets):
+        seen += buckets[exponent]
+        if seen >= fraction*total:
+            return 2**exponent/scale
+    return None
+
+def snapshot(scale=1e6):
+    """All metrics as a JSON-serializable dict"""
+    result = {"info":info, "seconds":time.time()-(started or time.time()), "counters":counters, "timers":{}, "histograms":{}}
+    for name, (calls, total, longest) in timers.items():
+        result["timers"][name] = {"calls":calls, "seconds":total, "max":longest}
+    for name, (number, total, smallest, largest, buckets) in histograms.items():
+        result["histograms"][name] = {"count":number, "mean":total/number, "min":smallest, "max":largest,
+                                      "p50":percentile(buckets, number, 0.5, scale), "p90":percentile(buckets, number, 0.9, scale),
+                                      "p99":percentile(buckets, number, 0.99, scale),
+                                      "buckets":dict([("%g" % (2**exponent/scale), n) for exponent, n in buckets.items()])}
+    return result
+
+def write(path):
+    """Write all metrics as JSON to path"""
+    file = open(path, "w")
+    json.dump(snapshot(), file, indent=2, sort_keys=True)
+    file.close()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ntriples.py
+
+Lightweight RDF terms and a direct N-Triples emitter
+
+The serializer collects triples as plain tuples
+(subject, predicate, object, datatype, language), where resources are URI
+instances and literals are plain (UTF-8 encoded) strings. serialize() turns
+such a list into N-Triples without building an rdflib graph.
+"""
+import re
+
+from util import BoundedCache
+
+class URI(str):
+    """URI reference, distinguishes resources from literals in triple tuples"""
+    __slots__ = ()
+
+class Namespace(object):
+    """Namespace returning (cached) URI objects on attribute or item access"""
+    def __init__(self, base):
+        """Initialization"""
+        self.base = base
+
+    def __getattr__(self, name):
+        if name.startswith("__"): # no magic methods, e.g. for pickle
+            raise AttributeError(name)
+        uri = URI(self.base+name)
+        self.__dict__[name] = uri # next access bypasses __getattr__
+        return uri
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __str__(self):
+        return self.base
+
+# characters that must be escaped in N-Triples (everything except printable ascii, plus quote and backslash)
+special_literal = re.compile(ur'[^\x20-\x21\x23-\x5b\x5d-\x7e]')
+special_uri = re.compile(ur'[^\x21-\x7e]|[<>"{}|^`\\]')
+escapes = {u"\\":u"\\\\", u"\"":u"\\\"", u"\n":u"\\n", u"\r":u"\\r", u"\t":u"\\t"}
+
+def escape(match):
+    """Escape a single character according to the N-Triples recommendation"""
+    ch = match.group(0)
+    if ch in escapes:
+        return escapes[ch]
+    codepoint = ord(ch)
+    if codepoint > 0xFFFF:
+        return u"\\U%08X" % codepoint
+    return u"\\u%04X" % codepoint
+
+def quote(value, pattern):
+    """Return value with special characters escaped as ascii string"""
+    if not isinstance(value, unicode):
+        if pattern.search(value) == None: # pure printable ascii, nothing to escape
+            return value
+        value = value.decode("utf-8")
+    return pattern.sub(escape, value).encode("ascii")
+
+def term(object, datatype=None, language=None):
+    """N-Triples representation of a URI or literal"""
+    if isinstance(object, URI):
+        return "<"+quote(object, special_uri)+">"
+    literal = "\""+quote(object, special_literal)+"\""
+    if language != None:
+        if language:
+            literal += "@"+language
+    elif datatype != None:
+        literal += "^^<"+quote(datatype, special_uri)+">"
+    return literal
+
+predicates = BoundedCache() # predicate -> escaped predicate
+short_terms = BoundedCache() # (literal, datatype, language) -> term of short typed literals, e.g. units and currencies
+
+def serialize(triples):
+    """Serialize a list of triple tuples as N-Triples, skipping duplicates"""
+    lines = []
+    seen = set()
+    for t in triples:
+        if t in seen:
+            continue
+        seen.add(t)
+        subject, predicate, object, datatype, language = t
+        p = predicates.get(predicate)
+        if p == None:
+            p = quote(predicate, special_uri)
+            predicates.set(predicate, p)
+        if len(object) <= 16 and (datatype != None or language != None) and not isinstance(object, URI):
+            o = short_terms.get(t[2:])
+            if o == None:
+                o = term(object, datatype, language)
+                short_terms.set(t[2:], o)
+        else:
+            o = term(object, datatype, language)
+        lines.append("<%s> <%s> %s .\n" % (quote(subject, special_uri), p, o))
+    return "".join(lines)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""packs.py
+
+Packed storage of offer documents
+
+Instead of one file per offer, documents are appended to a few pack files
+(<name>_00000.pack, <name>_00001.pack, ...). The index <name>.idx holds one
+line "<document> <pack> <offset> <length>" per document.
+
+Usage for unpacking: python packs.py <rdf folder> [name] [document ...]
+Without documents all of them are extracted into the rdf folder, otherwise
+the given documents are printed to stdout.
+"""
+import os
+import sys
+import glob
+
+from util import reopen, sync
+
+class PackWriter:
+    """Appends documents to pack files and records their positions"""
+    def __init__(self, folder, name="offers", max_size=1<<30, state=None):
+        """Initialization, state as returned by checkpoint() continues the packs of an interrupted run"""
+        self.folder = folder
+        self.name = name
+        self.max_size = max_size # start a new pack file beyond this size in bytes
+        self.number = -1
+        self.pack = None
+        self.offset = 0
+        if state == None:
+            self.index = open("%s/%s.idx" % (folder, name), "w")
+            self.next()
+        else:
+            self.index = reopen("%s/%s.idx" % (folder, name), state["index"])
+            self.number = state["number"]
+            self.offset = state["offset"]
+            self.pack = reopen("%s/%s_%05d.pack" % (folder, name, self.number), self.offset)
+            for path in glob.glob("%s/%s_*.pack" % (folder, name)): # started after the checkpoint
+                if int(path[-10:-5]) > self.number:
+                    os.remove(path)
+
+    def next(self):
+        """Continue with the next pack file"""
+        if self.pack != None:
+            self.pack.close()
+        self.number += 1
+        self.pack = open("%s/%s_%05d.pack" % (self.folder, self.name, self.number), "wb")
+        self.offset = 0
+
+    def add(self, document_name, data):
+        """Append a document"""
+        if self.offset > 0 and self.offset+len(data) > self.max_size:
+            self.next()
+        self.pack.write(data)
+        self.index.write("%s %d %d %d\n" % (document_name, self.number, self.offset, len(data)))
+        self.offset += len(data)
+
+    def checkpoint(self):
+        """Sync pack and index files, return the state to continue from"""
+        sync(self.pack)
+        return {"number":self.number, "offset":self.offset, "index":sync(self.index)}
+
+    def close(self):
+        """Close pack and index files"""
+        self.pack.close()
+        self.index.close()
+
+class PackReader:
+    """Random access to packed documents"""
+    def __init__(self, folder, name="offers", suffix=""):
+        """Initialization, loads the index
+        
+        suffix is appended to the names of index and pack files, see retire()"""
+        self.folder = folder
+        self.name = name
+        self.suffix = suffix
+        self.index = {} # document -> (pack, offset, length)
+        self.order = [] # documents in the order they were packed
+        self.packs = {} # pack number -> open file
+        for line in open("%s/%s.idx%s" % (folder, name, suffix)):
+            document_name, number, offset, length = line.split()
+            self.index[document_name] = (int(number), int(offset), int(length))
+            self.order.append(document_name)
+
+    def names(self):
+        """Names of all packed documents in the order they were packed"""
+        return self.order
+
+    def get(self, document_name):
+        """Return the document, None if not packed"""
+        if document_name not in self.index:
+            return None
+        number, offset, length = self.index[document_name]
+        if number not in self.packs:
+            self.packs[number] = open("%s/%s_%05d.pack%s" % (self.folder, self.name, number, self.suffix), "rb")
+        pack = self.packs[number]
+        pack.seek(offset)
+        return pack.read(length)
+
+    def extract(self, target=None):
+        """Write every document as a file of its own"""
+        target = target or self.folder
+        for document_name in self.names():
+            file = open("%s/%s" % (target, document_name), "wb")
+            file.write(self.get(document_name))
+            file.close()
+
+    def close(self):
+        """Close pack files"""
+        for pack in self.packs.values():
+            pack.close()
+        self.packs = {}
+
+    def remove(self):
+        """Close and delete index and pack files"""
+        self.close()
+        os.remove("%s/%s.idx%s" % (self.folder, self.name, self.suffix))
+        for path in glob.glob("%s/%s_*.pack%s" % (self.folder, self.name, self.suffix)):
+            os.remove(path)
+
+def retire(folder, name="offers"):
+    """Rename existing index and pack files to *.old and return a reader for them, None if there are none"""
+    if not os.path.exists("%s/%s.idx" % (folder, name)):
+        return None
+    for path in glob.glob("%s/%s_*.pack" % (folder, name))+["%s/%s.idx" % (folder, name)]:
+        os.rename(path, path+".old")
+    return PackReader(folder, name, ".old")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "USAGE"
+        print "\tpython packs.py <rdf folder> [offers|models] [document ...]"
+        sys.exit(1)
+    folder = sys.argv[1]
+    name = "offers"
+    documents = sys.argv[2:]
+    if documents and not documents[0].endswith(".rdf"):
+        name = documents.pop(0)
+    elif not os.path.exists("%s/%s.idx" % (folder, name)):
+        name = "models"
+    reader = PackReader(folder, name)
+    if documents:
+        for document_name in documents:
+            data = reader.get(document_name)
+            if data == None:
+                sys.stderr.write("%s not found\n" % document_name)
+            else:
+                sys.stdout.write(data)
+    else:
+        reader.extract()
+    reader.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""parallel.py
+
+Renders offers on a pool of worker processes
+
+Every worker writes the per-offer documents itself and hands N-Triples,
+chunks of the additional dump formats and newly used feature properties
+back to the parent, which merges them into the dumps and feature registry in
+the order the offers were parsed.
+Pack files are written by the parent, so in pack mode workers return the
+documents as well.
+"""
+import multiprocessing
+import collections
+import cPickle
+import time
+
+import serializer
+import metrics
+
+worker_serializer = None # serializer instance of a worker process
+worker_features = set() # feature property definitions already handed back by this worker
+
+def initWorker(settings, be_about):
+    """Set up the serializer of a worker process"""
+    global worker_serializer
+    worker_serializer = serializer.Serializer(worker=True, **settings)
+    worker_serializer.be_about = be_about
+    metrics.collect() # drop metrics inherited from the parent
+
+def renderOffer(data):
+    """Render a pickled offer, return its document (pack mode only), N-Triples, feature property definitions not handed back by this worker before,
+    chunks of the additional dump formats and metrics"""
+    now = time.time()
+    offer = cPickle.loads(data)
+    worker_serializer.offer_features = []
+    name = worker_serializer.documentName(offer)
+    triples, bindings = worker_serializer.offerTriples(offer)
+    document = (name, worker_serializer.render(triples, bindings, "pretty-xml"))
+    if not worker_serializer.pack:
+        worker_serializer.writeDocument(*document)
+        document = None
+    nt = worker_serializer.render(triples, bindings, "nt")
+    chunks = worker_serializer.renderChunks(triples, worker_serializer.base_uri+"/rdf/"+name)
+    features = []
+    for definition in worker_serializer.offer_features:
+        if worker_serializer.incremental or definition not in worker_features: # incremental runs cache the features per offer
+            worker_features.add(definition)
+            features.append(definition)
+    state = None
+    if metrics.enabled:
+        metrics.observe("latency.offer", time.time()-now)
+        state = metrics.collect()
+    return document, nt, features, chunks, state
+
+class OfferPool:
+    """Pool of worker processes serializing offers"""
+    def __init__(self, serializer, jobs, window=0):
+        """Initialization"""
+        self.serializer = serializer
+        self.window = window or jobs*64 # max. number of offers in flight
+        self.pending = collections.deque()
+        self.pool = multiprocessing.Pool(jobs, initWorker, (serializer.settings(), serializer.be_about))
+        
+    def submit(self, offer, name, fingerprint=None):
+        """Queue offer for serialization"""
+        # pickle immediately, the parser may reuse its objects afterwards
+        data = cPickle.dumps(offer, cPickle.HIGHEST_PROTOCOL)
+        self.pending.append((self.pool.apply_async(renderOffer, (data,)), name, fingerprint))
+        self.flush()
+    
+    def append(self, result, name, fingerprint=None):
+        """Queue an offer that needs no rendering, result as returned by renderOffer"""
+        self.pending.append((result, name, fingerprint))
+        self.flush()
+    
+    def flush(self):
+        """Merge finished results at the head of the queue, wait if too many offers are in flight"""
+        while len(self.pending) > self.window or (self.pending and self.ready(self.pending[0][0])):
+            self.merge(*self.pending.popleft())
+    
+    def ready(self, result):
+        """True if result can be merged without waiting"""
+        return type(result) == tuple or result.ready()
+    
+    def merge(self, result, name, fingerprint):
+        """Append worker result to the output of the parent"""
+        if type(result) != tuple:
+            result = result.get()
+        document, nt, features, chunks, state = result
+        metrics.merge(state)
+        if document != None:
+            self.serializer.writeDocument(*document)
+        self.serializer.finishOffer(name, nt, fingerprint, features, chunks)
+    
+    def drain(self):
+        """Merge all outstanding results"""
+        while self.pending:
+            self.merge(*self.pending.popleft())
+
+    def close(self):
+        """Merge outstanding results and shut down the workers"""
+        self.drain()
+        self.pool.close()
+        self.pool.join()
@@ -12,20 +12,147 @@ Author: Alex Stolz
 Organization: E-Business and Web Science Research Group
 """
 import xml.sax
+import xml.sax.saxutils
+import os
 import sys
 from classes import *
 import time
 import re
+import tempfile
+import cPickle
+import backends
+import sources
+import metrics
 
+# BMEcat 1.2 element names that were renamed in BMEcat 2005, the event handler reports the latter only
+aliases = {"ARTICLE":"PRODUCT", "ARTICLE_DETAILS":"PRODUCT_DETAILS", "ARTICLE_STATUS":"PRODUCT_STATUS",
+           "ARTICLE_FEATURES":"PRODUCT_FEATURES", "ARTICLE_ORDER_DETAILS":"PRODUCT_ORDER_DETAILS",
+           "ARTICLE_PRICE_DETAILS":"PRODUCT_PRICE_DETAILS", "ARTICLE_PRICE":"PRODUCT_PRICE",
+           "ARTICLE_TO_CATALOGGROUP_MAP":"PRODUCT_TO_CATALOGGROUP_MAP", "ART_ID":"PROD_ID",
+           "SUPPLIER_AID":"SUPPLIER_PID", "MANUFACTURER_AID":"MANUFACTURER_PID"}
+
+# rules applied on closing tags per search, (parents, element, action), where parents None matches any parent
+# and action is the name of a Parser method or (object, field, conversion) to copy the tag content into a field:
+# conversion None copies, "intern" copies an interned string (for highly repetitive values like units), "id" strips
+# non-alphanumerics, "id!" does the same for non-empty content only, "append" appends an interned string
+# the "offering" groups fill fields that only appear in gr:Offering descriptions, they are skipped for model catalogs
+rules = {
+    "header": [
+        (["CATALOG"], "LANGUAGE", ("catalog", "lang", "intern")),
+    ],
+    "header offering": [
+        (["CATALOG"], "CURRENCY", ("catalog", "currency", "intern")),
+        (["CATALOG"], "VALID_START_DATE", ("catalog", "validFrom", None)),
+        (["CATALOG"], "VALID_END_DATE", ("catalog", "validThrough", None)),
+        (["CATALOG"], "TERRITORY", ("catalog", "eligibleRegions", "append")),
+    ],
+    "cataloggroup": [
+        (None, "CATALOG_STRUCTURE", "setRootGroup"),
+        (None, "CATALOG_STRUCTURE", "closeCatalogGroup"),
+        (["CATALOG_STRUCTURE"], "GROUP_ID", ("catalog_group", "id", "id!")),
+        (["CATALOG_STRUCTURE"], "GROUP_NAME", ("catalog_group", "name", None)),
+        (["CATALOG_STRUCTURE"], "GROUP_DESCRIPTION", ("catalog_group", "description", None)),
+        (["CATALOG_STRUCTURE"], "PARENT_ID", ("catalog_group", "parent_id", "id!")),
+        (None, "PRODUCT_TO_CATALOGGROUP_MAP", "closeMapping"),
+        (["PRODUCT_TO_CATALOGGROUP_MAP"], "PROD_ID", ("article2categorygroup", "article_id", "id")),
+        (["PRODUCT_TO_CATALOGGROUP_MAP"], "CATALOG_GROUP_ID", ("article2categorygroup", "cataloggroup_id", "id!")),
+    ],
+    "be": [
+        (None, "PARTY", "closeCompany"),
+        (None, "SUPPLIER", "closeCompany"),
+        (None, "BUYER", "closeCompany"),
+        (["PARTY", "SUPPLIER", "BUYER"], "PARTY_ID", "setCompanyId"),
+        (["PARTY", "SUPPLIER", "BUYER"], "SUPPLIER_ID", "setCompanyId"),
+        (["PARTY", "SUPPLIER", "BUYER"], "BUYER_ID", "setCompanyId"),
+        (["PARTY", "SUPPLIER", "BUYER"], "SUPPLIER_NAME", "setCompanyName"),
+        (["PARTY", "SUPPLIER", "BUYER"], "BUYER_NAME", "setCompanyName"),
+        (["PARTY", "SUPPLIER", "BUYER"], "PARTY_ROLE", ("be", "type", None)),
+        (["ADDRESS"], "NAME", ("be", "legalName", None)),
+        (["ADDRESS"], "STREET", ("be", "street_address", None)),
+        (["ADDRESS"], "ZIP", ("be", "postal_code", None)),
+        (["ADDRESS"], "BOXNO", ("be", "postal_box", None)),
+        (["ADDRESS"], "CITY", ("be", "location", None)),
+        (["ADDRESS"], "STATE", ("be", "region", None)),
+        (["ADDRESS"], "COUNTRY", ("be", "country_name", None)),
+        (["ADDRESS"], "PHONE", ("be", "tel", None)),
+        (["ADDRESS"], "FAX", ("be", "fax", None)),
+        (["ADDRESS"], "EMAIL", ("be", "email", None)),
+        (["ADDRESS"], "URL", ("be", "page", None)),
+    ],
+    "offer": [
+        (None, "FEATURE", "closeFeature"),
+        (None, "PRODUCT_FEATURES", "closeProductFeature"),
+        (None, "PRODUCT", "closeProduct"),
+        (["PRODUCT"], "SUPPLIER_PID", "setOfferId"),
+        (["PRODUCT_DETAILS"], "DESCRIPTION_SHORT", ("offer", "description", None)),
+        (["PRODUCT_DETAILS"], "DESCRIPTION_LONG", ("offer", "comment", None)),
+        (["PRODUCT_DETAILS"], "EAN", ("offer", "ean", None)),
+        (["PRODUCT_DETAILS"], "INTERNATIONAL_PID", "setInternationalId"), # replaces EAN and SUPPLIER_ALT_PID in BMECat 2005
+        (["PRODUCT_DETAILS"], "MANUFACTURER_PID", ("offer", "mpn", None)),
+        (["PRODUCT_DETAILS"], "MANUFACTURER_NAME", "setManufacturer"),
+        (["PRODUCT_DETAILS"], "PRODUCT_STATUS", "setCondition"),
+        (["FEATURE"], "FNAME", ("feature", "name", "intern")),
+        (["FEATURE"], "FVALUE", ("feature", "value", None)),
+        (["FEATURE"], "FUNIT", ("feature", "unit", "intern")),
+        (["FEATURE"], "FREF", ("feature", "fref", "intern")),
+        (["PRODUCT_FEATURES"], "REFERENCE_FEATURE_SYSTEM_ID", ("product_feature", "reference_feature_system_id", "intern")),
+        (["PRODUCT_FEATURES"], "REFERENCE_FEATURE_SYSTEM_NAME", ("product_feature", "reference_feature_system_name", "intern")),
+        (["PRODUCT_FEATURES"], "REFERENCE_FEATURE_GROUP_NAME", ("product_feature", "reference_feature_group_name", "intern")),
+        (["PRODUCT_FEATURES"], "REFERENCE_FEATURE_GROUP_ID", "setFeatureGroupId"),
+        (["PRODUCT_FEATURES"], "REFERENCE_FEATURE_GROUP_ID2", "setFeatureGroupId"),
+    ],
+    "offer offering": [
+        (["PRODUCT_ORDER_DETAILS"], "CONTENT_UNIT", ("offer", "content_uom", "intern")),
+        (["PRODUCT_ORDER_DETAILS"], "ORDER_UNIT", ("offer", "order_uom", "intern")),
+        (["PRODUCT_ORDER_DETAILS"], "NO_CU_PER_OU", ("offer", "content_units", None)),
+        (["PRODUCT_ORDER_DETAILS"], "QUANTITY_MIN", ("offer", "order_units", None)),
+        (["PRODUCT_PRICE_DETAILS"], "VALID_START_DATE", ("offer", "validFrom", None)),
+        (["PRODUCT_PRICE_DETAILS"], "VALID_END_DATE", ("offer", "validThrough", None)),
+        (None, "PRODUCT_PRICE", "setTaxes"),
+        (["PRODUCT_PRICE"], "PRICE_AMOUNT", ("offer", "price", None)),
+        (["PRODUCT_PRICE"], "PRICE_FACTOR", ("offer", "price_factor", None)),
+        (["PRODUCT_PRICE"], "PRICE_CURRENCY", ("offer", "currency", "intern")),
+        (["PRODUCT_PRICE"], "LOWER_BOUND", ("offer", "price_lower", None)),
+        (["PRODUCT_PRICE"], "TERRITORY", ("offer", "eligibleRegions", "append")),
+    ],
+}
+
+# actions that only use attributes and the element stack, elements with nothing but these collect no text
+attribute_actions = ["setRootGroup", "setCondition", "setTaxes", "closeMime", "closeCatalogGroup", "closeMapping",
+                     "closeCompany", "closeFeature", "closeProductFeature", "closeProduct"]
+
+# elements owning MIME information per search, media elements count if one of them is among their three closest ancestors
+# supports two variants, where the second is definitely wrong, but in use anyway
+# SUPPLIER -> MIME_INFO -> MIME -> MIME_TYPE
+# SUPPLIER -> MIME -> MIME_TYPE (wrong usage)
+mime_owners = {"cataloggroup":["CATALOG_STRUCTURE"], "be":["PARTY", "SUPPLIER", "BUYER"], "offer":["PRODUCT"]}
+
+non_alphanumeric = re.compile(r"[^a-zA-Z0-9]")
 class Parser:
     """Parser class"""
-    def __init__(self, serializer):
-        """Initialization"""
+    def __init__(self, serializer, engine="expat", mapping="memory", reuse=False):
+        """Initialization
+        
+        engine selects the XML parser backend, see backends.engines, mapping is "memory"
+        or "sqlite" to keep article to catalog group mappings in a temporary database,
+        reuse=True resets and reuses offer, feature and media objects once an offer is stored"""
         self.serializer = serializer
+        self.engine = engine
         self.catalog = serializer.catalog
         self.search = "be" # initialize to be, get modifications from parse function
+        self.rules = {} # dispatch table of the current search, see compileRules()
+        self.texts = set() # elements of the current search whose actions read their text
         self.catalog_hierarchy = [] # will contain full catalog hierarchy
-        self.article2categorygroup = Article2CatalogGroupMap()
+        if mapping == "sqlite":
+            self.article2categorygroup = SQLiteArticle2CatalogGroupMap(serializer.output_folder)
+        else:
+            self.article2categorygroup = Article2CatalogGroupMap()
+        self.spill = None # temporary file of offers awaiting their catalog group ids (single pass)
+        self.reuse = reuse
+        self.verbose = True # print progress of every pass
+        self.checkpointer = None # told about every finished article, see checkpoint module
+        self.index = None # byte-offset index of the input file, see prescan module
+        self.free = {ProductFeature:[], Feature:[], Mime:[]} # objects of stored offers ready for reuse
         # initialize
         self.be = BusinessEntity()
         self.offer = Offer()
@@ -34,317 +161,360 @@ class Parser:
         self.feature = Feature()
         self.mime = Mime()
         
-    def processCatalog(self, subtop, top, tag):
-        if top == "CATALOG_STRUCTURE":
-            if "type" in tag.attrs:
-                if tag.attrs['type'] == "root": # root has no parents
-                    self.catalog_group.parent_id = ""     
-        if subtop == "CATALOG_STRUCTURE" and self.catalog_group != None:
-            if top == "GROUP_ID":
-                if tag.content != "":
-                    self.catalog_group.id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)
-            elif top == "GROUP_NAME":
-                self.catalog_group.name = tag.content
-            elif top == "GROUP_DESCRIPTION":
-                self.catalog_group.description = tag.content
-            elif top == "PARENT_ID":
-                if tag.content != "":
-                    self.catalog_group.parent_id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)          
-        if subtop == "CATALOG_STRUCTURE" or ((len(tag.stack) > 2 and tag.stack[-3] == "CATALOG_STRUCTURE") or (len(tag.stack) > 3 and tag.stack[-4] == "CATALOG_STRUCTURE")) and self.catalog_group != None:
-            if top == "MIME_PURPOSE":
-                self.mime.name = tag.content
-            if top == "MIME_DESCR":
-                self.mime.desc = tag.content
-            if top == "MIME_TYPE":
-                self.mime.type = tag.content
-            if top == "MIME_SOURCE":
-                self.mime.source = tag.content
-
-    def processArticle2CatalogGroupMap(self, subtop, top, tag):
-        if subtop in ["PRODUCT_TO_CATALOGGROUP_MAP", "ARTICLE_TO_CATALOGGROUP_MAP"]:
-            if top in ["PROD_ID", "ART_ID"]:
-                self.article2categorygroup.article_id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)
-            elif top == "CATALOG_GROUP_ID":
-                if tag.content != "":
-                    self.article2categorygroup.cataloggroup_id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)
-        
-    def processCompany(self, subtop, top, tag):
-        if subtop in ["PARTY", "SUPPLIER", "BUYER"]:
-            if top in ["PARTY_ID", "SUPPLIER_ID", "BUYER_ID"]:
-                self.be.id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)
-                if "type" in tag.attrs:
-                    attr_type = tag.attrs['type']
-                    if attr_type == "duns":
-                        self.be.duns = tag.content
-                    elif attr_type == "gln" or attr_type == "iln":
-                        self.be.gln = tag.content
-            elif top in ["SUPPLIER_NAME", "BUYER_NAME"]:
-                self.be.legalName = tag.content
-                if top == "SUPPLIER_NAME":
-                    self.be.type = "supplier"
-                else: self.be.type = "buyer"
-            elif top == "PARTY_ROLE": self.be.type = tag.content
-        if subtop == "ADDRESS":
-            if top == "NAME": self.be.legalName = tag.content
-            elif top == "STREET": self.be.street_address = tag.content
-            elif top == "ZIP": self.be.postal_code = tag.content
-            elif top == "BOXNO": self.be.postal_box = tag.content
-            elif top == "CITY": self.be.location = tag.content
-            elif top == "STATE": self.be.region = tag.content
-            elif top == "COUNTRY": self.be.country_name = tag.content
-            elif top == "PHONE": self.be.tel = tag.content
-            elif top == "FAX": self.be.fax = tag.content
-            elif top == "EMAIL": self.be.email = tag.content
-            elif top == "URL": self.be.page = tag.content
-        # supports two variants, where the second is definitely wrong, but in use anyway
-        # SUPPLIER -> MIME_INFO -> MIME -> MIME_TYPE
-        # SUPPLIER -> MIME -> MIME_TYPE (wrong usage)
-        if subtop in ["PARTY", "SUPPLIER", "BUYER"] or ((len(tag.stack) > 2 and tag.stack[-3] in ["PARTY", "SUPPLIER", "BUYER"]) or (len(tag.stack) > 3 and tag.stack[-4] in ["PARTY", "SUPPLIER", "BUYER"])):
-            if top == "MIME_PURPOSE":
-                self.mime.name = tag.content
-            if top == "MIME_DESCR":
-                self.mime.desc = tag.content
-            if top == "MIME_TYPE":
-                self.mime.type = tag.content
-            if top == "MIME_SOURCE":
-                self.mime.source = tag.content
-        
-    def processOffer(self, subtop, top, tag):
-        if subtop in ["PRODUCT", "ARTICLE"]:
-            if top in ["SUPPLIER_PID", "SUPPLIER_AID"]:
-                self.offer.id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)
-                if "type" in tag.attrs:
-                    attr_type = tag.attrs['type']
-                    if attr_type == "ean":
-                        self.offer.ean = tag.content
-                    elif attr_type == "gtin":
-                        self.offer.gtin = tag.content
-                    elif attr_type == "upc":
-                        self.offer.ean = "0" + tag.content # "0" + upc -> ean
-        if subtop in ["PRODUCT_DETAILS", "ARTICLE_DETAILS"]:
-            if top == "DESCRIPTION_SHORT": self.offer.description = tag.content
-            elif top == "DESCRIPTION_LONG": self.offer.comment = tag.content
-            elif top == "EAN": self.offer.ean = tag.content
-            elif top == "INTERNATIONAL_PID": # replaces EAN and SUPPLIER_ALT_PID in BMECat 2005
-                if "type" in tag.attrs:
-                    attr_type = tag.attrs['type']
-                    if attr_type == "ean":
-                        self.offer.ean = tag.content
-                    elif attr_type == "gtin":
-                        self.offer.gtin = tag.content
-                    elif attr_type == "upc":
-                        self.offer.ean = "0" + tag.content # "0" + upc -> ean
-            elif top in ["MANUFACTURER_PID", "MANUFACTURER_AID"]: self.offer.mpn = tag.content
-            elif top == "MANUFACTURER_NAME":
-                self.offer.manufacturer_id = re.sub(r"[^a-zA-Z0-9]", "", tag.content)
-                self.offer.manufacturer_name = tag.content
-            elif top in ["PRODUCT_STATUS", "ARTICLE_STATUS"]:
-                if "type" in tag.attrs:
-                    attr_type = tag.attrs['type']
-                    if attr_type: # condition: used, new, ...
-                        self.offer.condition = attr_type
-        if subtop in ["PRODUCT_ORDER_DETAILS", "ARTICLE_ORDER_DETAILS"]:
-            if top == "CONTENT_UNIT": self.offer.content_uom = tag.content
-            if top == "ORDER_UNIT": self.offer.order_uom = tag.content
-            if top == "NO_CU_PER_OU": self.offer.content_units = tag.content
-            if top == "QUANTITY_MIN": self.offer.order_units = tag.content
-        if subtop in ["PRODUCT_PRICE_DETAILS", "ARTICLE_PRICE_DETAILS"]:
-            if top == "VALID_START_DATE": self.offer.validFrom = tag.content
-            elif top == "VALID_END_DATE": self.offer.validThrough = tag.content
-        if subtop in ["PRODUCT_PRICE", "ARTICLE_PRICE"]:
-            if top == "PRICE_AMOUNT": self.offer.price = tag.content
-            elif top == "PRICE_FACTOR": self.offer.price_factor = tag.content
-            elif top == "PRICE_CURRENCY": self.offer.currency = tag.content
-            elif top == "LOWER_BOUND": self.offer.price_lower = tag.content
-            elif top == "TERRITORY": self.offer.eligibleRegions.append(tag.content)
-        if subtop == "FEATURE":
-            if top == "FNAME":
-                self.feature.name = tag.content
-            elif top == "FVALUE":
-                self.feature.value = tag.content
-            elif top == "FUNIT":
-                self.feature.unit = tag.content
-            elif top == "FREF":
-                self.feature.fref = tag.content
-        if subtop in ["PRODUCT", "ARTICLE"] or ((len(tag.stack) > 2 and tag.stack[-3] in ["PRODUCT", "ARTICLE"]) or (len(tag.stack) > 3 and tag.stack[-4] in ["PRODUCT", "ARTICLE"])):
-            if top == "MIME_PURPOSE":
-                self.mime.name = tag.content
-            if top == "MIME_DESCR":
-                self.mime.desc = tag.content
-            if top == "MIME_TYPE":
-                self.mime.type = tag.content
-            if top == "MIME_SOURCE":
-                self.mime.source = tag.content
-        if subtop in ["PRODUCT_FEATURES", "ARTICLE_FEATURES"]:
-            if top == "REFERENCE_FEATURE_SYSTEM_ID":
-                self.product_feature.reference_feature_system_id = tag.content
-            elif top == "REFERENCE_FEATURE_SYSTEM_NAME":
-                self.product_feature.reference_feature_system_name = tag.content
-            elif top == "REFERENCE_FEATURE_GROUP_NAME":
-                self.product_feature.reference_feature_group_name = tag.content
-            elif top == "REFERENCE_FEATURE_GROUP_ID":
-                self.product_feature.reference_feature_group_id["value"] = tag.content
-                if "type" in tag.attrs:
-                    attr_type = tag.attrs['type']
-                    if attr_type:
-                        self.product_feature.reference_feature_group_id["type"] = attr_type
-            elif top == "REFERENCE_FEATURE_GROUP_ID2":
-                self.product_feature.reference_feature_group_id2["value"] = tag.content
-                if "type" in tag.attrs:
-                    attr_type = tag.attrs['type']
-                    if attr_type:
-                        self.product_feature.reference_feature_group_id2["type"] = attr_type
-        
-        if top in ["PRODUCT_PRICE", "ARTICLE_PRICE"]:
-            if "price_type" in tag.attrs:
-                attr_type = tag.attrs['price_type']
-                if attr_type in ["net_list", "net_customer", "net_customer_exp", "net"]:
-                    self.offer.taxes = "false"
+    def compileRules(self, search):
+        """Build the element -> [(parent, action)] dispatch table for search and the output profile"""
+        searches = [search]
+        if search == "all":
+            searches = ["cataloggroup", "be", "offer"]
+        groups = ["header"]+searches
+        if not self.serializer.model_only:
+            groups += [group+" offering" for group in groups if group+" offering" in rules]
+        table = {}
+        self.texts = set()
+        for group in groups:
+            for parents, element, action in rules[group]:
+                if type(action) == tuple:
+                    action = self.setter(*action)
+                    self.texts.add(element)
                 else:
-                    self.offer.taxes = "true"
+                    if action not in attribute_actions:
+                        self.texts.add(element)
+                    action = getattr(self, action)
+                for parent in parents or [None]:
+                    table.setdefault(element, []).append((parent, action))
+        owners = set()
+        for group in searches:
+            owners.update(mime_owners[group])
+        for element, field in [("MIME_PURPOSE", "name"), ("MIME_DESCR", "desc"), ("MIME_TYPE", "type"), ("MIME_SOURCE", "source")]:
+            table.setdefault(element, []).append((None, self.mimeSetter(field, owners)))
+            self.texts.add(element)
+        table.setdefault("MIME", []).append((None, self.closeMime))
+        return table
     
-    def processData(self, tag, close):
-        """Catch information on-the-fly and store as objects"""
-        
-        top = tag.stack[-1]
-        subtop = None
-        if len(tag.stack) > 1:
-            subtop = tag.stack[-2]
-                    
-        # check upper two items on stack -> should be enough
-        if subtop == "CATALOG":
-            if top == "LANGUAGE": self.catalog.lang = tag.content
-            elif top == "CURRENCY": self.catalog.currency = tag.content
-            elif top == "VALID_START_DATE": self.catalog.validFrom = tag.content
-            elif top == "VALID_END_DATE": self.catalog.validThrough = tag.content
-            elif top == "TERRITORY": self.catalog.eligibleRegions.append(tag.content)
-            
+    def setter(self, object, field, conversion):
+        """Return an action copying the tag content into field of the current object"""
+        if conversion == "id":
+            def action(tag):
+                setattr(getattr(self, object), field, non_alphanumeric.sub("", tag.content))
+        elif conversion == "id!":
+            def action(tag):
+                if tag.content != "":
+                    setattr(getattr(self, object), field, non_alphanumeric.sub("", tag.content))
+        elif conversion == "intern":
+            def action(tag):
+                setattr(getattr(self, object), field, intern(tag.content))
+        elif conversion == "append":
+            def action(tag):
+                getattr(getattr(self, object), field).append(intern(tag.content))
+        else:
+            def action(tag):
+                setattr(getattr(self, object), field, tag.content)
+        return action
+    
+    def mimeSetter(self, field, owners):
+        """Return an action copying the tag content into field of the current media object"""
+        def action(tag):
+            if not owners.isdisjoint(tag.stack[-4:-1]):
+                setattr(self.mime, field, tag.content)
+        return action
+    
+    def setRootGroup(self, tag):
+        if "type" in tag.attrs:
+            if tag.attrs['type'] == "root": # root has no parents
+                self.catalog_group.parent_id = ""
+    
+    def setCompanyId(self, tag):
+        self.be.id = non_alphanumeric.sub("", tag.content)
+        if "type" in tag.attrs:
+            attr_type = tag.attrs['type']
+            if attr_type == "duns":
+                self.be.duns = tag.content
+            elif attr_type == "gln" or attr_type == "iln":
+                self.be.gln = tag.content
+    
+    def setCompanyName(self, tag):
+        self.be.legalName = tag.content
+        if tag.stack[-1] == "SUPPLIER_NAME":
+            self.be.type = "supplier"
+        else: self.be.type = "buyer"
+    
+    def setOfferId(self, tag):
+        self.offer.id = non_alphanumeric.sub("", tag.content)
+        self.setInternationalId(tag)
+    
+    def setInternationalId(self, tag):
+        if "type" in tag.attrs:
+            attr_type = tag.attrs['type']
+            if attr_type == "ean":
+                self.offer.ean = tag.content
+            elif attr_type == "gtin":
+                self.offer.gtin = tag.content
+            elif attr_type == "upc":
+                self.offer.ean = "0" + tag.content # "0" + upc -> ean
+    
+    def setManufacturer(self, tag):
+        self.offer.manufacturer_id = intern(non_alphanumeric.sub("", tag.content))
+        self.offer.manufacturer_name = intern(tag.content)
+    
+    def setCondition(self, tag):
+        if "type" in tag.attrs:
+            attr_type = tag.attrs['type']
+            if attr_type: # condition: used, new, ...
+                self.offer.condition = attr_type
+    
+    def setTaxes(self, tag):
+        if "price_type" in tag.attrs:
+            attr_type = tag.attrs['price_type']
+            if attr_type in ["net_list", "net_customer", "net_customer_exp", "net"]:
+                self.offer.taxes = "false"
+            else:
+                self.offer.taxes = "true"
+    
+    def setFeatureGroupId(self, tag):
+        if tag.stack[-1] == "REFERENCE_FEATURE_GROUP_ID":
+            group_id = self.product_feature.reference_feature_group_id
+        else:
+            group_id = self.product_feature.reference_feature_group_id2
+        group_id["value"] = tag.content
+        if "type" in tag.attrs:
+            attr_type = tag.attrs['type']
+            if attr_type:
+                group_id["type"] = attr_type
+    
+    def closeMime(self, tag):
+        owner = self.mimeOwner(tag.stack)
+        if owner != None and self.mime != None and self.mime.source != "":
+            owner.media.append(self.mime)
+        self.mime = self.obtain(Mime)
+    
+    def closeCatalogGroup(self, tag):
+        # serialize catalog structure when be is processed, not with offers -> is supposed to be more performant
+        if self.catalog_group != None:
+            self.catalog_hierarchy.append(self.catalog_group)
+            self.serializer.store(self.catalog_group, "cataloggroup") # the hierarchy is stored as a whole at the end
+        self.catalog_group = CatalogGroup()
+    
+    def closeMapping(self, tag):
+        if self.article2categorygroup.article_id != "" and self.article2categorygroup.cataloggroup_id != "":
+            self.article2categorygroup.save()
+        self.article2categorygroup.article_id = ""
+        self.article2categorygroup.cataloggroup_id = ""
+    
+    def closeCompany(self, tag):
+        if self.be != None and self.be.type == "supplier": # consider suppliers only
+            self.serializer.store(self.be, "be")
+        self.be = BusinessEntity()
+    
+    def closeFeature(self, tag):
+        if self.feature != None and self.product_feature != None:
+            self.product_feature.features.append(self.feature)
+        self.feature = self.obtain(Feature)
+    
+    def closeProductFeature(self, tag):
+        if self.product_feature != None and self.offer != None:
+            self.offer.product_features.append(self.product_feature)
+        self.product_feature = self.obtain(ProductFeature)
+    
+    def closeProduct(self, tag):
+        if self.offer != None:
+            self.storeOffer(self.offer)
+        if self.reuse: # the serializer (or spill file) got a copy or is done with the offer
+            self.recycle(self.offer)
+        else:
+            self.offer = Offer()
+        if self.checkpointer != None:
+            self.checkpointer.articleDone()
+    
+    def obtain(self, cls):
+        """Return a fresh working object of cls, a recycled one if available"""
+        if self.reuse and self.free[cls]:
+            return self.free[cls].pop()
+        return cls()
+    
+    def recycle(self, offer):
+        """Reset offer and keep its feature and media objects for reuse"""
+        for product_feature in offer.product_features:
+            for feature in product_feature.features:
+                feature.reset()
+                self.free[Feature].append(feature)
+            product_feature.reset()
+            self.free[ProductFeature].append(product_feature)
+        for mime in offer.media:
+            mime.reset()
+            self.free[Mime].append(mime)
+        offer.reset()
+    
+    def mimeOwner(self, stack):
+        """Return the object a closed MIME element belongs to"""
         if self.search == "cataloggroup":
-            if close["mime"]:
-                if self.mime != None and self.mime.source != "" and self.catalog_group != None:
-                    self.catalog_group.media.append(self.mime)
-                self.mime = Mime() 
-                
-            # process catalog structure
-            self.processCatalog(subtop, top, tag)
-            # serialize catalog structure when be is processed, not with offers -> is supposed to be more performant
-            if close["catalog"]:
-                if self.catalog_group != None:
-                    self.catalog_hierarchy.append(self.catalog_group)
-                self.catalog_group = CatalogGroup()
-            
-            # mappings to catalog groups
-            if close["mapping"]:
-                if self.article2categorygroup.article_id != "" and self.article2categorygroup.cataloggroup_id != "":
-                    self.article2categorygroup.save()
-                self.article2categorygroup.article_id = ""
-                self.article2categorygroup.cataloggroup_id = ""
-            # process article to catalog group mapping
-            self.processArticle2CatalogGroupMap(subtop, top, tag)
-        
+            return self.catalog_group
         elif self.search == "be":
-            if close["mime"]:
-                if self.mime != None and self.mime.source != "" and self.be != None:
-                    self.be.media.append(self.mime)
-                self.mime = Mime()
-                #print "mime_close for supplier", top, subtop, tag.stack[-3], tag.content
-
-            # business entity tag has been closed immediately before
-            if close["company"]:
-                if self.be != None and self.be.type == "supplier": # consider suppliers only
-                    self.serializer.store(self.be, "be")
-                self.be = BusinessEntity()
-            # process company
-            self.processCompany(subtop, top, tag)
-            
+            return self.be
         elif self.search == "offer":
-            if close["mime"]:
-                if self.mime != None and self.mime.source != "" and self.offer != None:
-                    self.offer.media.append(self.mime)
-                self.mime = Mime()
-            # feature tag has been closed
-            if close["feature"]:
-                if self.feature != None and self.product_feature != None:
-                    self.product_feature.features.append(self.feature)
-                self.feature = Feature()
-            # product feature tag has been closed
-            if close["product_feature"]:
-                if self.product_feature != None and self.offer != None:
-                    self.offer.product_features.append(self.product_feature)
-                self.product_feature = ProductFeature()
-            # product tag has been closed immediately before
-            if close["product"]: # and self.search == "offer":
-                if self.offer != None:
-                    self.offer.cataloggroup_ids = self.article2categorygroup.get(self.offer.id)
-                    self.serializer.store(self.offer, "offer")
-                self.offer = Offer()
-            # process offering
-            self.processOffer(subtop, top, tag)
-        
+            return self.offer
+        # single pass -> innermost enclosing catalog group, company or offer
+        for name in reversed(stack):
+            if name == "CATALOG_STRUCTURE":
+                return self.catalog_group
+            elif name in ["PARTY", "SUPPLIER", "BUYER"]:
+                return self.be
+            elif name == "PRODUCT":
+                return self.offer
+        return None
+    
+    def storeOffer(self, offer):
+        """Hand offer over to serializer, or spill it if catalog group mappings may still follow"""
+        if self.spill != None:
+            cPickle.dump(offer, self.spill, cPickle.HIGHEST_PROTOCOL)
+        else:
+            offer.cataloggroup_ids = self.article2categorygroup.get(offer.id)
+            self.serializer.store(offer, "offer")
+    
+    def replaySpill(self):
+        """Serialize spilled offers with late-bound catalog group ids, yields after every offer"""
+        self.spill.seek(0)
+        spill = self.spill
+        self.spill = None
+        while True:
+            try:
+                offer = cPickle.load(spill)
+            except EOFError:
+                break
+            self.storeOffer(offer)
+            yield
+        spill.close()
+    
+    def processData(self, tag):
+        """Catch information on-the-fly and store as objects"""
+        actions = self.rules.get(tag.stack[-1])
+        if actions == None: # most elements are of no interest
+            return
+        parent = None
+        if len(tag.stack) > 1:
+            parent = tag.stack[-2]
+        for action_parent, action in actions:
+            if action_parent == None or action_parent == parent:
+                action(tag)
     
     class EventHandler(xml.sax.ContentHandler):
-        """Event handler of SAX Parser"""
+        """Event handler of SAX Parser
+        
+        Attributes are only collected for elements with rules in the dispatch table of the
+        current search and text only for those whose actions read it, including the text of
+        descendants without rules (mixed content), other elements are just tracked on the stack."""
         def __init__(self, outer):
             self.outer = outer
+            self.rules = outer.rules
+            self.texts = outer.texts
             self.attrs = {}
             self.stack = []
-            self.close = {"product":False, "company":False, "feature":False, "catalog":False, "mapping":False, "mime":False, "product_feature":False}
-            
-        def falsify(self):
-            """Helper function to set multiple vars to False"""
-            for k in self.close:
-                self.close[k] = False # when True, respective tag has been closed immediately
+            self.collecting = [] # per open element, the text chunks of the innermost rule element collecting it or None
+            self.chunks = None # text chunks collected at the current position, None if not collected
+            self.tag = Tag(self.stack, None, "") # passed to processData for every closing tag
+            self.elements = 0 # closed elements
+            self.matched = 0 # closed elements with rules
         
         def startElement(self, name, attrs):
             """This function gets called on every tag opening event"""
-            self.attrs[name] = attrs
+            name = aliases.get(name, name)
             self.stack.append(name)
-            self.content = ""
+            if name in self.rules:
+                if type(attrs) == list: # ordered attributes from expat
+                    attrs = dict(zip(attrs[::2], attrs[1::2]))
+                self.attrs[name] = attrs
+                if name in self.texts:
+                    self.chunks = []
+                else:
+                    self.chunks = None
+            # elements without rules add their text to the enclosing element
+            self.collecting.append(self.chunks)
             
         def characters(self, ch):
             """This function gets called for each literal content within a tag"""
-            self.content = self.content + " ".join(ch.split())
+            if self.chunks != None:
+                self.chunks.append(ch)
     
         def endElement(self, name):
             """This function gets called on every tag closing event"""
-            # check if offer or businessentity tag has been closed -> if closed, store offer/business entity instance
-            if name in ["PRODUCT", "ARTICLE"]:
-                self.close["product"] = True
-            elif name in ["PARTY", "SUPPLIER", "BUYER"]:
-                self.close["company"] = True
-            elif name == "FEATURE":
-                self.close["feature"] = True
-            elif name == "CATALOG_STRUCTURE":
-                self.close["catalog"] = True
-            elif name in ["PRODUCT_TO_CATALOGGROUP_MAP", "ARTICLE_TO_CATALOGGROUP_MAP"]:
-                self.close["mapping"] = True
-            elif name == "MIME":
-                self.close["mime"] = True
-            elif name in ["PRODUCT_FEATURES", "ARTICLE_FEATURES"]:
-                self.close["product_feature"] = True
-                
-            if type(self.content) == unicode:
-                self.content = self.content.encode("utf-8")
-            tag = Tag(self.stack, self.attrs[name], xml.sax.saxutils.unescape(self.content, {"&szlig;":"ß", "&auml;":"ä", "&ouml;":"ö", "&uuml;":"ü", "&Auml;":"Ä", "&Ouml;":"Ö", "&Uuml;":"Ü"}))
-            self.outer.processData(tag, self.close)
+            name = aliases.get(name, name)
+            self.elements += 1
+            if name in self.rules:
+                self.matched += 1
+                content = ""
+                if self.chunks != None:
+                    # normalize whitespace of the whole text, backends split text into chunks differently
+                    content = " ".join("".join(self.chunks).split())
+                    if type(content) == unicode:
+                        content = content.encode("utf-8")
+                    content = xml.sax.saxutils.unescape(content, {"&szlig;":"ß", "&auml;":"ä", "&ouml;":"ö", "&uuml;":"ü", "&Auml;":"Ä", "&Ouml;":"Ö", "&Uuml;":"Ü"})
+                self.tag.attrs = self.attrs[name]
+                self.tag.content = content
+                self.outer.processData(self.tag)
             self.stack.pop()
-            # set every close event to false
-            self.falsify()
+            self.collecting.pop()
+            if self.collecting:
+                self.chunks = self.collecting[-1]
+            else:
+                self.chunks = None
      
      
     def parse(self, xml_file, search="be"):
-        """Parse given XML file"""
+        """Parse given XML file, a path or a file-like object
+        
+        search is one of "cataloggroup", "be", "offer" or "all", where "all" collects
+        catalog groups, the supplier and offers within a single traversal"""
+        for step in self.feed(xml_file, search):
+            pass
+    
+    def feed(self, xml_file, search="be", block_size=1<<16):
+        """Generator that parses like parse(), feeding the input to the backend block by block
+        
+        It yields after every block (and every replayed offer of a single pass), so that
+        the caller takes what the serializer received so far before the parser continues."""
         self.search = search # search for be or for offer?
+        self.rules = self.compileRules(search)
+        if search == "all":
+            # article to catalog group mappings usually follow the articles -> spill offers and bind ids at the end
+            self.spill = tempfile.TemporaryFile(dir=self.serializer.output_folder or None)
         
         # parse
         now = time.time()
-        print "start parsing %s" % search
-        parser = xml.sax.make_parser()
-        parser.setFeature("http://xml.org/sax/features/external-general-entities", False)
-        parser.setContentHandler(self.EventHandler(self))
-        parser.parse(open(xml_file, "r"))
-        print "finished with %s after %s seconds" %(search, str(time.time()-now))
+        if self.verbose:
+            print "start parsing %s" % search
+        opened = not hasattr(xml_file, "read")
+        if opened:
+            if self.index != None and self.index.path == os.path.abspath(xml_file):
+                xml_file = self.index.stream(search) # without the sections search does not need
+            else:
+                xml_file = sources.openInput(xml_file) # decompressed on a thread if compressed
+        backend = backends.create(self.engine)
+        handler = self.EventHandler(self)
+        feed, close = backend.feeder(handler)
+        try:
+            while True:
+                data = xml_file.read(block_size)
+                if not data:
+                    break
+                feed(data)
+                yield
+            close()
+        finally:
+            if opened:
+                xml_file.close()
+        metrics.record("parse."+search, time.time()-now)
+        metrics.count("elements."+search, handler.elements)
+        metrics.count("processed."+search, handler.matched)
+        if self.verbose:
+            print "finished with %s after %s seconds" %(search, str(time.time()-now))
 
-        if len(self.catalog_hierarchy) > 0 and self.catalog_group != None:
+        if search in ["cataloggroup", "all"] and len(self.catalog_hierarchy) > 0 and self.catalog_group != None:
             self.catalog_hierarchy.append(self.catalog_group)
             self.serializer.store(self.catalog_hierarchy, "catalog")
+        if self.spill != None:
+            for step in self.replaySpill():
+                yield
+        yield
+    
+    def close(self):
+        """Release the article to catalog group mappings"""
+        self.article2categorygroup.close()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pgzip.py
+
+Parallel gzip compression
+
+Written data is cut into blocks that are compressed on a pool of threads
+(zlib releases the GIL while compressing) and appended to the file as
+separate gzip members, in the order they were written. A file of
+concatenated members is a valid gzip file: gzip, zcat and Python's gzip
+module read it as one stream.
+
+Both writers support checkpoints: checkpoint() ends the current member(s),
+syncs the file and returns its size, a file truncated to that size is a
+complete gzip file, and a writer created with that position continues it.
+GzipMemberWriter compresses sequentially like gzip.open.
+"""
+import zlib
+import collections
+from multiprocessing.pool import ThreadPool
+
+from util import reopen, sync
+
+def compressBlock(data, level):
+    """Return data as a complete gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16+zlib.MAX_WBITS) # 16+ -> gzip header and trailer
+    return compressor.compress(data)+compressor.flush()
+
+def openFile(path, position):
+    """Open path for writing, continue it after position bytes unless position is None"""
+    if position == None:
+        return open(path, "wb")
+    return reopen(path, position)
+
+class GzipMemberWriter:
+    """File-like object writing a gzip file with a new member after every checkpoint"""
+    def __init__(self, path, level=6, position=None):
+        """Initialization, level is the zlib compression level"""
+        self.file = openFile(path, position)
+        self.level = level
+        self.compressor = None # of the current member
+        self.members = 0 # members started
+
+    def write(self, data):
+        """Compress and append data"""
+        if not data:
+            return
+        if self.compressor == None:
+            self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16+zlib.MAX_WBITS)
+            self.members += 1
+        self.file.write(self.compressor.compress(data))
+
+    def finish(self):
+        """End the current member"""
+        if self.compressor != None:
+            self.file.write(self.compressor.flush())
+            self.compressor = None
+
+    def checkpoint(self):
+        """End the current member, sync the file and return its size"""
+        self.finish()
+        return sync(self.file)
+
+    def close(self):
+        """End the current member and close the file"""
+        self.finish()
+        if self.members == 0 and self.file.tell() == 0: # an empty file is no valid gzip file
+            self.file.write(compressBlock("", self.level))
+        self.file.close()
+
+class ParallelGzipWriter:
+    """File-like object writing a multi-member gzip file"""
+    def __init__(self, path, level=6, block_size=1<<20, threads=2, position=None):
+        """Initialization
+
+        level is the zlib compression level, block_size the amount of uncompressed data per member"""
+        self.file = openFile(path, position)
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads
+        self.window = threads*2 # max. number of blocks in flight
+        self.buffer = []
+        self.buffered = 0
+        self.pending = collections.deque()
+        self.members = 0 # members written
+        self.pool = ThreadPool(threads)
+
+    def write(self, data):
+        """Append data, compress it once a block is full"""
+        if not data:
+            return
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered data over to the pool as a block of its own"""
+        if self.buffered > 0:
+            self.pending.append(self.pool.apply_async(compressBlock, ("".join(self.buffer), self.level)))
+            self.buffer = []
+            self.buffered = 0
+        while self.pending and (len(self.pending) > self.window or self.pending[0].ready()):
+            self.file.write(self.pending.popleft().get())
+            self.members += 1
+
+    def drain(self):
+        """Compress remaining data and write all members"""
+        self.flush()
+        while self.pending:
+            self.file.write(self.pending.popleft().get())
+            self.members += 1
+
+    def checkpoint(self):
+        """Write all members, sync the file and return its size"""
+        self.drain()
+        return sync(self.file)
+
+    def close(self):
+        """Compress remaining data, write all members and close the file"""
+        self.drain()
+        if self.members == 0 and self.file.tell() == 0: # an empty file is no valid gzip file
+            self.file.write(compressBlock("", self.level))
+        self.pool.close()
+        self.pool.join()
+        self.file.close()
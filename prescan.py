@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""prescan.py
+
+Byte-offset index of a BMEcat file
+
+A byte scan over the input, without tokenizing it, finds the sections of a
+BMEcat file: the HEADER (catalog settings, supplier and parties), the
+CATALOG_GROUP_SYSTEM, the sequence of <ARTICLE>/<PRODUCT> elements and the
+sequence of article to catalog group mappings, and the byte range of every
+article by its SUPPLIER_AID/SUPPLIER_PID. The index is kept in the sidecar
+file <input>.prescan and reused as long as size and modification time of the
+input match, or its SHA-1 hash if only the modification time changed.
+
+Every pass of the parser then reads the input with the sections it does not
+need cut out, e.g. the supplier pass reads little more than the header.
+Sections are only cut if they do not overlap with other sections. As in
+splitter.py, tags are found by a plain byte scan, so the input must not
+contain these tags inside comments or CDATA sections.
+
+Usage: python prescan.py <BMEcat file> [SUPPLIER_AID ...]
+Without article ids the sections are printed, otherwise the articles.
+"""
+import os
+import re
+import sys
+import time
+import mmap
+import hashlib
+import cPickle
+from xml.sax.saxutils import unescape
+
+from splitter import SegmentStream
+import metrics
+
+version = 1 # of the sidecar format
+
+tags = re.compile(r"<(/?)(HEADER|CATALOG_GROUP_SYSTEM|ARTICLE|PRODUCT|ARTICLE_TO_CATALOGGROUP_MAP|PRODUCT_TO_CATALOGGROUP_MAP|SUPPLIER_AID|SUPPLIER_PID)[\s/>]")
+sections = {"HEADER":"header", "CATALOG_GROUP_SYSTEM":"groups", "ARTICLE":"articles", "PRODUCT":"articles",
+            "ARTICLE_TO_CATALOGGROUP_MAP":"mappings", "PRODUCT_TO_CATALOGGROUP_MAP":"mappings"}
+
+# sections read by each search of the parser, the others are cut out
+needs = {"cataloggroup":["header", "groups", "mappings"], "be":["header"], "offer":["header", "articles"],
+         "all":["header", "groups", "articles", "mappings"]}
+
+class Index:
+    """Sections and articles of a BMEcat file by byte offsets"""
+    def __init__(self, path, state=None):
+        """Initialization, scans the file unless state is the saved state of an index"""
+        if state != None:
+            self.__dict__.update(state)
+            return
+        self.path = os.path.abspath(path)
+        self.size = os.path.getsize(path)
+        self.mtime = os.path.getmtime(path)
+        self.sha1 = None
+        self.sections = {} # name -> (start, end)
+        self.articles = {} # SUPPLIER_AID -> (start, end) of the first article with it
+        self.count = 0 # articles
+        if self.size > 0:
+            self.scan()
+
+    def scan(self):
+        """Find sections and articles"""
+        file = open(self.path, "rb")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sha1 = hashlib.sha1(data).hexdigest()
+        opened = {} # section -> start of the element
+        article = None # start of the open article
+        article_id = None
+        for match in tags.finditer(data):
+            closing, name = match.groups()
+            if name in ["SUPPLIER_AID", "SUPPLIER_PID"]:
+                if not closing and article != None and article_id == None:
+                    start = data.find(">", match.start())+1
+                    article_id = unescape(data[start:data.find("<", start)]).strip()
+                continue
+            section = sections[name]
+            if not closing:
+                if section == "articles":
+                    article, article_id = match.start(), None
+                else:
+                    opened.setdefault(section, match.start())
+                continue
+            end = data.find(">", match.start())+1
+            if section == "articles":
+                if article == None:
+                    continue
+                start, article = article, None
+                self.count += 1
+                if article_id != None and article_id not in self.articles:
+                    self.articles[article_id] = (start, end)
+            elif section in opened:
+                start = opened.pop(section)
+            else:
+                continue
+            if section in self.sections:
+                start = min(start, self.sections[section][0])
+            self.sections[section] = (start, end)
+        data.close()
+        file.close()
+
+    def valid(self, path):
+        """True if the index still describes the file at path, by size and modification time or by hash"""
+        if os.path.abspath(path) != self.path or os.path.getsize(path) != self.size:
+            return False
+        if os.path.getmtime(path) == self.mtime:
+            return True
+        if self.sha1 == None:
+            return self.size == 0
+        file = open(path, "rb")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        sha1 = hashlib.sha1(data).hexdigest()
+        data.close()
+        file.close()
+        if sha1 == self.sha1:
+            self.mtime = os.path.getmtime(path)
+            return True
+        return False
+
+    def skipped(self, search):
+        """Sorted byte ranges search does not need, sections overlapping with others are kept"""
+        ranges = []
+        for name, (start, end) in self.sections.items():
+            if name in needs[search]:
+                continue
+            overlaps = [other for other, (other_start, other_end) in self.sections.items() if other != name and other_start < end and start < other_end]
+            if not overlaps:
+                ranges.append((start, end))
+        ranges.sort()
+        return ranges
+
+    def segments(self, ranges):
+        """Byte ranges of the file without the sorted, disjoint ranges"""
+        segments = []
+        offset = 0
+        for start, end in ranges:
+            if start > offset:
+                segments.append((offset, start))
+            offset = end
+        if offset < self.size:
+            segments.append((offset, self.size))
+        return segments
+
+    def stream(self, search):
+        """Stream of the file with the sections search does not need cut out"""
+        ranges = self.skipped(search)
+        metrics.count("prescan.skipped."+search, sum([end-start for start, end in ranges]))
+        return SegmentStream(self.path, self.segments(ranges))
+
+    def article(self, article_id):
+        """Stream of the file with only the article of article_id among the articles, None if there is no such article"""
+        if article_id not in self.articles:
+            return None
+        start, end = self.sections["articles"]
+        if [other for other, (other_start, other_end) in self.sections.items() if other != "articles" and other_start < end and start < other_end]:
+            return None # other sections between the articles
+        article_start, article_end = self.articles[article_id]
+        return SegmentStream(self.path, self.segments(sorted(self.skipped("offer")+[(start, article_start), (article_end, end)])))
+
+def sidecar(path):
+    """Path of the index file of path"""
+    return path+".prescan"
+
+def load(path):
+    """Return the index of the file at path, from its sidecar file if it is still valid, else scanned and saved"""
+    now = time.time()
+    index = None
+    if os.path.exists(sidecar(path)):
+        try:
+            state = cPickle.load(open(sidecar(path), "rb"))
+        except Exception: # broken sidecar file
+            state = {}
+        if state.get("version") == version:
+            index = Index(path, state["index"])
+            if not index.valid(path):
+                index = None
+    if index == None:
+        index = Index(path)
+        try:
+            file = open(sidecar(path)+".tmp", "wb")
+            cPickle.dump({"version":version, "index":index.__dict__}, file, cPickle.HIGHEST_PROTOCOL)
+            file.close()
+            os.rename(sidecar(path)+".tmp", sidecar(path))
+        except (IOError, OSError), e:
+            print "NOTE: the index could not be saved to %s (%s)" % (sidecar(path), e)
+        metrics.count("prescan.scanned")
+    metrics.record("prescan", time.time()-now)
+    return index
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "USAGE"
+        print "\tpython prescan.py <BMEcat file> [SUPPLIER_AID ...]"
+        sys.exit(1)
+    index = load(sys.argv[1])
+    if len(sys.argv) == 2:
+        for name, (start, end) in sorted(index.sections.items(), key=lambda item: item[1]):
+            print "%s\t%d\t%d" % (name, start, end)
+        print "%d articles" % index.count
+    for article_id in sys.argv[2:]:
+        if article_id not in index.articles:
+            sys.stderr.write("%s not found\n" % article_id)
+            continue
+        start, end = index.articles[article_id]
+        file = open(index.path, "rb")
+        file.seek(start)
+        print file.read(end-start)
+        file.close()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""rdfxml.py
+
+Direct RDF/XML writer for triple tuples
+
+Triples are expected in the order the serializer creates them, i.e. top-down
+from the offer via type and quantity node and product to the product model.
+Resources that are described in the same document and referenced exactly once
+are nested into the referencing property element, anything else is written
+as a node element of its own. No graph is built and no subjects are sorted.
+"""
+import re
+
+from ntriples import URI
+from util import memoize
+
+rdf = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+rdf_type = rdf+"type"
+rdfs = "http://www.w3.org/2000/01/rdf-schema#"
+
+ncname = re.compile(r"[A-Za-z_][A-Za-z0-9_.-]*$")
+
+def utf8(value):
+    """Return value as UTF-8 encoded string"""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+def escapeText(value):
+    """Escape character data"""
+    return utf8(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def escapeAttribute(value):
+    """Escape attribute values"""
+    return escapeText(value).replace("\"", "&quot;").replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+
+@memoize() # predicates and classes repeat in every document
+def splitURI(uri):
+    """Split uri into namespace and local name, local name must be a NCName"""
+    start = max(uri.rfind("#"), uri.rfind("/"))+1
+    for i in range(start, len(uri)):
+        if ncname.match(uri, i):
+            return uri[:i], uri[i:]
+    return None, None
+
+class RDFXMLWriter:
+    """Writes RDF/XML node elements to a stream"""
+    def __init__(self, stream, bindings, triples=[]):
+        """Initialization, writes the document header
+
+        bindings is a list of (prefix, namespace) tuples declared on rdf:RDF, namespaces
+        of predicates and types in triples get declared there as well"""
+        self.stream = stream
+        self.prefixes = {} # namespace -> prefix
+        self.counter = 0 # generated prefixes ns1, ns2, ...
+        header = ["<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<rdf:RDF\n"]
+        for prefix, namespace in [("rdf", rdf), ("rdfs", rdfs)]+bindings:
+            namespace = str(namespace)
+            if namespace in self.prefixes:
+                continue
+            self.prefixes[namespace] = prefix
+            header.append("  xmlns:%s=\"%s\"\n" % (prefix, escapeAttribute(namespace)))
+        for subject, predicate, object, datatype, language in triples:
+            for uri in [predicate, predicate == rdf_type and isinstance(object, URI) and object or None]:
+                if uri:
+                    namespace, local = splitURI(uri)
+                    if namespace != None and namespace not in self.prefixes:
+                        self.counter += 1
+                        self.prefixes[namespace] = "ns%d" % self.counter
+                        header.append("  xmlns:ns%d=\"%s\"\n" % (self.counter, escapeAttribute(namespace)))
+        header.append(">\n")
+        self.stream.write("".join(header))
+
+    def qname(self, uri):
+        """Return qualified name and, for undeclared namespaces, a local namespace declaration"""
+        namespace, local = splitURI(uri)
+        if namespace == None:
+            return None, ""
+        if namespace in self.prefixes:
+            return self.prefixes[namespace]+":"+local, ""
+        self.counter += 1
+        prefix = "ns%d" % self.counter
+        while prefix in self.prefixes.values():
+            self.counter += 1
+            prefix = "ns%d" % self.counter
+        return prefix+":"+local, " xmlns:%s=\"%s\"" % (prefix, escapeAttribute(namespace))
+
+    def write(self, triples, nested=True):
+        """Write triple tuples grouped by subject"""
+        subjects = [] # in order of first appearance
+        properties = {} # subject -> list of (predicate, object, datatype, language)
+        references = {} # resource -> number of references as object
+        seen = set()
+        for t in triples:
+            if t in seen:
+                continue
+            seen.add(t)
+            subject, predicate, object, datatype, language = t
+            if subject not in properties:
+                subjects.append(subject)
+                properties[subject] = []
+            properties[subject].append((predicate, object, datatype, language))
+            if nested and isinstance(object, URI):
+                references[object] = references.get(object, 0)+1
+
+        out = []
+        written = set()
+        for subject in subjects: # roots first, i.e. resources not referenced exactly once
+            if subject not in written and references.get(subject, 0) != 1:
+                self.node(out, subject, properties, references, written, 1)
+        for subject in subjects: # remaining resources are part of a reference cycle
+            if subject not in written:
+                self.node(out, subject, properties, references, written, 1)
+        self.stream.write("".join(out))
+
+    def node(self, out, subject, properties, references, written, depth):
+        """Append node element of subject to out"""
+        written.add(subject)
+        indent = "  "*depth
+        element, declaration = None, ""
+        typed = None
+        for p in properties[subject]: # first rdf:type becomes the element name
+            if p[0] == rdf_type and isinstance(p[1], URI):
+                element, declaration = self.qname(p[1])
+                if element != None:
+                    typed = p
+                    break
+        if element == None:
+            element, declaration = "rdf:Description", ""
+        out.append("%s<%s%s rdf:about=\"%s\">\n" % (indent, element, declaration, escapeAttribute(subject)))
+        for p in properties[subject]:
+            if p is typed:
+                continue
+            predicate, object, datatype, language = p
+            name, declaration = self.qname(predicate)
+            if name == None:
+                raise ValueError("Can't split predicate %s into namespace and local name" % predicate)
+            if isinstance(object, URI):
+                if references.get(object, 0) == 1 and object in properties and object not in written:
+                    out.append("%s  <%s%s>\n" % (indent, name, declaration))
+                    self.node(out, object, properties, references, written, depth+2)
+                    out.append("%s  </%s>\n" % (indent, name))
+                else:
+                    out.append("%s  <%s%s rdf:resource=\"%s\"/>\n" % (indent, name, declaration, escapeAttribute(object)))
+            else:
+                attributes = ""
+                if language:
+                    attributes = " xml:lang=\"%s\"" % escapeAttribute(language)
+                elif language == None and datatype != None:
+                    attributes = " rdf:datatype=\"%s\"" % escapeAttribute(datatype)
+                out.append("%s  <%s%s%s>%s</%s>\n" % (indent, name, declaration, attributes, escapeText(object), name))
+        out.append("%s</%s>\n" % (indent, element))
+
+    def close(self):
+        """Write the document footer"""
+        self.stream.write("</rdf:RDF>\n")
+
+class StringStream:
+    """Collects written strings"""
+    def __init__(self):
+        """Initialization"""
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+def serialize(triples, bindings, nested=True):
+    """Serialize a list of triple tuples as RDF/XML document"""
+    stream = StringStream()
+    writer = RDFXMLWriter(stream, bindings, triples)
+    writer.write(triples, nested)
+    writer.close()
+    return stream.getvalue()
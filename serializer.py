@@ -11,12 +11,26 @@ Copyright (c) 2011 Universitaet der Bundeswehr. All rights reserved.
 Author: Alex Stolz
 Organization: E-Business and Web Science Research Group
 """
-from rdflib import *
+from rdflib import Graph, URIRef, Literal
 import os
 import re
+import time
 import gzip
 
 from util import *
+import ntriples
+import rdfxml
+import packs
+import pgzip
+import sinks
+import writebehind
+import metrics
+import sitemaps
+from sitemaps import SitemapWriter
+import incremental
+from incremental import FingerprintStore
+from features import FeatureRegistry
+from ntriples import URI, Namespace
 
 # namespaces
 owl = "http://www.w3.org/2002/07/owl#"
@@ -25,7 +39,9 @@ gr = "http://purl.org/goodrelations/v1#"
 foaf = "http://xmlns.com/foaf/0.1/"
 vcard = "http://www.w3.org/2006/vcard/ns#"
 xsd = "http://www.w3.org/2001/XMLSchema#"
+rdf = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
 
+RDF = Namespace(rdf)
 OWL = Namespace(owl)
 RDFS = Namespace(rdfs)
 GR = Namespace(gr)
@@ -33,10 +49,54 @@ FOAF = Namespace(foaf)
 VCARD = Namespace(vcard)
 XSD = Namespace(xsd)
 
+rdflib_terms = BoundedCache() # predicates, classes and short literals -> rdflib terms
+
+def rdflibTerm(object, datatype, language):
+    """Convert the object of a triple tuple to an rdflib term"""
+    if isinstance(object, URI):
+        return URIRef(object)
+    object = Literal(object)
+    if language != None:
+        object.language = language
+    elif datatype != None:
+        object.datatype = URIRef(datatype)
+    return object
+
+def rdflibTriple(subject, predicate, object, datatype, language):
+    """Convert a triple tuple to rdflib terms"""
+    p = rdflib_terms.get(predicate)
+    if p == None:
+        p = URIRef(predicate)
+        rdflib_terms.set(predicate, p)
+    if predicate == RDF.type or (len(object) <= 16 and (datatype != None or language != None)): # repetitive objects
+        o = rdflib_terms.get((object, datatype, language))
+        if o == None:
+            o = rdflibTerm(object, datatype, language)
+            rdflib_terms.set((object, datatype, language), o)
+    else:
+        o = rdflibTerm(object, datatype, language)
+    return (URIRef(subject), p, o)
+
 class Serializer:
     """Serializer class"""
-    def __init__(self, output_folder="", base_uri="", catalog=None, lang="", image_uri="", model_only=False, pattern=""):
-        """Initialization"""
+    def __init__(self, output_folder="", base_uri="", catalog=None, lang="", image_uri="", model_only=False, pattern="", jobs=1, worker=False, nt_engine="direct", xml_engine="direct", pack=False, incremental=False,
+                 dump_level=9, dump_block_size=1<<20, dump_threads=1, formats=[], write_threads=0, write_queue=256, fsync="none",
+                 checkpoints=False, resume=None):
+        """Initialization
+        
+        jobs > 1 renders offers on a pool of worker processes, worker=True creates
+        such a worker-side serializer that writes offer documents only.
+        nt_engine and xml_engine select how N-Triples and RDF/XML documents are produced,
+        "direct" (ntriples and rdfxml modules) or "rdflib". pack=True appends offer
+        documents to pack files (see packs module) instead of writing a file per offer.
+        incremental=True only renders offers that changed since the previous run into output_folder.
+        dump_level is the gzip compression level of the dump, dump_threads > 1 compresses blocks of
+        dump_block_size bytes on as many threads into a multi-member gzip file.
+        formats are additional dump formats, see sinks.formats.
+        write_threads > 0 writes offer documents on as many threads behind a queue of write_queue
+        documents, fsync is the policy of writebehind.policies for all documents.
+        checkpoints=True writes dumps that checkpoint() can cut at a consistent point, resume is the
+        state returned by checkpoint() in an interrupted run whose output is continued."""
 
         self.be_about = None
         self.lang = lang
@@ -46,18 +106,45 @@ class Serializer:
         self.image_uri = image_uri
         self.model_only = model_only
         self.pattern = pattern
+        self.jobs = jobs
+        self.worker = worker
+        self.nt_engine = nt_engine
+        self.xml_engine = xml_engine
+        self.pack = pack
+        self.packer = None
+        self.incremental = incremental
+        self.fingerprints = None # fingerprint store of incremental runs
+        self.previous_packs = None # pack files of the previous incremental run
+        self.pool = None # created with the first offer, when the business entity is known
+        self.features = None # feature property registry writing features.rdf
+        self.offer_features = None # feature property definitions of the current offer, if collected
+        self.formats = formats
+        self.sinks = [] # additional dump formats, in the order of formats
+        self.write_threads = write_threads
+        self.write_queue = write_queue
+        self.fsync = fsync
+        self.writer = None # write-behind queue of offer documents
+        self.write_errors = [] # (path, error) of documents the writer failed to write, reported at the end of the run
+        self.checkpoints = checkpoints or resume != None
         
         self.offerfile_id = "offer"
         if self.model_only:
             self.offerfile_id = "model"
-        self.feature_graph = Graph()
-        self.feature_graph.bind("owl", owl)
         while len(self.output_folder)>0 and self.output_folder[-1] == "/": # remove trailing slashes
             self.output_folder = self.output_folder[:-1]
         while len(self.base_uri)>0 and self.base_uri[-1] == "/":
             self.base_uri = self.base_uri[:-1]
         while len(self.image_uri)>0 and self.image_uri[-1] == "/":
             self.image_uri = self.image_uri[:-1]
+        # namespaces and terms shared by all offers
+        self.catalog_ns = self.base_uri+"/rdf/catalog.rdf#"
+        self.features_ns = self.base_uri+"/rdf/features.rdf#"
+        self.offer_bindings = [("owl", owl), ("gr", gr), ("cat", self.catalog_ns), ("prop", self.features_ns), ("foaf", foaf)]
+        self.group_classes = BoundedCache() # catalog group id -> URI of its generic class
+        self.feature_properties = BoundedCache() # (system id, feature identifier) -> URI of the custom property
+        if self.worker: # output files are owned by the parent process, sinks only render chunks
+            self.sinks = [sinks.create(format, None) for format in self.formats]
+            return
             
         # try mkdir output folder
         try:
@@ -67,74 +154,262 @@ class Serializer:
             pass
         
         # serialize objects
-        self.dump = gzip.open(output_folder+"/dump/dump.nt.gz", "wb")
-        self.feature_file = open(output_folder+"/rdf/features.rdf", "w")
-        self.sitemap = open(output_folder+"/sitemap.xml", "w")
+        if resume == None:
+            resume = {"dump":None, "sinks":[None]*len(self.formats), "features":None, "lastmod":sitemaps.now(), "sitemap":None, "packer":None}
+        else:
+            self.be_about = resume["be_about"]
+        self.dump = self.openDump("nt", dump_level, dump_block_size, dump_threads, resume["dump"])
+        for format, state in zip(self.formats, resume["sinks"]):
+            extension = sinks.sinks[format].extension
+            self.sinks.append(sinks.create(format, self.openDump(extension, dump_level, dump_block_size, dump_threads, state and state["position"]), state=state))
+        if resume["features"] == None:
+            features_file = open(self.output_folder+"/rdf/features.rdf", "w")
+        else:
+            features_file = reopen(self.output_folder+"/rdf/features.rdf", resume["features"]["position"])
+        self.features = FeatureRegistry(features_file, self.dump, self.sinks, self.features_ns[:-1], resume["features"])
+        self.lastmod = resume["lastmod"] # of documents changed in this run
+        self.sitemap = SitemapWriter(self.output_folder, self.base_uri, state=resume["sitemap"])
+        if self.incremental:
+            self.fingerprints = FingerprintStore(self.output_folder+"/.fingerprints")
+            if self.pack:
+                self.previous_packs = packs.retire(self.output_folder+"/rdf", self.offerfile_id+"s")
+        if self.pack:
+            self.packer = packs.PackWriter(self.output_folder+"/rdf", self.offerfile_id+"s", state=resume["packer"])
+        elif self.write_threads > 0:
+            self.writer = writebehind.DocumentWriter(self.write_threads, self.write_queue, self.fsync)
             
-    def __del__(self):
-        """Destruction"""
-        self.feature_file.write(self.feature_graph.serialize(format="pretty-xml"))
-        self.dump.write(self.feature_graph.serialize(format="nt"))
+    def openDump(self, extension, level, block_size, threads, position=None):
+        """Open dump/dump.<extension>.gz for writing, continue it after position bytes unless position is None"""
+        if threads > 1:
+            dump = pgzip.ParallelGzipWriter("%s/dump/dump.%s.gz" % (self.output_folder, extension), level, block_size, threads, position)
+        elif self.checkpoints:
+            dump = pgzip.GzipMemberWriter("%s/dump/dump.%s.gz" % (self.output_folder, extension), level, position)
+        else:
+            dump = gzip.open("%s/dump/dump.%s.gz" % (self.output_folder, extension), "wb", level)
+        if metrics.enabled: # uncompressed bytes and time of all dump writes
+            dump = metrics.MeteredFile(dump, "dump."+extension)
+        return dump
+    
+    def settings(self):
+        """Constructor arguments needed to set up an equivalent serializer in a worker process"""
+        return {"output_folder":self.output_folder, "base_uri":self.base_uri, "catalog":self.catalog, "lang":self.lang,
+                "image_uri":self.image_uri, "model_only":self.model_only, "pattern":self.pattern, "nt_engine":self.nt_engine, "xml_engine":self.xml_engine, "pack":self.pack, "incremental":self.incremental,
+                "formats":self.formats, "write_threads":self.write_threads, "write_queue":self.write_queue, "fsync":self.fsync}
+        
+    def checkpoint(self):
+        """Finish pending offers, sync all output files and return the state to continue from, see resume"""
+        if self.pool != None:
+            self.pool.drain()
+        if self.writer != None:
+            self.writer.drain()
+        state = {"dump":self.dump.checkpoint(), "sinks":[sink.checkpoint() for sink in self.sinks], "features":self.features.checkpoint(),
+                 "lastmod":self.lastmod, "sitemap":self.sitemap.checkpoint(), "packer":None, "be_about":self.be_about}
+        if self.packer != None:
+            state["packer"] = self.packer.checkpoint()
+        return state
+    
+    def configuration(self):
+        """Everything besides the offer itself that influences its serialization"""
+        return (self.settings(), self.catalog, self.be_about)
+        
+    def close(self):
+        """Wait for pending offers of the worker pool, finish pack files, remove vanished offers and close all output files"""
+        if self.pool != None:
+            self.pool.close()
+            self.pool = None
+        features_lastmod = self.documentLastmod("features.rdf", sorted(self.features.seen))
+        if self.fingerprints != None:
+            for name in self.fingerprints.removed():
+                if os.path.exists("%s/rdf/%s" % (self.output_folder, name)):
+                    os.remove("%s/rdf/%s" % (self.output_folder, name))
+                self.fingerprints.remove(name)
+            self.fingerprints.close()
+            self.fingerprints = None
+        if self.previous_packs != None:
+            self.previous_packs.remove()
+            self.previous_packs = None
+        if self.packer != None:
+            self.packer.close()
+            self.packer = None
+        self.features.close()
+        self.dump.close()
+        for sink in self.sinks:
+            sink.close()
+            metrics.countFile("dump.%s.gz" % sink.extension, "%s/dump/dump.%s.gz" % (self.output_folder, sink.extension))
+        self.sitemap.add("rdf/features.rdf", features_lastmod)
+        self.sitemap.close()
+        metrics.countFile("dump.nt.gz", self.output_folder+"/dump/dump.nt.gz")
+        metrics.countFile("features.rdf", self.output_folder+"/rdf/features.rdf")
+        metrics.countFile("sitemap.xml", self.output_folder+"/sitemap.xml")
+        if self.writer != None:
+            self.write_errors.extend(self.writer.finish())
+            self.writer = None
         
     def store(self, object, object_type):
-        """Write serialization variants to files"""
+        """Write serialization variants to files
+        
+        object_type is "offer", "be" or "catalog", single catalog groups ("cataloggroup") are
+        written with the whole hierarchy"""
         if object_type == "offer":
-            file = open("%s/rdf/%s_%s.rdf" % (self.output_folder, self.offerfile_id, object.id), "w")
-            file.write(self.serializeOffer(object, rdf_format="pretty-xml"))
-            self.dump.write(self.serializeOffer(object, rdf_format="nt"))
+            metrics.count("offers")
+            if metrics.enabled:
+                now = time.time()
+                metrics.count("features", sum([len(product_feature.features) for product_feature in object.product_features]))
+            name = self.documentName(object)
+            fingerprint = None
+            if self.jobs > 1 and self.pool == None:
+                import parallel
+                self.pool = parallel.OfferPool(self, self.jobs)
+            if self.fingerprints != None:
+                fingerprint = self.fingerprints.fingerprint(object, self.configuration())
+                cached = self.fingerprints.unchanged(name, fingerprint)
+                if cached != None and self.keepDocument(name): # skip rendering
+                    nt, features, chunks = cached
+                    if self.pool != None:
+                        self.pool.append((None, nt, features, chunks, None), name, fingerprint)
+                    else:
+                        self.finishOffer(name, nt, fingerprint, features, chunks)
+                    return
+            if self.pool != None:
+                self.pool.submit(object, name, fingerprint)
+            elif self.fingerprints != None: # collect the feature properties of this offer
+                self.offer_features = []
+                nt, chunks = self.storeOffer(object)
+                features = self.offer_features
+                self.offer_features = None
+                self.finishOffer(name, nt, fingerprint, features, chunks)
+            else:
+                nt, chunks = self.storeOffer(object)
+                self.finishOffer(name, nt, chunks=chunks)
+            if metrics.enabled and self.pool == None: # rendered by a worker otherwise
+                metrics.observe("latency.offer", time.time()-now)
             
         elif object_type == "be":
-            import datetime
-            file = open(self.output_folder+"/rdf/company.rdf", "w")
-            file.write(self.serializeBusinessEntity(object, rdf_format="pretty-xml"))
-            self.dump.write(self.serializeBusinessEntity(object, rdf_format="nt"))
-            self.sitemap.write("""<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:sc="http://sw.deri.org/2007/07/sitemapextension/scschema.xsd">
-    <sc:dataset>
-        <sc:datasetLabel>Semantic Web dataset of %(legalname)s</sc:datasetLabel>
-        <sc:linkedDataPrefix slicing="subject-object">%(baseuri)s/</sc:linkedDataPrefix>
-        <sc:dataDumpLocation>%(baseuri)s/dump/dump.nt.gz</sc:dataDumpLocation>
-        <lastmod>%(lastmod)s</lastmod>
-        <changefreq>weekly</changefreq>
-    </sc:dataset>
-</urlset>""" % ({"baseuri":self.base_uri, "legalname":object.legalName, "lastmod":datetime.datetime.strftime(datetime.datetime.now(), "%Y-%m-%dT%H:%M:%SZ")}))
+            triples, bindings = self.businessEntityTriples(object)
+            document = self.render(triples, bindings, "pretty-xml")
+            writebehind.writeFile(self.output_folder+"/rdf/company.rdf", document, self.fsync)
+            metrics.count("bytes.company.rdf", len(document))
+            self.dump.write(self.render(triples, bindings, "nt"))
+            self.appendChunks(self.renderChunks(triples, self.base_uri+"/rdf/company.rdf"))
+            self.sitemap.dataset("Semantic Web dataset of %s" % object.legalName)
+            self.sitemap.add("rdf/company.rdf", self.documentLastmod("company.rdf", document))
             
         elif object_type == "catalog":
-            file = open(self.output_folder+"/rdf/catalog.rdf", "w")
-            file.write(self.serializeCatalogStructure(object, rdf_format="pretty-xml"))
-            self.dump.write(self.serializeCatalogStructure(object, rdf_format="nt"))  
+            triples, bindings = self.catalogStructureTriples(object)
+            document = self.render(triples, bindings, "pretty-xml", nested=False)
+            writebehind.writeFile(self.output_folder+"/rdf/catalog.rdf", document, self.fsync)
+            metrics.count("bytes.catalog.rdf", len(document))
+            metrics.count("catalog groups", len(object))
+            self.dump.write(self.render(triples, bindings, "nt"))
+            self.appendChunks(self.renderChunks(triples, self.base_uri+"/rdf/catalog.rdf"))
+            self.sitemap.add("rdf/catalog.rdf", self.documentLastmod("catalog.rdf", document))
+    
+    def storeOffer(self, offer):
+        """Write the offer document, return its N-Triples for the dump and its chunks of the additional dump formats"""
+        name = self.documentName(offer)
+        triples, bindings = self.offerTriples(offer)
+        self.writeDocument(name, self.render(triples, bindings, "pretty-xml"))
+        return self.render(triples, bindings, "nt"), self.renderChunks(triples, self.base_uri+"/rdf/"+name)
+    
+    def renderChunks(self, triples, graph):
+        """Chunks of the additional dump formats, graph is the URI of the document the triples belong to"""
+        return [sink.render(triples, graph) for sink in self.sinks]
+    
+    def appendChunks(self, chunks):
+        """Append rendered chunks to the additional dump formats"""
+        for sink, chunk in zip(self.sinks, chunks or []):
+            sink.append(chunk)
+    
+    def finishOffer(self, name, nt, fingerprint=None, features=[], chunks=None):
+        """Append offer N-Triples and chunks to the dumps, list the document in the sitemap and remember it for the next incremental run
+        
+        features are the definitions of custom feature properties used by the offer"""
+        self.dump.write(nt)
+        self.appendChunks(chunks)
+        for definition in features:
+            self.features.define(*definition)
+        lastmod = self.lastmod
+        if self.fingerprints != None:
+            lastmod = self.fingerprints.update(name, fingerprint, nt, features, chunks, lastmod)
+        self.sitemap.add("rdf/"+name, lastmod)
+    
+    def documentLastmod(self, name, content):
+        """lastmod of a document that is rewritten in every run, kept from the previous incremental run if content did not change"""
+        if self.fingerprints == None:
+            return self.lastmod
+        return self.fingerprints.modified(name, incremental.fingerprint(content), self.lastmod)
+    
+    def keepDocument(self, name):
+        """Keep the unchanged document of the previous run, False if it is missing"""
+        if self.packer != None:
+            document = None
+            if self.previous_packs != None:
+                document = self.previous_packs.get(name)
+            if document == None:
+                return False
+            self.packer.add(name, document)
+            return True
+        return os.path.exists("%s/rdf/%s" % (self.output_folder, name))
+    
+    def documentName(self, offer):
+        """File name of the offer document"""
+        return "%s_%s.rdf" % (self.offerfile_id, offer.id)
+    
+    def writeDocument(self, name, document):
+        """Write an offer document to the rdf folder, queue it for the write-behind threads or append it to the pack files"""
+        metrics.count("bytes.documents", len(document))
+        if self.packer != None:
+            self.packer.add(name, document)
+        elif self.writer != None:
+            self.writer.put("%s/rdf/%s" % (self.output_folder, name), document)
+        else:
+            writebehind.writeFile("%s/rdf/%s" % (self.output_folder, name), document, self.fsync)
     
     def triple(self, g, subject, predicate, object, datatype=None, language=None):
-        """Create a triple in graph g"""
+        """Append a triple tuple to the list g
+        
+        object is a URI or a literal string"""
         if None in [subject, predicate, object]: # NoneType object, don't create triple
             return
-        elif type(object) == Literal:
-            # return if content is empty
-            if object.title() == "":
-                return
-            # check if language tag is given
-            if language != None:
-                object.language = language
-            # if no language tag is given, check if datatype is available
-            elif datatype != None:
-                object.datatype = datatype
-        elif type(object) == URIRef:
-            if object.title() == "":
-                return
-        else: # neither Literal nor URIRef
+        elif not isinstance(object, basestring): # neither literal nor URI
             print "WARNING: triple(%s, %s, %s) not created - object type neither Literal nor URIRef" % (str(subject), str(predicate), str(object))
             return
-        # create triple in graph g
-        g.add((subject, predicate, object))
+        # return if content is empty
+        elif object == "":
+            return
+        if isinstance(object, URI):
+            datatype = language = None
+        elif language != None: # language tag takes precedence over datatype
+            datatype = None
+        # create triple
+        g.append((subject, predicate, object, datatype, language))
+    
+    def render(self, triples, bindings, rdf_format, nested=True):
+        """Serialize a list of triple tuples
         
-    def serializeCatalogStructure(self, catalog_hierarchy, rdf_format):
-        """Serialize the catalog"""
+        nested=False writes a flat list of descriptions with the direct RDF/XML writer"""
+        metrics.count("triples."+rdf_format, len(triples))
+        if rdf_format == "nt" and self.nt_engine == "direct":
+            return ntriples.serialize(triples)
+        if rdf_format == "pretty-xml" and self.xml_engine == "direct":
+            return rdfxml.serialize(triples, bindings, nested)
         g = Graph()
-        g.bind("owl", owl)
-        g.bind("foaf", foaf)
+        for prefix, namespace in bindings:
+            g.bind(prefix, namespace)
+        for t in triples:
+            g.add(rdflibTriple(*t))
+        return g.serialize(format=rdf_format)
         
+    def serializeCatalogStructure(self, catalog_hierarchy, rdf_format):
+        """Serialize the catalog"""
+        triples, bindings = self.catalogStructureTriples(catalog_hierarchy)
+        return self.render(triples, bindings, rdf_format, nested=False)
+    
+    def catalogStructureTriples(self, catalog_hierarchy):
+        """Triples and namespace bindings of the catalog"""
+        g = []
         selfns = self.base_uri+"/rdf/catalog.rdf#C_"
-        g.bind("self", selfns)
+        bindings = [("owl", owl), ("foaf", foaf), ("self", selfns)]
         lang = mapLanguage(self.catalog.lang)
         if self.lang:
             lang = self.lang
@@ -146,9 +421,9 @@ class Serializer:
             parent_id = catalog_group.parent_id
             parent_idref_tax = None
             if parent_id:
-                parent_idref_tax = URIRef(selfns+parent_id+"-tax")
-            idref_tax = URIRef(selfns+id+"-tax")
-            idref_gen = URIRef(selfns+id+"-gen") # gen has no hierarchy, hence no parent id for gen classes
+                parent_idref_tax = URI(selfns+parent_id+"-tax")
+            idref_tax = URI(selfns+id+"-tax")
+            idref_gen = URI(selfns+id+"-gen") # gen has no hierarchy, hence no parent id for gen classes
             
             # tax
             self.triple(g, idref_tax, RDF.type, OWL.Class)
@@ -158,8 +433,8 @@ class Serializer:
                 label_tax = catalog_group.name+" (Taxonomy Concept: Anything that may be an instance of this category in any context)"
             else:
                 label_tax = "(Taxonomy Concept: Anything that may be an instance of this category in any context)"
-            self.triple(g, idref_tax, RDFS.label, Literal(label_tax), language=lang)
-            self.triple(g, idref_tax, RDFS.comment, Literal(catalog_group.description), language=lang)
+            self.triple(g, idref_tax, RDFS.label, label_tax, language=lang)
+            self.triple(g, idref_tax, RDFS.comment, catalog_group.description, language=lang)
             # media
             self.appendMedia(g, idref_tax, catalog_group)
             
@@ -172,71 +447,70 @@ class Serializer:
                 label_gen = catalog_group.name+" (Generic Concept: This type of goods)"
             else:
                 label_gen = "(Generic Concept: This type of goods)"
-            self.triple(g, idref_gen, RDFS.label, Literal(label_gen), language=lang)
-            self.triple(g, idref_gen, RDFS.comment, Literal(catalog_group.description), language=lang)
+            self.triple(g, idref_gen, RDFS.label, label_gen, language=lang)
+            self.triple(g, idref_gen, RDFS.comment, catalog_group.description, language=lang)
             # media
             self.appendMedia(g, idref_gen, catalog_group)
             
-        return g.serialize(format=rdf_format)
+        return g, bindings
             
     def serializeBusinessEntity(self, be, rdf_format):
         """Serialize a single business entity"""
-        g = Graph()
-        g.bind("owl", owl)
-        g.bind("gr", gr)
-        g.bind("foaf", foaf)
-        g.bind("vcard", vcard)
-        
-        identifier = re.sub(r"[^a-zA-Z0-9]", "", "".join(str(be.legalName).split())) # remove spaces
+        triples, bindings = self.businessEntityTriples(be)
+        return self.render(triples, bindings, rdf_format)
+    
+    def businessEntityTriples(self, be):
+        """Triples and namespace bindings of a single business entity, sets be_about"""
+        g = []
+        identifier = createIdentifier(str(be.legalName)) # remove spaces
         selfns = self.base_uri+"/rdf/company.rdf#"
-        g.bind("self", selfns)
+        bindings = [("owl", owl), ("gr", gr), ("foaf", foaf), ("vcard", vcard), ("self", selfns)]
         lang = mapLanguage(self.catalog.lang) # make de out of deu
         if self.lang: # command line
             lang = self.lang
         
         # graph node uris
-        be_about = URIRef(selfns+"be_"+identifier)
+        be_about = URI(selfns+"be_"+identifier)
         self.be_about = be_about
-        be_address = URIRef(selfns+"address_"+identifier)
+        be_address = URI(selfns+"address_"+identifier)
         
         # annotate graph
         self.triple(g, be_about, RDF.type, GR.BusinessEntity)
-        self.triple(g, be_about, GR.legalName, Literal(be.legalName), language=lang)
-        self.triple(g, be_about, GR.hasGlobalLocationNumber, Literal(be.gln), datatype=XSD.string)
-        self.triple(g, be_about, GR.hasDUNS, Literal(be.duns), datatype=XSD.string)
+        self.triple(g, be_about, GR.legalName, be.legalName, language=lang)
+        self.triple(g, be_about, GR.hasGlobalLocationNumber, be.gln, datatype=XSD.string)
+        self.triple(g, be_about, GR.hasDUNS, be.duns, datatype=XSD.string)
         # vcard
-        self.triple(g, be_about, VCARD.url, URIRef(be.page))
-        self.triple(g, be_about, VCARD.email, Literal(be.email), datatype=XSD.string)
-        self.triple(g, be_about, VCARD.tel, Literal(be.tel))
-        self.triple(g, be_about, VCARD.fax, Literal(be.fax))
-        self.triple(g, be_about, VCARD.fn, Literal(be.legalName), language=lang)
+        self.triple(g, be_about, VCARD.url, URI(be.page))
+        self.triple(g, be_about, VCARD.email, be.email, datatype=XSD.string)
+        self.triple(g, be_about, VCARD.tel, be.tel)
+        self.triple(g, be_about, VCARD.fax, be.fax)
+        self.triple(g, be_about, VCARD.fn, be.legalName, language=lang)
         # address
         if be.street_address or be.postal_box or be.postal_code or be.location or be.region or be.country_name:
             self.triple(g, be_about, VCARD.adr, be_address)
             self.triple(g, be_address, RDF.type, VCARD.Address)
-            self.triple(g, be_address, VCARD['street-address'], Literal(be.street_address), language=lang)
-            self.triple(g, be_address, VCARD['postal-code'], Literal(be.postal_code), datatype=XSD.string)
-            self.triple(g, be_address, VCARD['post-office-box'], Literal(be.postal_box), language=lang)
-            self.triple(g, be_address, VCARD.locality, Literal(be.location), language=lang)
-            self.triple(g, be_address, VCARD.region, Literal(be.region), language=lang)
-            self.triple(g, be_address, VCARD['country-name'], Literal(be.country_name), language=lang)
+            self.triple(g, be_address, VCARD['street-address'], be.street_address, language=lang)
+            self.triple(g, be_address, VCARD['postal-code'], be.postal_code, datatype=XSD.string)
+            self.triple(g, be_address, VCARD['post-office-box'], be.postal_box, language=lang)
+            self.triple(g, be_address, VCARD.locality, be.location, language=lang)
+            self.triple(g, be_address, VCARD.region, be.region, language=lang)
+            self.triple(g, be_address, VCARD['country-name'], be.country_name, language=lang)
         
         # media
         self.appendMedia(g, be_about, be)
     
-        return g.serialize(format=rdf_format)
+        return g, bindings
         
     def serializeOffer(self, offer, rdf_format):
         """Serialize a single offering"""
-        g = Graph()
-        g.bind("owl", owl)
-        g.bind("gr", gr)
-        g.bind("cat", self.base_uri+"/rdf/catalog.rdf#")
-        g.bind("prop", self.base_uri+"/rdf/features.rdf#")
-        g.bind("foaf", foaf)
-        
+        triples, bindings = self.offerTriples(offer)
+        return self.render(triples, bindings, rdf_format)
+    
+    def offerTriples(self, offer):
+        """Triples and namespace bindings of a single offering"""
+        g = []
         selfns = self.base_uri+"/rdf/"+self.offerfile_id+"_"+offer.id+".rdf#"
-        g.bind("self", selfns)
+        bindings = self.offer_bindings+[("self", selfns)]
         manufacturer_id = offer.manufacturer_id
         # use offer id as fallback identifier for manufacturer
         if manufacturer_id == "":
@@ -249,44 +523,44 @@ class Serializer:
         product_url = createProductURI(offer.id, self.pattern)
         
         # graph node uris
-        o_about = URIRef(selfns+"offer")
-        o_taqn = URIRef(selfns+"taqn")
-        o_product = URIRef(selfns+"product")
-        o_model = URIRef(selfns+"model")
-        o_price = URIRef(selfns+"price")
-        o_quantity = URIRef(selfns+"order_quantity")
-        p_quantity = URIRef(selfns+"price_quantity")
-        o_manufacturer = URIRef(selfns+"manufacturer_"+manufacturer_id)
+        o_about = URI(selfns+"offer")
+        o_taqn = URI(selfns+"taqn")
+        o_product = URI(selfns+"product")
+        o_model = URI(selfns+"model")
+        o_price = URI(selfns+"price")
+        o_quantity = URI(selfns+"order_quantity")
+        p_quantity = URI(selfns+"price_quantity")
+        o_manufacturer = URI(selfns+"manufacturer_"+manufacturer_id)
         
         # annotate graph
         if not self.model_only:
             # offer level
             self.triple(g, self.be_about, GR.offers, o_about)
             self.triple(g, o_about, RDF.type, GR.Offering)
-            self.triple(g, o_about, GR.name, Literal(offer.description), language=lang)
-            self.triple(g, o_about, GR.description, Literal(offer.comment), language=lang)
+            self.triple(g, o_about, GR.name, offer.description, language=lang)
+            self.triple(g, o_about, GR.description, offer.comment, language=lang)
             if offer.validFrom:
-                self.triple(g, o_about, GR.validFrom, Literal(convert2datetime(offer.validFrom)), datatype=XSD.dateTime)
+                self.triple(g, o_about, GR.validFrom, convert2datetime(offer.validFrom), datatype=XSD.dateTime)
             else: # global validFrom
-                self.triple(g, o_about, GR.validFrom, Literal(convert2datetime(self.catalog.validFrom)), datatype=XSD.dateTime)
+                self.triple(g, o_about, GR.validFrom, convert2datetime(self.catalog.validFrom), datatype=XSD.dateTime)
             if offer.validThrough:
-                self.triple(g, o_about, GR.validThrough, Literal(convert2datetime(offer.validThrough)), datatype=XSD.dateTime)
+                self.triple(g, o_about, GR.validThrough, convert2datetime(offer.validThrough), datatype=XSD.dateTime)
             else: # global validThrough
-                self.triple(g, o_about, GR.validThrough, Literal(convert2datetime(self.catalog.validThrough)), datatype=XSD.dateTime)
+                self.triple(g, o_about, GR.validThrough, convert2datetime(self.catalog.validThrough), datatype=XSD.dateTime)
             for region in set(offer.eligibleRegions) | set(self.catalog.eligibleRegions):
-                self.triple(g, o_about, GR.eligibleRegions, Literal(region), datatype=XSD.string)
-            self.triple(g, o_about, GR['hasEAN_UCC-13'], Literal(offer.ean), datatype=XSD.string)
-            self.triple(g, o_about, GR['hasGTIN-14'], Literal(offer.gtin), datatype=XSD.string)
-            self.triple(g, o_about, GR.hasMPN, Literal(offer.mpn), datatype=XSD.string)
-            self.triple(g, o_about, GR.condition, Literal(offer.condition))
+                self.triple(g, o_about, GR.eligibleRegions, region, datatype=XSD.string)
+            self.triple(g, o_about, GR['hasEAN_UCC-13'], offer.ean, datatype=XSD.string)
+            self.triple(g, o_about, GR['hasGTIN-14'], offer.gtin, datatype=XSD.string)
+            self.triple(g, o_about, GR.hasMPN, offer.mpn, datatype=XSD.string)
+            self.triple(g, o_about, GR.condition, offer.condition)
             if offer.order_uom and offer.order_units:
                 self.triple(g, o_about, GR.hasEligibleQuantity, o_quantity)
                 self.triple(g, o_quantity, RDF.type, GR.QuantitativeValueFloat)
-                self.triple(g, o_quantity, GR.hasUnitOfMeasurement, Literal(offer.order_uom), datatype=XSD.string)
-                self.triple(g, o_quantity, GR.hasValueFloat, Literal(offer.order_units), datatype=XSD.float)
+                self.triple(g, o_quantity, GR.hasUnitOfMeasurement, offer.order_uom, datatype=XSD.string)
+                self.triple(g, o_quantity, GR.hasValueFloat, offer.order_units, datatype=XSD.float)
             # hasBusinessFunction
             self.triple(g, o_about, GR.hasBusinessFunction, GR.Sell)
-            self.triple(g, o_about, FOAF.page, URIRef(product_url))
+            self.triple(g, o_about, FOAF.page, URI(product_url))
             # pricespecification level
             if offer.price and (offer.currency or self.catalog.currency):
                 self.triple(g, o_about, GR.hasPriceSpecification, o_price)
@@ -294,56 +568,56 @@ class Serializer:
                 if offer.order_uom and offer.price_lower:
                     self.triple(g, o_price, GR.hasEligibleQuantity, p_quantity)
                     self.triple(g, p_quantity, RDF.type, GR.QuantitativeValueFloat)
-                    self.triple(g, p_quantity, GR.hasUnitOfMeasurement, Literal(offer.order_uom), datatype=XSD.string)
-                    self.triple(g, p_quantity, GR.hasMinValueFloat, Literal(offer.price_lower), datatype=XSD.float)
-                self.triple(g, o_price, GR.validFrom, Literal(convert2datetime(offer.validFrom)), datatype=XSD.dateTime)
-                self.triple(g, o_price, GR.validThrough, Literal(convert2datetime(offer.validThrough)), datatype=XSD.dateTime)
-                self.triple(g, o_price, GR.hasUnitOfMeasurement, Literal(offer.order_uom), datatype=XSD.string)
-                self.triple(g, o_price, GR.valueAddedTaxIncluded, Literal(offer.taxes), datatype=XSD.boolean)
+                    self.triple(g, p_quantity, GR.hasUnitOfMeasurement, offer.order_uom, datatype=XSD.string)
+                    self.triple(g, p_quantity, GR.hasMinValueFloat, offer.price_lower, datatype=XSD.float)
+                self.triple(g, o_price, GR.validFrom, convert2datetime(offer.validFrom), datatype=XSD.dateTime)
+                self.triple(g, o_price, GR.validThrough, convert2datetime(offer.validThrough), datatype=XSD.dateTime)
+                self.triple(g, o_price, GR.hasUnitOfMeasurement, offer.order_uom, datatype=XSD.string)
+                self.triple(g, o_price, GR.valueAddedTaxIncluded, offer.taxes, datatype=XSD.boolean)
                 if offer.currency:
-                    self.triple(g, o_price, GR.hasCurrency, Literal(offer.currency), datatype=XSD.string)
+                    self.triple(g, o_price, GR.hasCurrency, offer.currency, datatype=XSD.string)
                 else: # global currency
-                    self.triple(g, o_price, GR.hasCurrency, Literal(self.catalog.currency), datatype=XSD.string)
+                    self.triple(g, o_price, GR.hasCurrency, self.catalog.currency, datatype=XSD.string)
                 if offer.price and offer.price_factor:
-                    self.triple(g, o_price, GR.hasCurrencyValue, Literal(float(offer.price)*float(offer.price_factor)), datatype=XSD.float)
+                    self.triple(g, o_price, GR.hasCurrencyValue, str(float(offer.price)*float(offer.price_factor)), datatype=XSD.float)
             # media
             self.appendMedia(g, o_about, offer)
             # typeandquantitynode level
             self.triple(g, o_about, GR.includesObject, o_taqn)
             self.triple(g, o_taqn, RDF.type, GR.TypeAndQuantityNode)
-            self.triple(g, o_taqn, GR.amountOfThisGood, Literal(offer.content_units), datatype=XSD.float)
-            self.triple(g, o_taqn, GR.hasUnitOfMeasurement, Literal(offer.content_uom), datatype=XSD.string)
+            self.triple(g, o_taqn, GR.amountOfThisGood, offer.content_units, datatype=XSD.float)
+            self.triple(g, o_taqn, GR.hasUnitOfMeasurement, offer.content_uom, datatype=XSD.string)
             # productorservice level
             self.triple(g, o_taqn, GR.typeOfGood, o_product)
             if self.catalog.typeOfProducts == "actual":
                 self.triple(g, o_product, RDF.type, GR.ActualProductOrServiceInstance)
             else:
                 self.triple(g, o_product, RDF.type, GR.ProductOrServicesSomeInstancesPlaceholder)
-            self.triple(g, o_product, GR.name, Literal(offer.description), language=lang)
-            self.triple(g, o_product, GR.description, Literal(offer.comment), language=lang)
-            self.triple(g, o_product, GR['hasEAN_UCC-13'], Literal(offer.ean), datatype=XSD.string)
-            self.triple(g, o_product, GR['hasGTIN-14'], Literal(offer.gtin), datatype=XSD.string)
-            self.triple(g, o_product, GR.hasMPN, Literal(offer.mpn), datatype=XSD.string)
-            self.triple(g, o_product, GR.condition, Literal(offer.condition))
-            self.triple(g, o_product, FOAF.page, URIRef(product_url))
+            self.triple(g, o_product, GR.name, offer.description, language=lang)
+            self.triple(g, o_product, GR.description, offer.comment, language=lang)
+            self.triple(g, o_product, GR['hasEAN_UCC-13'], offer.ean, datatype=XSD.string)
+            self.triple(g, o_product, GR['hasGTIN-14'], offer.gtin, datatype=XSD.string)
+            self.triple(g, o_product, GR.hasMPN, offer.mpn, datatype=XSD.string)
+            self.triple(g, o_product, GR.condition, offer.condition)
+            self.triple(g, o_product, FOAF.page, URI(product_url))
             # media
             self.appendMedia(g, o_product, offer)
             # productmodel level
             self.triple(g, o_product, GR.hasMakeAndModel, o_model)
         self.triple(g, o_model, RDF.type, GR.ProductOrServiceModel)
-        self.triple(g, o_model, GR.name, Literal(offer.description), language=lang)
-        self.triple(g, o_model, GR.description, Literal(offer.comment), language=lang)
-        self.triple(g, o_model, GR['hasEAN_UCC-13'], Literal(offer.ean), datatype=XSD.string)
-        self.triple(g, o_model, GR['hasGTIN-14'], Literal(offer.gtin), datatype=XSD.string)
-        self.triple(g, o_model, GR.hasMPN, Literal(offer.mpn), datatype=XSD.string)
-        self.triple(g, o_model, GR.condition, Literal(offer.condition))
-        self.triple(g, o_model, FOAF.page, URIRef(product_url))
+        self.triple(g, o_model, GR.name, offer.description, language=lang)
+        self.triple(g, o_model, GR.description, offer.comment, language=lang)
+        self.triple(g, o_model, GR['hasEAN_UCC-13'], offer.ean, datatype=XSD.string)
+        self.triple(g, o_model, GR['hasGTIN-14'], offer.gtin, datatype=XSD.string)
+        self.triple(g, o_model, GR.hasMPN, offer.mpn, datatype=XSD.string)
+        self.triple(g, o_model, GR.condition, offer.condition)
+        self.triple(g, o_model, FOAF.page, URI(product_url))
         # media
         self.appendMedia(g, o_model, offer)
         # manufacturer level
         self.triple(g, o_model, GR.hasManufacturer, o_manufacturer)
         self.triple(g, o_manufacturer, RDF.type, GR.BusinessEntity)
-        self.triple(g, o_manufacturer, GR.name, Literal(offer.manufacturer_name))
+        self.triple(g, o_manufacturer, GR.name, offer.manufacturer_name)
         # product feature classes
         for product_feature in offer.product_features:
             system_id = product_feature.reference_feature_system_name
@@ -353,84 +627,84 @@ class Serializer:
             if product_feature.reference_feature_group_name != "":
                 if system_id:
                     category_string = product_feature.reference_feature_group_name+" (%s)" % system_id
-                self.triple(g, o_product, GR.category, Literal(category_string), language=lang)
-                self.triple(g, o_model, GR.category, Literal(category_string), language=lang)
+                self.triple(g, o_product, GR.category, category_string, language=lang)
+                self.triple(g, o_model, GR.category, category_string, language=lang)
             # class uris
             if product_feature.reference_feature_group_id["value"] != "" and product_feature.reference_feature_group_id["type"] == "flat":
                 classURI = getClassURI(system_id, product_feature.reference_feature_group_id)
-                self.triple(g, o_product, RDF.type, URIRef(classURI))
-                self.triple(g, o_model, RDF.type, URIRef(classURI))
+                self.triple(g, o_product, RDF.type, URI(classURI))
+                self.triple(g, o_model, RDF.type, URI(classURI))
             if product_feature.reference_feature_group_id2["value"] != "" and product_feature.reference_feature_group_id2["type"] == "flat":
                 classURI = getClassURI(system_id, product_feature.reference_feature_group_id2)
-                self.triple(g, o_product, RDF.type, URIRef(classURI))
-                self.triple(g, o_model, RDF.type, URIRef(classURI))
+                self.triple(g, o_product, RDF.type, URI(classURI))
+                self.triple(g, o_model, RDF.type, URI(classURI))
             # feature classes
             for feature in product_feature.features:
                 # determine whether qualitative or quantitative
                 qualitative = False
                 if feature.unit == "":
                     qualitative = True
-                fidentifier = re.sub(r"[^a-zA-Z0-9]", "", "".join(feature.name.split()))
-                feature_id = URIRef(selfns+fidentifier)
+                fidentifier = createIdentifier(feature.name)
+                feature_id = URI(selfns+fidentifier)
                 
-                feature_prop_idref = re.sub(r"[^a-zA-Z0-9]", "", "".join(str(system_id+"_"+fidentifier).split()))
                 # try get property from existing reference ontology
                 fref_property = getPropertyURI(system_id, feature.fref)
                 if fref_property:
-                    feature_prop_id = URIRef(fref_property)
+                    feature_prop_id = URI(fref_property)
                 else: # else create a custom property
-                    feature_prop_id = URIRef(self.base_uri+"/rdf/features.rdf#P_"+system_id+"_"+fidentifier)
+                    feature_prop_id = self.feature_properties.get((system_id, fidentifier))
+                    if feature_prop_id == None:
+                        feature_prop_id = URI(self.features_ns+"P_"+system_id+"_"+fidentifier)
+                        self.feature_properties.set((system_id, fidentifier), feature_prop_id)
                     # create suitable object property
-                    self.triple(self.feature_graph, feature_prop_id, RDF.type, OWL.ObjectProperty) # prop_id for external access
-                    if qualitative:
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.label, Literal("Property %s (%s)" % (fidentifier, system_id)), language="en")
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.comment, Literal("\"%s\" property according to \"%s\" classification." % (fidentifier, system_id)), language="en")
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.subPropertyOf, GR.qualitativeProductOrServiceProperty)
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.range, GR.QualitativeValue)
+                    definition = (feature_prop_id, fidentifier, system_id, qualitative)
+                    if self.offer_features != None: # collected in order of first use for the fingerprint store or the parent process
+                        if definition not in self.offer_features:
+                            self.offer_features.append(definition)
                     else:
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.label, Literal("Property %s (%s)" % (fidentifier, system_id)), language="en")
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.comment, Literal("\"%s\" property according to \"%s\" classification." % (fidentifier, system_id)), language="en")
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.subPropertyOf, GR.quantitativeProductOrServiceProperty)
-                        self.triple(self.feature_graph, feature_prop_id, RDFS.range, GR.QuantitativeValueFloat)
-                    self.triple(self.feature_graph, feature_prop_id, RDFS.domain, GR.ProductOrService)
+                        self.features.define(*definition)
                 
                 self.triple(g, o_model, feature_prop_id, feature_id)
                 if qualitative:
                     self.triple(g, feature_id, RDF.type, GR.QualitativeValue)
                 else:
                     self.triple(g, feature_id, RDF.type, GR.QuantitativeValueFloat)
-                    self.triple(g, feature_id, GR.hasUnitOfMeasurement, Literal(feature.unit), datatype=XSD.string)
-                    self.triple(g, feature_id, GR.hasValueFloat, Literal(feature.value), datatype=XSD.float)
+                    self.triple(g, feature_id, GR.hasUnitOfMeasurement, feature.unit, datatype=XSD.string)
+                    self.triple(g, feature_id, GR.hasValueFloat, feature.value, datatype=XSD.float)
                 unit = ""
                 if feature.unit:
                     unit = " "+feature.unit # nicer formatting
-                self.triple(g, feature_id, GR.name, Literal("%s is %s%s" % (feature.name, feature.value, unit)), language="en")
+                self.triple(g, feature_id, GR.name, "%s is %s%s" % (feature.name, feature.value, unit), language="en")
                 if unit:
-                    self.triple(g, feature_id, GR.description, Literal("The product has a \"%s\" of \"%s%s\"." % (feature.name, feature.value, unit)), language="en")
+                    self.triple(g, feature_id, GR.description, "The product has a \"%s\" of \"%s%s\"." % (feature.name, feature.value, unit), language="en")
                 else:
-                    self.triple(g, feature_id, GR.description, Literal("The \"%s\" of the product is \"%s\"." % (feature.name, feature.value)), language="en")
+                    self.triple(g, feature_id, GR.description, "The \"%s\" of the product is \"%s\"." % (feature.name, feature.value), language="en")
         # catalog
         for cataloggroup_id in offer.cataloggroup_ids:
             # make productorservice...instance and productorservicemodel instances of gen classes
+            group_class = self.group_classes.get(cataloggroup_id)
+            if group_class == None:
+                group_class = URI(self.catalog_ns+"C_"+cataloggroup_id+"-gen")
+                self.group_classes.set(cataloggroup_id, group_class)
             if not self.model_only:
-                self.triple(g, o_product, RDF.type, URIRef(self.base_uri+"/rdf/catalog.rdf#C_"+cataloggroup_id+"-gen"))
-            self.triple(g, o_model, RDF.type, URIRef(self.base_uri+"/rdf/catalog.rdf#C_"+cataloggroup_id+"-gen"))
+                self.triple(g, o_product, RDF.type, group_class)
+            self.triple(g, o_model, RDF.type, group_class)
         
-        return g.serialize(format=rdf_format)
+        return g, bindings
     
     def appendMedia(self, g, subject, entity):
         """attach media information to graph"""
         for mime in entity.media:
             if self.image_uri != "ignore" and re.match(r"image", mime.type): # image/png, ...
                 if re.match(r"^http://", mime.source):
-                    self.triple(g, subject, FOAF.depiction, URIRef(mime.source))
+                    self.triple(g, subject, FOAF.depiction, URI(mime.source))
                 elif re.match(r"^http://", self.image_uri):
                     item = mime.source
                     while len(item)>0 and item[0]=="/": # remove leading slashes in item
                         item = item[1:]
-                    self.triple(g, subject, FOAF.depiction, URIRef(self.image_uri+"/"+item))
+                    self.triple(g, subject, FOAF.depiction, URI(self.image_uri+"/"+item))
             else:
                 if(re.match(r"^http://", mime.source)):
-                    self.triple(g, subject, RDFS.seeAlso, URIRef(mime.source))
+                    self.triple(g, subject, RDFS.seeAlso, URI(mime.source))
     
     
\ No newline at end of file
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""sinks.py
+
+Additional dump formats
+
+Every entity (offer, business entity, catalog, feature property) produces its
+triple tuples once; besides the RDF/XML documents and the N-Triples dump they
+go to the sinks selected with --formats, each writing a gzipped dump of its
+own:
+
+turtle   dump/dump.ttl.gz, subjects grouped, well-known namespaces abbreviated
+jsonld   dump/dump.jsonld.gz, expanded JSON-LD, one node object per subject
+nquads   dump/dump.nq.gz, the triples of each document in a named graph
+         that is the URI of the document
+
+A sink renders the triples of an entity to a chunk, which is independent of
+other chunks and may be computed in a worker process, and appends chunks in
+order to its file. Fragment sinks write chunks without header and footer,
+e.g. in the worker processes of splitter.py, and are added to a full sink
+with appendFile().
+"""
+import re
+import json
+import shutil
+
+import ntriples
+from util import memoize
+from ntriples import URI
+
+formats = ["turtle", "jsonld", "nquads"]
+
+prefixes = [("rdf", "http://www.w3.org/1999/02/22-rdf-syntax-ns#"), ("rdfs", "http://www.w3.org/2000/01/rdf-schema#"),
+            ("owl", "http://www.w3.org/2002/07/owl#"), ("xsd", "http://www.w3.org/2001/XMLSchema#"),
+            ("gr", "http://purl.org/goodrelations/v1#"), ("foaf", "http://xmlns.com/foaf/0.1/"),
+            ("vcard", "http://www.w3.org/2006/vcard/ns#")]
+local_name = re.compile(r"[A-Za-z][A-Za-z0-9_]*$")
+
+def unique(triples):
+    """Triple tuples without duplicates, in order"""
+    seen = set()
+    result = []
+    for t in triples:
+        if t not in seen:
+            seen.add(t)
+            result.append(t)
+    return result
+
+def subjects(triples):
+    """Group triple tuples by subject, in order of first appearance"""
+    order = []
+    properties = {}
+    for subject, predicate, object, datatype, language in unique(triples):
+        if subject not in properties:
+            order.append(subject)
+            properties[subject] = []
+        properties[subject].append((predicate, object, datatype, language))
+    return [(subject, properties[subject]) for subject in order]
+
+@memoize()
+def abbreviate(uri):
+    """Prefixed name of uri if its namespace is well-known, else the N-Triples term"""
+    for prefix, namespace in prefixes:
+        if uri.startswith(namespace) and local_name.match(uri, len(namespace)):
+            return prefix+":"+uri[len(namespace):]
+    return ntriples.term(URI(uri))
+
+class Sink:
+    """Gzipped dump in one format"""
+    header = ""
+    footer = ""
+    separator = "" # between non-empty chunks
+    extension = ""
+
+    def __init__(self, file, fragment=False, state=None):
+        """Initialization, file is the opened (gzip) file or None for a sink that only renders chunks
+        
+        state as returned by checkpoint() continues a sink whose file was reopened at its position"""
+        self.file = file
+        self.fragment = fragment
+        self.empty = True # no chunk written yet
+        if state != None:
+            self.empty = state["empty"]
+        elif self.file != None and not self.fragment:
+            self.file.write(self.header)
+
+    def render(self, triples, graph):
+        """Chunk of the triples of one entity, graph is the URI of its document"""
+        raise NotImplementedError
+
+    def append(self, chunk):
+        """Append a rendered chunk"""
+        if not chunk:
+            return
+        if not self.empty:
+            self.file.write(self.separator)
+        self.file.write(chunk)
+        self.empty = False
+
+    def appendFile(self, file):
+        """Append the chunks of a fragment sink read from file"""
+        data = file.read(1<<20)
+        if data:
+            self.append(data)
+            shutil.copyfileobj(file, self.file, 1<<20)
+
+    def checkpoint(self):
+        """Checkpoint the file, return the state to continue from"""
+        return {"position":self.file.checkpoint(), "empty":self.empty}
+
+    def close(self):
+        """Finish and close the file"""
+        if not self.fragment:
+            self.file.write(self.footer)
+        self.file.close()
+
+class TurtleSink(Sink):
+    """Turtle, one block per subject"""
+    header = "".join(["@prefix %s: <%s> .\n" % (prefix, namespace) for prefix, namespace in prefixes])+"\n"
+    extension = "ttl"
+
+    def render(self, triples, graph):
+        blocks = []
+        for subject, properties in subjects(triples):
+            lines = []
+            for predicate, object, datatype, language in properties:
+                if predicate == "http://www.w3.org/1999/02/22-rdf-syntax-ns#type":
+                    p = "a"
+                else:
+                    p = abbreviate(predicate)
+                if isinstance(object, URI):
+                    o = abbreviate(object)
+                elif language == None and datatype != None:
+                    o = ntriples.term(object)+"^^"+abbreviate(datatype)
+                else:
+                    o = ntriples.term(object, None, language)
+                lines.append("%s %s" % (p, o))
+            blocks.append("%s %s .\n" % (ntriples.term(URI(subject)), " ;\n    ".join(lines)))
+        return "".join(blocks)
+
+class JSONLDSink(Sink):
+    """Expanded JSON-LD, a single document with all nodes in @graph"""
+    header = "{\"@graph\": [\n"
+    footer = "\n]}\n"
+    separator = ",\n"
+    extension = "jsonld"
+
+    def render(self, triples, graph):
+        nodes = []
+        for subject, properties in subjects(triples):
+            node = {"@id":subject}
+            for predicate, object, datatype, language in properties:
+                if isinstance(object, URI):
+                    value = {"@id":object}
+                else:
+                    if not isinstance(object, unicode):
+                        object = object.decode("utf-8")
+                    value = {"@value":object}
+                    if language:
+                        value["@language"] = language
+                    elif language == None and datatype != None:
+                        value["@type"] = datatype
+                node.setdefault(predicate, []).append(value)
+            nodes.append(json.dumps(node, sort_keys=True))
+        return ",\n".join(nodes)
+
+class NQuadsSink(Sink):
+    """N-Quads, every document in a named graph of its own"""
+    extension = "nq"
+
+    def render(self, triples, graph):
+        context = " "+ntriples.term(URI(graph))+" .\n"
+        return ntriples.serialize(triples).replace(" .\n", context)
+
+sinks = {"turtle":TurtleSink, "jsonld":JSONLDSink, "nquads":NQuadsSink}
+
+def create(name, file, fragment=False, state=None):
+    """Return a sink by format name"""
+    return sinks[name](file, fragment, state)
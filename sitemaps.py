@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""sitemaps.py
+
+Sharded sitemaps of the output documents
+
+Document URLs are streamed into sitemap shards (sitemap_00000.xml, ...) of
+at most 50,000 URLs each, as the sitemap protocol allows, while the documents
+are written. The dataset entry of the semantic sitemap extension (dump
+location and linked data prefix) goes to sitemap_dataset.xml. At the end,
+sitemap.xml becomes the sitemap index of all shards, each with the latest
+lastmod of its URLs; the dataset gets the latest lastmod of all documents.
+"""
+import os
+import glob
+import datetime
+from xml.sax.saxutils import escape
+
+from util import reopen, sync
+
+max_urls = 50000 # per shard, limit of the sitemap protocol
+
+urlset = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:sc="http://sw.deri.org/2007/07/sitemapextension/scschema.xsd">
+"""
+
+def now():
+    """Current time as W3C datetime"""
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class SitemapWriter:
+    """Streams URLs into sitemap shards and writes the sitemap index"""
+    def __init__(self, folder, base_uri, max_urls=max_urls, state=None):
+        """Initialization, removes the shards of a previous run in folder
+        
+        state as returned by checkpoint() continues the shards of an interrupted run instead"""
+        self.folder = folder
+        self.base_uri = base_uri
+        self.max_urls = max_urls
+        self.sitemaps = [] # (file name, lastmod) of the finished sitemaps
+        self.file = None # current shard
+        self.name = None
+        self.shards = 0
+        self.urls = 0 # in the current shard
+        self.lastmod = None # latest lastmod in the current shard
+        self.label = None # of the dataset entry
+        self.latest = None # latest lastmod of all URLs
+        if state != None:
+            for field in ["sitemaps", "name", "shards", "urls", "lastmod", "label", "latest"]:
+                setattr(self, field, state[field])
+            if self.name != None:
+                self.file = reopen("%s/%s" % (self.folder, self.name), state["position"])
+        keep = [name for name, lastmod in self.sitemaps]+[self.name]
+        for path in glob.glob(folder+"/sitemap_*.xml"):
+            if os.path.basename(path) not in keep:
+                os.remove(path)
+
+    def dataset(self, label):
+        """Add the dataset entry, written at the end with the latest lastmod of all documents"""
+        self.label = label
+
+    def writeDataset(self):
+        """Write the dataset entry"""
+        lastmod = self.latest or now()
+        label = self.label
+        if isinstance(label, unicode):
+            label = label.encode("utf-8")
+        file = open(self.folder+"/sitemap_dataset.xml", "w")
+        file.write(urlset)
+        file.write("""    <sc:dataset>
+        <sc:datasetLabel>%(label)s</sc:datasetLabel>
+        <sc:linkedDataPrefix slicing="subject-object">%(baseuri)s/</sc:linkedDataPrefix>
+        <sc:dataDumpLocation>%(baseuri)s/dump/dump.nt.gz</sc:dataDumpLocation>
+        <lastmod>%(lastmod)s</lastmod>
+        <changefreq>weekly</changefreq>
+    </sc:dataset>
+</urlset>
+""" % {"label":escape(label), "baseuri":escape(self.base_uri), "lastmod":lastmod})
+        file.close()
+        self.sitemaps.insert(0, ("sitemap_dataset.xml", lastmod))
+
+    def add(self, path, lastmod):
+        """Add the URL of a document, path is relative to the base uri"""
+        if self.file == None or self.urls >= self.max_urls:
+            self.next()
+        self.file.write("    <url><loc>%s/%s</loc><lastmod>%s</lastmod></url>\n" % (escape(self.base_uri), escape(path), lastmod))
+        self.urls += 1
+        if lastmod > self.lastmod:
+            self.lastmod = lastmod
+        if lastmod > self.latest:
+            self.latest = lastmod
+
+    def next(self):
+        """Finish the current shard and start the next one"""
+        self.finish()
+        self.name = "sitemap_%05d.xml" % self.shards
+        self.shards += 1
+        self.file = open("%s/%s" % (self.folder, self.name), "w")
+        self.file.write(urlset)
+        self.urls = 0
+        self.lastmod = None
+
+    def finish(self):
+        """Finish the current shard"""
+        if self.file != None:
+            self.file.write("</urlset>\n")
+            self.file.close()
+            self.file = None
+            self.sitemaps.append((self.name, self.lastmod))
+
+    def checkpoint(self):
+        """Sync the current shard, return the state to continue from"""
+        state = {"sitemaps":list(self.sitemaps), "name":self.name, "shards":self.shards, "urls":self.urls, "lastmod":self.lastmod,
+                 "label":self.label, "latest":self.latest, "position":None}
+        if self.file != None:
+            state["position"] = sync(self.file)
+        return state
+
+    def close(self):
+        """Finish the last shard and write the dataset entry and the sitemap index"""
+        self.finish()
+        if self.label != None:
+            self.writeDataset()
+        file = open(self.folder+"/sitemap.xml", "w")
+        file.write("""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+""")
+        for name, lastmod in self.sitemaps:
+            file.write("    <sitemap><loc>%s/%s</loc><lastmod>%s</lastmod></sitemap>\n" % (escape(self.base_uri), name, lastmod))
+        file.write("</sitemapindex>\n")
+        file.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""sources.py
+
+Streaming input of compressed and piped BMEcat files
+
+Besides plain XML files, the input can be compressed with gzip, bzip2 or
+zip (the first .xml member, else the first member), or "-" for stdin, plain
+or compressed with gzip or bzip2. The compression is detected by the magic
+bytes of the input. Compressed and piped inputs are read and decompressed on
+a thread of their own (zlib and bz2 release the interpreter lock) that feeds
+the parser through a bounded queue of blocks, so decompression and parsing
+overlap without an uncompressed copy on disk.
+
+Such streams cannot seek: stdin can only be read once, and modes that need
+byte offsets of the input file (--split, --prescan, --checkpoint) need a
+plain file.
+"""
+import sys
+import bz2
+import zlib
+import time
+import Queue
+import zipfile
+import threading
+
+import metrics
+
+block_size = 1<<16 # of compressed data read at a time
+queue_blocks = 64 # decompressed blocks waiting for the parser
+
+magic = [("\x1f\x8b", "gzip"), ("BZh", "bzip2"), ("PK\x03\x04", "zip")]
+
+def compression(header):
+    """Compression of data starting with header, None for plain data"""
+    for prefix, name in magic:
+        if header.startswith(prefix):
+            return name
+    return None
+
+def seekable(path):
+    """True if path is a plain file the parser can read directly"""
+    if path == "-":
+        return False
+    file = open(path, "rb")
+    header = file.read(4)
+    file.close()
+    return compression(header) == None
+
+def chunks(file, first=""):
+    """Blocks read from file, after first"""
+    if first:
+        yield first
+    while True:
+        data = file.read(block_size)
+        if not data:
+            return
+        yield data
+
+def inflate(blocks, create):
+    """Decompress blocks of concatenated compressed streams, create returns a decompressor for the next one"""
+    decompressor = create()
+    for data in blocks:
+        while data:
+            try:
+                output = decompressor.decompress(data)
+            except EOFError: # bz2 decompressor past the end of its stream
+                decompressor = create()
+                continue
+            if output:
+                yield output
+            data = decompressor.unused_data # start of the next stream
+            if data:
+                decompressor = create()
+
+def decompress(file, name, first=""):
+    """Decompressed blocks of file, whose compression is name, after its first bytes first"""
+    if name == "gzip":
+        return inflate(chunks(file, first), lambda: zlib.decompressobj(16+zlib.MAX_WBITS))
+    elif name == "bzip2":
+        return inflate(chunks(file, first), bz2.BZ2Decompressor)
+    elif name == "zip":
+        raise IOError("zip archives can only be read from files")
+    return chunks(file, first)
+
+def member(archive):
+    """Name of the member of a zip archive holding the catalog"""
+    names = [info.filename for info in archive.infolist() if not info.filename.endswith("/")]
+    for name in names:
+        if name.lower().endswith(".xml"):
+            return name
+    if not names:
+        raise IOError("empty zip archive")
+    return names[0]
+
+class PipeReader:
+    """Read-only file-like stream of blocks produced on a thread"""
+    def __init__(self, produce):
+        """Initialization, starts a thread putting the blocks of the iterable produce() returns into the queue"""
+        self.queue = Queue.Queue(queue_blocks)
+        self.block = "" # current block
+        self.position = 0 # in the current block
+        self.done = False
+        self.stopped = False # set by close(), the thread stops producing
+        self.error = None # exc_info of the thread
+        self.thread = threading.Thread(target=self.run, args=(produce,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, produce):
+        """Queue the blocks until the end or close(), None marks the end"""
+        blocks = None
+        try:
+            blocks = produce()
+            for block in blocks:
+                if self.stopped:
+                    break
+                self.queue.put(block)
+        except Exception:
+            self.error = sys.exc_info()
+        if blocks != None:
+            blocks.close() # releases the input files of the generator
+        self.queue.put(None)
+
+    def next(self):
+        """Make the next block current, False at the end"""
+        if metrics.enabled and self.queue.empty():
+            now = time.time()
+            block = self.queue.get()
+            metrics.record("input.wait", time.time()-now)
+        else:
+            block = self.queue.get()
+        if block == None:
+            self.done = True
+            if self.error != None:
+                raise self.error[0], self.error[1], self.error[2]
+            return False
+        self.block = block
+        self.position = 0
+        return True
+
+    def read(self, size=-1):
+        """Read up to size bytes, everything if size is negative"""
+        if size < 0:
+            size = 1<<62
+        pieces = []
+        while size > 0:
+            if self.position >= len(self.block) and (self.done or not self.next()):
+                break
+            piece = self.block[self.position:self.position+size]
+            self.position += len(piece)
+            size -= len(piece)
+            pieces.append(piece)
+        return "".join(pieces)
+
+    def close(self):
+        """Stop reading, wait until the thread has released the input"""
+        self.stopped = True
+        self.done = True
+        self.block = ""
+        while self.thread.is_alive(): # unblock a put into the full queue
+            try:
+                self.queue.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+        self.thread.join()
+
+def openInput(path):
+    """Open the BMEcat input at path, "-" for stdin, as a stream"""
+    if path == "-":
+        def produce():
+            first = sys.stdin.read(4)
+            return decompress(sys.stdin, compression(first), first)
+        return PipeReader(produce)
+    file = open(path, "rb")
+    name = compression(file.read(4))
+    file.seek(0)
+    if name == None:
+        return file
+    if name == "zip":
+        file.close()
+        def produce():
+            archive = zipfile.ZipFile(path)
+            try:
+                stream = archive.open(member(archive))
+                try:
+                    for block in chunks(stream):
+                        yield block
+                finally:
+                    stream.close()
+            finally:
+                archive.close()
+        return PipeReader(produce)
+    def produce():
+        try:
+            for block in decompress(file, name):
+                yield block
+        finally:
+            file.close()
+    return PipeReader(produce)
@@ -10,88 +10,145 @@ Copyright (c) 2011 Universitaet der Bundeswehr. All rights reserved.
 
 Author: Alex Stolz
 Organization: E-Business and Web Science Research Group
+
+The classes are generated from the parsed catalog hierarchy with the triples
+of catalog.rdf, group by group, in depth-first order of a parent/child index,
+and streamed through the template. With pagination, catalog.html lists the
+top-level groups and every top-level group gets a page catalog_<n>.html.
 """
-from rdflib import *
 from jinja2 import *
 import os
+import glob
 import codecs
 
-FOAF = Namespace("http://xmlns.com/foaf/0.1/")
-
-def get_isSubElementOf(g, e, t):
-    """Get a list of all superelement URIs of a given element"""
-    e = URIRef(e)
-    se = g.value(e, t)
-    se_list = []
-    
-    if type(se) is not URIRef: # subElementof is a collection
-        for se_outer_element in g.objects(e, t): # get OWL:Class
-            if type(se_outer_element) is BNode:
-                for se_collection in g.objects(se_outer_element, OWL.unionOf):
-                    superElements = list(g.items(se_collection))
-                    for s in superElements:
-                        s_uri = str(s)
-                        se_list.append(s_uri)
-        se = se_list
-    else: # subelementof is no collection, but a sequence of "rdfs:subClassOf rdf:resource=..."
-        for i in g.objects(e, t): # get all superElements of e
-            if type(i) is URIRef:
-                i_uri = str(i)
-                se_list.append(i_uri)
-        se = se_list
-    
-    return se
-
-def pretty_list(l):
-    """Bring the passed list to a suitable format and return the formatted string with anchor links"""
+owl = "http://www.w3.org/2002/07/owl#"
+rdfs = "http://www.w3.org/2000/01/rdf-schema#"
+foaf_depiction = "http://xmlns.com/foaf/0.1/depiction"
+gr = "http://purl.org/goodrelations/v1#"
+
+def text(value):
+    """Unicode of a parsed (utf-8) string"""
+    if isinstance(value, str):
+        return value.decode("utf-8")
+    return value
+
+def hierarchy(catalog_hierarchy):
+    """Top-level groups and the index parent id -> child groups, groups with unknown parents are top-level"""
+    ids = set([group.id for group in catalog_hierarchy if group.id])
+    roots = []
+    children = {}
+    for group in catalog_hierarchy:
+        if not group.id:
+            continue
+        if group.parent_id and group.parent_id in ids and group.parent_id != group.id:
+            children.setdefault(group.parent_id, []).append(group)
+        else:
+            roots.append(group)
+    return roots, children
+
+def subtree(root, children, visited):
+    """Groups below and including root in depth-first order, each group once"""
+    groups = []
+    stack = [root]
+    while stack:
+        group = stack.pop()
+        if group.id in visited:
+            continue
+        visited.add(group.id)
+        groups.append(group)
+        stack.extend(reversed(children.get(group.id, [])))
+    return groups
+
+def trees(catalog_hierarchy):
+    """Top-level groups with the groups of their subtrees, groups in parent cycles form trees of their own"""
+    roots, children = hierarchy(catalog_hierarchy)
+    visited = set()
+    result = []
+    for root in roots+catalog_hierarchy:
+        if root.id and root.id not in visited:
+            result.append((root, subtree(root, children, visited)))
+    return result
+
+def pretty_list(l, page_of=None):
+    """Bring the passed list to a suitable format and return the formatted string with anchor links
+
+    page_of maps a class fragment to the page holding it, for links across pages"""
     pretty_format = ""
     if type(l) is list:
         l.sort() # sort the list alphabetically
         for item in l:
             # navigation in html document, if VOCAB ontology base uri is found
             item_idf = item
-            if not "http://purl.org/goodrelations/v1#" in item:
+            href = item
+            if not gr in item:
                 item_idf = item[item.find("#"):]
-            pretty_format += " <a href=\"%s\">%s</a>" % (item_idf, item_idf)
+                href = item_idf
+                if page_of != None:
+                    href = page_of.get(item_idf[1:], "")+item_idf
+            pretty_format += " <a href=\"%s\">%s</a>" % (href, item_idf)
     return pretty_format
 
-def create_html(output_dir):
-    """Create HTML representation for product classification, if available"""
-    
-    if not os.path.exists("%s/rdf/catalog.rdf" % output_dir):
+def classes(groups, serializer, page_of=None):
+    """Template entries of the -tax and -gen classes of groups"""
+    for group in groups:
+        triples, bindings = serializer.catalogStructureTriples([group])
+        entries = {} # subject -> entry, in order of the subjects
+        order = []
+        for subject, predicate, object, datatype, language in triples:
+            entry = entries.get(subject)
+            if entry == None:
+                entry = entries[subject] = {"uri":subject, "idf":subject[subject.find("#")+1:], "label":None, "comment":None, "depiction":"", "subclassof":[]}
+                order.append(entry)
+            if predicate == rdfs+"label":
+                entry["label"] = text(object)
+            elif predicate == rdfs+"comment":
+                entry["comment"] = text(object)
+            elif predicate == rdfs+"subClassOf":
+                entry["subclassof"].append(str(object))
+            elif predicate == foaf_depiction and not entry["depiction"]:
+                entry["depiction"] = """<img src="%s" alt="" />""" % object
+        for entry in order:
+            label = entry["label"] or u""
+            entry.update({"title":label[:label.find("(")].strip(), "type_url":owl+"Class", "type":"owl:Class",
+                          "rdfs_subclassof":rdfs+"subClassOf", "rdfs_comment":rdfs+"comment", "rdfs_label":rdfs+"label",
+                          "subclassof":pretty_list(entry["subclassof"], page_of)})
+            yield entry
+
+def write(template, path, context):
+    """Stream the rendered template to path"""
+    html = codecs.open(path, mode="w", encoding="utf-8")
+    for chunk in template.generate(context):
+        html.write(chunk)
+    html.close()
+
+def create_html(output_dir, catalog_hierarchy, serializer, paginate=False):
+    """Create HTML representation for product classification, if available
+
+    serializer provides the triples of catalog.rdf, paginate=True writes a page per top-level group"""
+
+    if not catalog_hierarchy or not os.path.exists("%s/rdf/catalog.rdf" % output_dir):
         return
-    
+
     print "found proprietary catalog structure - create html representation thereof"
-    
-    catalog_file = "%s/rdf/catalog.rdf" % output_dir
-    
-    html = codecs.open("%s/rdf/catalog.html" % output_dir, mode="w", encoding="utf-8")
-    
-    loader = FileSystemLoader(".")
+
+    loader = FileSystemLoader(os.path.dirname(os.path.abspath(__file__)))
     env = Environment(loader=loader)
     template_classes = env.get_template("catalog.tmpl.html")
-    
-    g = ConjunctiveGraph()
-    g.parse(catalog_file, format="xml")
-    classes = []
-    
-    for c in g.subjects(RDF.type, OWL.Class):
-        if type(c) is URIRef:
-            uri = str(c)
-            idf = uri[uri.find("#")+1:]
-            label = g.value(c, RDFS.label)
-            title = label[:label.find("(")].strip()
-            comment = g.value(c, RDFS.comment)
-            subclassof = get_isSubElementOf(g, c, RDFS.subClassOf)
-            depiction = g.value(c, FOAF.depiction)
-
-            if depiction:
-                depiction = """<img src="%(depiction)s" alt="" />""" % ({"depiction":depiction, "label":label})
-            else:
-                depiction = ""
-            classes.append({"idf":idf, "title":title, "label":label, "type_url":OWL.Class, "type":"owl:Class", "uri":uri, "depiction":depiction,
-              "rdfs_subclassof":RDFS.subClassOf, "rdfs_comment":RDFS.comment, "rdfs_label":RDFS.label, "comment":comment, "subclassof":pretty_list(subclassof)})
-                
-    html.write(template_classes.render({"classes":classes}))
-    
 
+    for path in glob.glob("%s/rdf/catalog_*.html" % output_dir): # pages of a previous run
+        os.remove(path)
+    groups = trees(catalog_hierarchy)
+    if not paginate:
+        write(template_classes, "%s/rdf/catalog.html" % output_dir, {"classes":classes([group for root, tree in groups for group in tree], serializer)})
+        return
+
+    page_of = {} # class fragment -> page
+    pages = []
+    for number, (root, tree) in enumerate(groups):
+        page = "catalog_%05d.html" % number
+        pages.append({"href":page, "title":text(root.name) or root.id})
+        for group in tree:
+            page_of["C_"+group.id+"-tax"] = page_of["C_"+group.id+"-gen"] = page
+    for page, (root, tree) in zip(pages, groups):
+        write(template_classes, "%s/rdf/%s" % (output_dir, page["href"]), {"classes":classes(tree, serializer, page_of), "index":"catalog.html"})
+    write(template_classes, "%s/rdf/catalog.html" % output_dir, {"classes":[], "pages":pages})
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""splitter.py
+
+Parses the offers of one BMEcat file on several processes
+
+The input is scanned for the byte offsets of <ARTICLE>/<PRODUCT> elements,
+which BMEcat keeps in one contiguous sequence. The parent parses everything
+around that sequence (header, catalog groups, supplier and the article to
+catalog group mappings) and cuts the sequence into byte ranges at article
+boundaries. Every range becomes a small document of its own - the original
+prolog and start tags of the enclosing elements, the range, the matching end
+tags - that a worker process parses for offers with the header context and
+mappings of the parent. Workers write the offer documents (or pack files of
+their own), the N-Triples of their range and fragments of the additional
+dump formats; the parent merges dumps, packs and feature properties range by
+range, so the result equals a serial run.
+
+Start tags are found by a plain byte scan, so the input must not contain
+"<ARTICLE" or "<PRODUCT" inside comments or CDATA sections between the
+articles.
+"""
+import os
+import re
+import time
+import shutil
+import tempfile
+import collections
+import multiprocessing
+import xml.parsers.expat
+
+import parser
+import packs
+import serializer
+import sinks
+import writebehind
+import metrics
+
+start_tag = re.compile(r"<(?:ARTICLE|PRODUCT)[\s/>]")
+end_tag = re.compile(r"</(?:ARTICLE|PRODUCT)\s*>")
+overlap = 64 # bytes read beyond a block so that tags on block borders are found
+
+class SegmentStream:
+    """Read-only file-like concatenation of byte ranges of a file and of strings"""
+    def __init__(self, path, segments):
+        """Initialization, segments are (start, end) byte ranges of the file at path or strings"""
+        self.file = open(path, "rb")
+        self.segments = collections.deque(segments)
+
+    def read(self, size=-1):
+        """Read up to size bytes, everything if size is negative"""
+        if size < 0:
+            size = 1<<62
+        chunks = []
+        while size > 0 and self.segments:
+            segment = self.segments[0]
+            if isinstance(segment, str):
+                data = segment[:size]
+                if len(data) < len(segment):
+                    self.segments[0] = segment[size:]
+                else:
+                    self.segments.popleft()
+            else:
+                start, end = segment
+                self.file.seek(start)
+                data = self.file.read(min(size, end-start))
+                if not data or start+len(data) >= end:
+                    self.segments.popleft()
+                else:
+                    self.segments[0] = (start+len(data), end)
+            chunks.append(data)
+            size -= len(data)
+        return "".join(chunks)
+
+    def close(self):
+        """Close the file"""
+        self.file.close()
+
+class Layout:
+    """Position of the article sequence within a BMEcat file"""
+    def __init__(self, path, block_size=1<<20):
+        """Initialization, scans the file"""
+        self.path = path
+        self.block_size = block_size
+        self.size = os.path.getsize(path)
+        self.file = open(path, "rb")
+        self.first = self.search(start_tag, 0, self.size) # start of the first article
+        self.last = None # end of the last article
+        self.prolog = "" # everything in front of the root element and the start tags enclosing the articles
+        self.epilog = "" # end tags of the enclosing elements
+        if self.first != None:
+            self.last = self.searchLast(end_tag, self.size)
+            self.scanAncestors()
+
+    def search(self, pattern, offset, limit):
+        """Offset of the first match of pattern starting in [offset, limit), None if there is none"""
+        while offset < limit:
+            self.file.seek(offset)
+            match = pattern.search(self.file.read(self.block_size+overlap))
+            if match and offset+match.start() < min(offset+self.block_size, limit):
+                return offset+match.start()
+            offset += self.block_size
+        return None
+
+    def searchLast(self, pattern, limit):
+        """End offset of the last match of pattern, None if there is none"""
+        end = limit
+        while end > 0:
+            start = max(0, end-self.block_size)
+            self.file.seek(start)
+            last = None
+            for match in pattern.finditer(self.file.read(min(end+overlap, limit)-start)):
+                if match.start() < end-start:
+                    last = match
+            if last:
+                return start+last.end()
+            end = start
+        return None
+
+    def skip(self, offset, count):
+        """Offset of the article start count articles after the one starting at offset, the end of the articles if there are fewer"""
+        if count == 0:
+            return offset
+        position = offset+1
+        while count > 0 and position < self.last:
+            self.file.seek(position)
+            data = self.file.read(self.block_size+overlap)
+            for match in start_tag.finditer(data):
+                if match.start() >= self.block_size or position+match.start() >= self.last:
+                    break
+                count -= 1
+                if count == 0:
+                    return position+match.start()
+            position += self.block_size
+        return self.last
+
+    def scanAncestors(self):
+        """Determine prolog and epilog from the elements that are open where the first article starts"""
+        scanner = xml.parsers.expat.ParserCreate()
+        offsets = [] # of the start tags of open elements
+        root = [None]
+        def startElement(name, attrs):
+            if root[0] == None:
+                root[0] = scanner.CurrentByteIndex
+            offsets.append(scanner.CurrentByteIndex)
+        def endElement(name):
+            offsets.pop()
+        scanner.StartElementHandler = startElement
+        scanner.EndElementHandler = endElement
+        self.file.seek(0)
+        remaining = self.first
+        while remaining > 0:
+            data = self.file.read(min(self.block_size, remaining))
+            remaining -= len(data)
+            scanner.Parse(data, False)
+        self.file.seek(0)
+        prolog = [self.file.read(root[0])]
+        epilog = []
+        for offset in offsets:
+            tag = self.startTag(offset)
+            prolog.append(tag)
+            epilog.insert(0, "</%s>" % re.match(r"<([^\s/>]+)", tag).group(1))
+        self.prolog = "".join(prolog)
+        self.epilog = "".join(epilog)
+
+    def startTag(self, offset):
+        """Raw start tag at offset"""
+        self.file.seek(offset)
+        data = self.file.read(overlap)
+        quote = None
+        position = 1
+        while True:
+            if position >= len(data):
+                data += self.file.read(self.block_size)
+            c = data[position]
+            if quote != None:
+                if c == quote:
+                    quote = None
+            elif c in "\"'":
+                quote = c
+            elif c == ">":
+                return data[:position+1]
+            position += 1
+
+    def header(self):
+        """Stream of the file without the articles"""
+        return SegmentStream(self.path, [(0, self.first), (self.last, self.size)])
+
+    def ranges(self, count):
+        """Cut the articles into up to count byte ranges of similar size at article boundaries"""
+        boundaries = [self.first]
+        for number in range(1, count):
+            boundary = self.search(start_tag, max(boundaries[-1]+1, self.first+(self.last-self.first)*number/count), self.last)
+            if boundary == None:
+                break
+            boundaries.append(boundary)
+        boundaries.append(self.last)
+        return zip(boundaries[:-1], boundaries[1:])
+
+    def document(self, start, end):
+        """Stream of a well-formed document containing the articles of a byte range"""
+        return SegmentStream(self.path, [self.prolog, (start, end), self.epilog])
+
+    def close(self):
+        """Close the file, the layout stays usable for document streams"""
+        self.file.close()
+        self.file = None
+
+class RangeSerializer(serializer.Serializer):
+    """Worker-side serializer writing the offers of a byte range"""
+    def store(self, object, object_type):
+        """Write the offer document, append its N-Triples to the range file and collect new feature properties"""
+        if object_type != "offer":
+            return
+        metrics.count("offers")
+        if metrics.enabled:
+            now = time.time()
+            metrics.count("features", sum([len(product_feature.features) for product_feature in object.product_features]))
+        self.offer_features = []
+        nt, chunks = self.storeOffer(object)
+        self.names.append(self.documentName(object))
+        self.nt.write(nt)
+        self.appendChunks(chunks)
+        for definition in self.offer_features:
+            if definition not in self.seen:
+                self.seen.add(definition)
+                self.definitions.append(definition)
+        self.offer_features = None
+        if metrics.enabled:
+            metrics.observe("latency.offer", time.time()-now)
+
+worker = None # (layout, parser) of a worker process
+
+def initWorker(settings, be_about, mapping, engine, reuse, layout, folder):
+    """Set up serializer and parser of a worker process"""
+    global worker
+    range_serializer = RangeSerializer(worker=True, **settings)
+    range_serializer.be_about = be_about
+    range_serializer.seen = set() # feature property definitions already handed back by this worker
+    range_serializer.folder = folder
+    range_parser = parser.Parser(range_serializer, engine, reuse=reuse)
+    range_parser.article2categorygroup = mapping.reader()
+    range_parser.verbose = False
+    worker = (layout, range_parser)
+    metrics.collect() # drop metrics inherited from the parent
+
+def rangePath(folder, number, extension):
+    """Path of the output of a range in one dump format"""
+    return "%s/range_%05d.%s" % (folder, number, extension)
+
+def convertRange(task):
+    """Parse the offers of a byte range, return the range number, the feature property definitions it introduced, the document names,
+    failed document writes and metrics"""
+    number, start, end = task
+    layout, range_parser = worker
+    range_serializer = range_parser.serializer
+    range_serializer.nt = open(rangePath(range_serializer.folder, number, "nt"), "wb")
+    range_serializer.definitions = []
+    range_serializer.names = [] # of the offer documents, for the sitemap
+    range_serializer.sinks = [sinks.create(format, open(rangePath(range_serializer.folder, number, sinks.sinks[format].extension), "wb"), fragment=True)
+                              for format in range_serializer.formats]
+    if range_serializer.pack:
+        range_serializer.packer = packs.PackWriter(range_serializer.folder, "range_%05d" % number)
+    elif range_serializer.write_threads > 0:
+        range_serializer.writer = writebehind.DocumentWriter(range_serializer.write_threads, range_serializer.write_queue, range_serializer.fsync)
+    stream = layout.document(start, end)
+    range_parser.parse(stream, "offer")
+    stream.close()
+    range_serializer.nt.close()
+    for sink in range_serializer.sinks:
+        sink.close()
+    if range_serializer.packer != None:
+        range_serializer.packer.close()
+        range_serializer.packer = None
+    errors = []
+    if range_serializer.writer != None:
+        errors = range_serializer.writer.finish()
+        range_serializer.writer = None
+    state = None
+    if metrics.enabled:
+        state = metrics.collect()
+    return number, range_serializer.definitions, range_serializer.names, errors, state
+
+def merge(output, folder, number, definitions, names, errors, state):
+    """Append the output of a range to the output of the parent serializer"""
+    metrics.merge(state)
+    output.write_errors.extend(errors)
+    path = rangePath(folder, number, "nt")
+    nt = open(path, "rb")
+    shutil.copyfileobj(nt, output.dump, 1<<20)
+    nt.close()
+    os.remove(path)
+    for sink in output.sinks:
+        path = rangePath(folder, number, sink.extension)
+        fragment = open(path, "rb")
+        sink.appendFile(fragment)
+        fragment.close()
+        os.remove(path)
+    for definition in definitions:
+        output.features.define(*definition)
+    for name in names:
+        output.sitemap.add("rdf/"+name, output.lastmod)
+    if output.packer != None:
+        reader = packs.PackReader(folder, "range_%05d" % number)
+        for document_name in reader.names():
+            output.packer.add(document_name, reader.get(document_name))
+        reader.remove()
+
+def convert(bmecat_parser, path, processes, ranges_per_process=4):
+    """Parse path with the offers split across processes, False if it has to be parsed serially"""
+    output = bmecat_parser.serializer
+    if output.incremental:
+        print "NOTE: incremental runs are not split, parsing serially"
+        return False
+    layout = Layout(path)
+    if layout.first == None or layout.last == None or layout.last < layout.first:
+        layout.close()
+        print "NOTE: no articles found to split, parsing serially"
+        return False
+    ranges = layout.ranges(processes*ranges_per_process)
+    layout.close() # workers open streams of their own
+    if bmecat_parser.index != None: # cuts out the articles and whatever else a pass does not need
+        bmecat_parser.parse(path, search="cataloggroup")
+        bmecat_parser.parse(path, search="be")
+    else:
+        bmecat_parser.parse(layout.header(), search="cataloggroup")
+        bmecat_parser.parse(layout.header(), search="be")
+    mapping = bmecat_parser.article2categorygroup
+    mapping.finish()
+
+    folder = tempfile.mkdtemp(dir=output.output_folder or None)
+    now = time.time()
+    print "start parsing offer in %d ranges on %d processes" % (len(ranges), processes)
+    pool = multiprocessing.Pool(processes, initWorker, (output.settings(), output.be_about, mapping, bmecat_parser.engine, bmecat_parser.reuse, layout, folder))
+    tasks = [(number, start, end) for number, (start, end) in enumerate(ranges)]
+    for number, definitions, names, errors, state in pool.imap(convertRange, tasks): # in order of the ranges
+        merge(output, folder, number, definitions, names, errors, state)
+    pool.close()
+    pool.join()
+    os.rmdir(folder)
+    metrics.record("parse.offer", time.time()-now)
+    print "finished with offer after %s seconds" % str(time.time()-now)
+    return True
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""writebehind.py
+
+Write-behind queue for document files
+
+Offer documents are put into a bounded queue and written and closed by a
+few threads while the parser keeps going; put() blocks while the queue is
+full, so at most queue_size documents are held in memory. Every thread takes
+up to batch_size documents from the queue at a time. Failed writes do not
+stop the run, they are collected and raised by close() at its end.
+
+fsync policies:
+none   leave flushing to the operating system
+file   sync every file before closing it, and the folders of all written
+       files at the end
+"""
+import os
+import time
+import Queue
+import threading
+
+import metrics
+
+policies = ["none", "file"]
+
+def writeFile(path, data, fsync="none"):
+    """Write data to a new file at path and close it"""
+    file = open(path, "w")
+    try:
+        file.write(data)
+        if fsync == "file":
+            file.flush()
+            os.fsync(file.fileno())
+    finally:
+        file.close()
+
+def describe(errors):
+    """Summary of failed writes, a list of (path, error)"""
+    path, error = errors[0]
+    return "%d document writes failed, the first one of %s: %s" % (len(errors), path, error)
+
+def syncFolder(path):
+    """Sync the entries of a folder to disk"""
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+class DocumentWriter:
+    """Writes files on background threads"""
+    def __init__(self, threads=4, queue_size=256, fsync="none", batch_size=32):
+        """Initialization, starts the threads"""
+        self.queue = Queue.Queue(queue_size)
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.errors = [] # (path, exception) of failed writes
+        self.folders = set() # of the written files
+        self.threads = []
+        for number in range(threads):
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, path, data):
+        """Queue data to be written to path, waits while the queue is full"""
+        self.folders.add(os.path.dirname(path))
+        if metrics.enabled and self.queue.full():
+            now = time.time()
+            self.queue.put((path, data))
+            metrics.record("write.queue.wait", time.time()-now)
+        else:
+            self.queue.put((path, data))
+
+    def run(self):
+        """Write queued files until the end marker None"""
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] != None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            for item in batch:
+                if item == None:
+                    self.queue.task_done()
+                    return
+                path, data = item
+                try:
+                    writeFile(path, data, self.fsync)
+                except Exception, e: # recorded for close(), the thread has to keep serving the queue
+                    self.errors.append((path, e))
+                finally:
+                    self.queue.task_done()
+
+    def drain(self):
+        """Wait until all queued files are written"""
+        self.queue.join()
+
+    def finish(self):
+        """Wait until all queued files are written, return the failed writes"""
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.fsync == "file":
+            for folder in self.folders:
+                try:
+                    syncFolder(folder)
+                except (IOError, OSError), e:
+                    self.errors.append((folder, e))
+        return self.errors
+
+    def close(self):
+        """Wait until all queued files are written, raise IOError if writes failed"""
+        errors = self.finish()
+        if errors:
+            raise IOError(describe(errors))